@@ -0,0 +1,123 @@
+"""Compare the settrace and sys.monitoring tracer backends.
+
+For test.py and a CPU-heavy loop, measures the native run time, the time
+to run to a breakpoint on the last line after 'continue' (profiler
+counters stay on), and lock-step stepping throughput.
+
+    python benchmarks/bench_backends.py
+"""
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.debugger import WebDebugger
+from src.fastpath import MONITORING_AVAILABLE
+
+CPU_LOOP = """
+def work(n):
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+results = []
+for k in range(40):
+    results.append(work(25000))
+done = len(results)
+"""
+
+STEPS = 500
+
+
+def _load_programs():
+    with open(os.path.join(ROOT, 'test.py')) as f:
+        test_py = f.read()
+    return {'test.py': test_py, 'cpu loop': CPU_LOOP}
+
+
+def _last_line(source):
+    lines = source.rstrip().splitlines()
+    return len(lines)
+
+
+def _start(source, backend):
+    debugger = WebDebugger(backend=backend)
+    debugger.sources.register('<string>', source)
+    code = compile(source, '<string>', 'exec')
+    debugger.set_running(True)
+
+    def target():
+        debugger.setup_io()
+        try:
+            debugger.run(code, {'__name__': '__main__'})
+        finally:
+            debugger.restore_io()
+            debugger.set_running(False)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    debugger.wait_for_pause()
+    return debugger, thread
+
+
+def bench_native(source):
+    code = compile(source, '<string>', 'exec')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.perf_counter()
+        exec(code, {'__name__': '__main__'})
+        return time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def bench_continue(source, backend):
+    debugger, thread = _start(source, backend)
+    debugger.set_break('<string>', _last_line(source))
+    start = time.perf_counter()
+    debugger.post_command('continue')
+    debugger.wait_for_pause()
+    elapsed = time.perf_counter() - start
+    debugger.post_command('quit')
+    thread.join()
+    return elapsed
+
+
+def bench_step(source, backend):
+    debugger, thread = _start(source, backend)
+    start = time.perf_counter()
+    steps = 0
+    while steps < STEPS and debugger.is_running:
+        debugger.post_command('step')
+        debugger.wait_for_pause()
+        steps += 1
+    elapsed = time.perf_counter() - start
+    debugger.post_command('quit')
+    thread.join()
+    return steps / elapsed
+
+
+def main():
+    backends = ['settrace']
+    if MONITORING_AVAILABLE:
+        backends.append('monitoring')
+    else:
+        print("sys.monitoring unavailable (Python < 3.12): benchmarking settrace only")
+
+    for name, source in _load_programs().items():
+        print(f"{name}: native {bench_native(source) * 1000:.1f} ms")
+        for backend in backends:
+            continue_ms = bench_continue(source, backend) * 1000
+            steps_per_s = bench_step(source, backend)
+            print(f"  {backend:>10}: continue {continue_ms:8.1f} ms, "
+                  f"step {steps_per_s:6.0f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Steps per second for a scripted sequence of step commands.
+
+Drives a WebDebugger through a simple loop the same way the /control route
+does (post_command from another thread) and reports throughput for two
+patterns: commands queued up front, and lock-step (post one command, wait
+for the debuggee to pause again), which is what an interactive client sees.
+
+    python benchmarks/bench_commands.py [steps]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.debugger import WebDebugger
+
+PROGRAM = """
+total = 0
+for i in range({iterations}):
+    total += i
+"""
+
+
+def _start(steps):
+    debugger = WebDebugger()
+    code = compile(PROGRAM.format(iterations=steps), '<string>', 'exec')
+    debugger.set_running(True)
+
+    def target():
+        try:
+            debugger.run(code, {'__name__': '__main__'})
+        finally:
+            debugger.set_running(False)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    debugger.wait_for_pause()
+    return debugger, thread
+
+
+def bench_queued(steps):
+    debugger, thread = _start(steps)
+    start = time.perf_counter()
+    for _ in range(steps):
+        debugger.post_command('step')
+    debugger.wait_for_pause()
+    elapsed = time.perf_counter() - start
+    debugger.post_command('quit')
+    thread.join()
+    return elapsed
+
+
+def bench_lockstep(steps):
+    debugger, thread = _start(steps)
+    start = time.perf_counter()
+    for _ in range(steps):
+        debugger.post_command('step')
+        debugger.wait_for_pause()
+    elapsed = time.perf_counter() - start
+    debugger.post_command('quit')
+    thread.join()
+    return elapsed
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, bench in (('queued', bench_queued), ('lock-step', bench_lockstep)):
+        elapsed = bench(steps)
+        print(f"{name:>10}: {steps} steps in {elapsed:.3f}s "
+              f"({steps / elapsed:,.0f} steps/s, {elapsed / steps * 1e6:.0f} us/step)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Profiling overhead of deterministic vs sampling mode.
+
+Runs a call-heavy program natively and under the debugger after
+'continue' (no breakpoints) in each profile mode, per tracer backend.
+
+    python benchmarks/bench_profiler.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.debugger import WebDebugger
+from src.fastpath import MONITORING_AVAILABLE
+
+CALL_HEAVY = """
+def leaf(x):
+    return x * 2 + 1
+
+def middle(n):
+    total = 0
+    for i in range(n):
+        total += leaf(i)
+    return total
+
+results = [middle(2000) for _ in range(100)]
+"""
+
+
+def bench_native(source):
+    code = compile(source, '<string>', 'exec')
+    start = time.perf_counter()
+    exec(code, {'__name__': '__main__'})
+    return time.perf_counter() - start
+
+
+def bench_continue(source, backend, mode):
+    debugger = WebDebugger(backend=backend)
+    debugger.sources.register('<string>', source)
+    code = compile(source, '<string>', 'exec')
+    debugger.set_running(True)
+    finished = [None]
+
+    def target():
+        try:
+            debugger.run(code, {'__name__': '__main__'})
+        finally:
+            finished[0] = time.perf_counter()
+            debugger.set_running(False)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    debugger.wait_for_pause()
+    debugger.set_profile_mode(mode)
+    start = time.perf_counter()
+    debugger.post_command('continue')
+    thread.join()
+    profile = debugger.get_profile_data()
+    return finished[0] - start, profile
+
+
+def main():
+    backends = ['settrace']
+    if MONITORING_AVAILABLE:
+        backends.append('monitoring')
+    native = bench_native(CALL_HEAVY)
+    print(f"native {native * 1000:.1f} ms")
+    for backend in backends:
+        for mode in ('deterministic', 'sampling'):
+            elapsed, profile = bench_continue(CALL_HEAVY, backend, mode)
+            middle = profile['function_times']['middle']
+            print(f"  {backend:>10} {mode:>13}: {elapsed * 1000:8.1f} ms "
+                  f"({elapsed / native:5.1f}x native), "
+                  f"middle {middle['total_time'] * 1000:.1f} ms inclusive")
+
+
+if __name__ == "__main__":
+    main()
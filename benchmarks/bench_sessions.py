@@ -0,0 +1,79 @@
+"""Session start-up and request latency for thread- and process-isolated sessions.
+
+Measures how long creating and starting a session takes (process sessions
+draw on the pre-forked worker pool), the round trip of a /status-style
+request, and lock-step stepping through the session's debugger.
+
+    python benchmarks/bench_sessions.py [sessions]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.sessions import SessionManager
+
+PROGRAM = """
+total = 0
+for i in range(100000):
+    total += i
+"""
+
+REQUESTS = 500
+STEPS = 200
+
+
+def _wait_paused(debugger):
+    while not debugger.get_usage()['is_paused']:
+        time.sleep(0.001)
+
+
+def _step(debugger):
+    # The state version (part of the ETag) moves once per pause
+    etag = debugger.status_etag()
+    debugger.post_command('step')
+    while debugger.status_etag() == etag:
+        time.sleep(0)
+
+
+def bench(isolation, count):
+    manager = SessionManager(isolation=isolation, pool_size=count)
+    if manager.pool is not None:
+        manager.pool.prestart()
+
+    start = time.perf_counter()
+    sessions = []
+    for _ in range(count):
+        session = manager.create()
+        session.start(PROGRAM)
+        sessions.append(session)
+    for session in sessions:
+        _wait_paused(session.debugger)
+    started = (time.perf_counter() - start) / count
+
+    debugger = sessions[0].debugger
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        debugger.status_etag()
+        debugger.get_status()
+    status = (time.perf_counter() - start) / REQUESTS
+
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        _step(debugger)
+    step = (time.perf_counter() - start) / STEPS
+
+    for session in sessions:
+        manager.close(session.id)
+    if manager.pool is not None:
+        manager.pool.shutdown()
+
+    print(f"{isolation:>8}: start {started * 1000:7.1f} ms/session, "
+          f"status {status * 1e6:7.0f} us, step {step * 1e6:7.0f} us")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    bench('thread', count)
+    bench('process', count)
@@ -36,6 +36,9 @@ let codeLines = [];
 let activeBreakpoints = new Set();
 let isDebugging = false;
 let pollInterval = null;
+let eventSource = null;
+let liveState = null;
+let sessionId = null;
 let currentState = 0;
 let maxStates = 0;
 let selectedText = '';
@@ -48,6 +51,7 @@ let lastX = 0;
 let lastY = 0;
 let timeChart = null;
 let callsChart = null;
+let lineHeatmap = false;
 
 const codeArea = document.getElementById('codeArea');
 const output = document.getElementById('output');
@@ -56,7 +60,7 @@ const stackTrace = document.getElementById('stackTrace');
 const fileInput = document.getElementById('fileInput');
 const variableTooltip = document.getElementById('variableTooltip');
 const stateCounter = document.getElementById('stateCounter');
-const debugButtons = ['stepButton', 'stepOverButton', 'stepBackButton', 'continueButton', 'stopButton', 'prevStateButton', 'nextStateButton'];
+const debugButtons = ['stepButton', 'stepOverButton', 'stepBackButton', 'reverseContinueButton', 'continueButton', 'stopButton', 'prevStateButton', 'nextStateButton'];
 
 fileInput.addEventListener('change', handleFileSelect);
 document.addEventListener('mousemove', updateTooltipPosition);
@@ -98,7 +102,7 @@ function toggleProfilePanel(show) {
 }
 async function updateProfileData() {
     try {
-        const response = await fetch('/profile');
+        const response = await fetch(sessionUrl('/profile'));
         const data = await response.json();
         
         if (data.error) {
@@ -220,8 +224,70 @@ function updateCharts(data) {
 
 document.querySelector('.control-group').insertAdjacentHTML('beforeend', `
     <button onclick="toggleProfilePanel(true)">Show Profile</button>
+    <button id="heatmapButton" onclick="toggleLineHeatmap()">Line Heatmap</button>
 `);
 
+async function toggleLineHeatmap() {
+    lineHeatmap = !lineHeatmap;
+    document.getElementById('heatmapButton').classList.toggle('active', lineHeatmap);
+    if (!lineHeatmap) clearLineHeatmap();
+    if (sessionId) await setLineProfiling(lineHeatmap);
+}
+
+async function setLineProfiling(enabled) {
+    try {
+        const response = await fetch(sessionUrl('/profile/lines'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ enabled })
+        });
+        if (response.ok && enabled) {
+            applyLineHeatmap(await response.json());
+        }
+    } catch (error) {
+        showError('Error switching line profiling: ' + error.message);
+    }
+}
+
+async function refreshLineHeatmap() {
+    // One request at a time, like refreshVisualizations
+    if (!lineHeatmap || !liveState || liveState.heatmapPending) return;
+    liveState.heatmapPending = true;
+    try {
+        const response = await fetch(sessionUrl('/profile/lines'));
+        if (response.ok) {
+            applyLineHeatmap(await response.json());
+        }
+    } catch (error) {
+        console.error('Error fetching line profile:', error);
+    } finally {
+        liveState.heatmapPending = false;
+    }
+}
+
+function clearLineHeatmap() {
+    document.querySelectorAll('.code-line.heat').forEach(line => {
+        line.classList.remove('heat');
+        line.style.removeProperty('--heat');
+        line.removeAttribute('title');
+    });
+}
+
+function applyLineHeatmap(data) {
+    clearLineHeatmap();
+    if (!lineHeatmap) return;
+    // Shade by time where there is any, otherwise by hit count
+    const byTime = data.max_time > 0;
+    data.lines.forEach(entry => {
+        const line = document.querySelector(`[data-line="${entry.line}"]`);
+        if (!line) return;
+        const heat = byTime ? entry.time / data.max_time : entry.hits / data.max_hits;
+        line.classList.add('heat');
+        line.style.setProperty('--heat', Math.max(heat, 0.08).toFixed(3));
+        line.title = `${entry.hits} hits, ${(entry.time * 1000).toFixed(3)} ms`;
+    });
+}
+
 const originalPollStatus = pollStatus;
 pollStatus = async function() {
     await originalPollStatus();
@@ -400,7 +466,7 @@ async function evaluateCode() {
     if (!code.trim()) return;
 
     try {
-        const response = await fetch('/evaluate', {
+        const response = await fetch(sessionUrl('/evaluate'), {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
@@ -453,7 +519,14 @@ async function startDebugger(startLine = null, endLine = null) {
     }
 
     try {
-        const response = await fetch('/start', {
+        if (sessionId) {
+            // Replace this page's previous session rather than leaving it idle
+            closeStream();
+            fetch(`/sessions/${sessionId}`, { method: 'DELETE' }).catch(() => {});
+            sessionId = null;
+        }
+
+        const response = await fetch('/sessions', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
@@ -466,17 +539,26 @@ async function startDebugger(startLine = null, endLine = null) {
         if (!response.ok) throw new Error('Failed to start debugger');
 
         const data = await response.json();
+        sessionId = data.session_id;
         if (data.highlighted_code) {
             updateCodeArea(codeLines.join('\n'));
         }
 
         isDebugging = true;
         updateButtons(true);
-        startPolling();
+        resetLiveState();
+        if (window.EventSource) {
+            openStream();
+        } else {
+            startPolling();
+        }
         
         if (activeBreakpoints.size > 0) {
             await sendBreakpoints();
         }
+        if (lineHeatmap) {
+            await setLineProfiling(true);
+        }
 
     } catch (error) {
         showError(`Error starting debugger: ${error.message}`);
@@ -495,6 +577,10 @@ async function stepBack() {
     await sendControl('step_back');
 }
 
+async function reverseContinue() {
+    await sendControl('reverse_continue');
+}
+
 async function continueExecution() {
     await sendControl('continue');
 }
@@ -524,10 +610,16 @@ function setBreakpoint(type) {
         return;
     }
 
+    if (type === 'log' && !condition) {
+        showError('Please enter a message for the logpoint, e.g. i={i}');
+        return;
+    }
+
     if (activeBreakpoints.has(lineNumber)) {
         activeBreakpoints.delete(lineNumber);
         line.classList.remove('breakpoint', 'conditional-breakpoint');
         line.removeAttribute('data-condition');
+        line.removeAttribute('data-log');
         
         const existingIndicator = line.querySelector('.conditional-indicator');
         if (existingIndicator) {
@@ -547,6 +639,16 @@ function setBreakpoint(type) {
         indicator.title = `Condition: ${condition}`;
         indicator.innerHTML = '⚡';
         line.insertBefore(indicator, line.firstChild);
+    } else if (type === 'log') {
+        // A logpoint records the message each time the line runs, without stopping
+        line.classList.add('conditional-breakpoint');
+        line.setAttribute('data-log', condition);
+
+        const indicator = document.createElement('span');
+        indicator.className = 'conditional-indicator';
+        indicator.title = `Log: ${condition}`;
+        indicator.innerHTML = '📝';
+        line.insertBefore(indicator, line.firstChild);
     }
 
     document.getElementById('breakpointLine').value = '';
@@ -599,6 +701,7 @@ function updateBreakpointList() {
     Array.from(activeBreakpoints).sort((a, b) => a - b).forEach(line => {
         const element = document.querySelector(`[data-line="${line}"]`);
         const condition = element.getAttribute('data-condition');
+        const log = element.getAttribute('data-log');
         
         const breakpointDiv = document.createElement('div');
         breakpointDiv.className = 'breakpoint-item';
@@ -610,6 +713,13 @@ function updateBreakpointList() {
                     ${condition.length > 20 ? condition.substring(0, 20) + '...' : condition}
                 </span>
             ` : ''}
+            ${log ? `
+                <span class="breakpoint-condition" title="${log}">
+                    <span class="condition-icon">📝</span>
+                    ${log.length > 20 ? log.substring(0, 20) + '...' : log}
+                </span>
+                <button class="remove-breakpoint" title="Show logged messages" onclick="showLogpointMessages(${line})">≡</button>
+            ` : ''}
             <button class="remove-breakpoint" onclick="removeBreakpoint(${line})">×</button>
         `;
         breakpointList.appendChild(breakpointDiv);
@@ -627,7 +737,7 @@ async function sendBreakpoints() {
             };
         });
         
-        await fetch('/breakpoints', {
+        await fetch(sessionUrl('/breakpoints'), {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ breakpoints })
@@ -642,6 +752,7 @@ function removeBreakpoint(line) {
     const lineElement = document.querySelector(`[data-line="${line}"]`);
     if (lineElement) {
         lineElement.classList.remove('breakpoint', 'conditional-breakpoint');
+        lineElement.removeAttribute('data-log');
     }
     if (isDebugging) {
         sendBreakpoints();
@@ -673,9 +784,9 @@ function toggleBreakpoint(lineNumber) {
     }
 }
 
-function navigateState(direction) {
+async function navigateState(direction) {
     const newState = currentState + direction;
-    if (newState >= 0 && newState < maxStates) {
+    if (newState >= 0 && newState < maxStates && await sendControl('goto', { state: newState })) {
         currentState = newState;
         updateStateCounter();
     }
@@ -740,15 +851,21 @@ function updateStackTrace(frames) {
     `).join('');
 }
 
-async function sendControl(action) {
+async function sendControl(action, extra = {}) {
     try {
-        await fetch('/control', {
+        const response = await fetch(sessionUrl('/control'), {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ action })
+            body: JSON.stringify({ action, ...extra })
         });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error);
+        }
+        return true;
     } catch (error) {
         showError(`Error sending command: ${error.message}`);
+        return false;
     }
 }
 
@@ -757,13 +874,15 @@ async function sendBreakpoints() {
         const breakpoints = Array.from(activeBreakpoints).map(line => {
             const element = document.querySelector(`[data-line="${line}"]`);
             const condition = element.getAttribute('data-condition');
+            const log = element.getAttribute('data-log');
             return {
                 line: line,
-                condition: condition || null
+                condition: condition || null,
+                log: log || null
             };
         });
         
-        const response = await fetch('/breakpoints', {
+        const response = await fetch(sessionUrl('/breakpoints'), {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ breakpoints })
@@ -779,6 +898,215 @@ async function sendBreakpoints() {
     }
 }
 
+async function setWatchpoints() {
+    const input = document.getElementById('watchExpressions');
+    const watchpoints = input.value.split(',').map(name => name.trim()).filter(Boolean);
+    try {
+        const response = await fetch(sessionUrl('/watchpoints'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ watchpoints })
+        });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error);
+        }
+    } catch (error) {
+        showError(`Error setting watchpoints: ${error.message}`);
+    }
+}
+
+async function setWatchList() {
+    const expressions = document.getElementById('watchList').value
+        .split('\n').map(line => line.trim()).filter(Boolean);
+    try {
+        const response = await fetch(sessionUrl('/watch'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ expressions })
+        });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error);
+        showWatchResults(data);
+    } catch (error) {
+        showError(`Error setting watch list: ${error.message}`);
+    }
+}
+
+async function refreshWatchList() {
+    // Polling fallback; the stream pushes a 'watches' event instead
+    if (!document.getElementById('watchList').value.trim()) return;
+    try {
+        const response = await fetch(sessionUrl('/watch'));
+        if (response.ok) showWatchResults(await response.json());
+    } catch (error) {
+        console.error('Error reading watch list:', error);
+    }
+}
+
+function showWatchResults(data) {
+    const panel = document.getElementById('watchResults');
+    panel.textContent = data.results.map(watch => {
+        const value = watch.type === 'error' ? `<${watch.error}>` : (watch.result ?? '(statement)');
+        return `${watch.expression} = ${value}  (${watch.elapsed} ms)`;
+    }).join('\n');
+}
+
+function showTriggeredWatchpoints(triggered) {
+    const panel = document.getElementById('watchpointStatus');
+    panel.textContent = triggered.map(
+        watch => `${watch.expression}: ${watch.old_value ?? '(unset)'} → ${watch.value ?? '(unset)'}`
+    ).join('\n');
+}
+
+async function showLogpointMessages(line) {
+    const panel = document.getElementById('logpointMessages');
+    try {
+        const response = await fetch(sessionUrl('/breakpoints'));
+        const data = await response.json();
+        const breakpoint = Object.values(data).map(lines => lines[line]).find(Boolean);
+        if (!breakpoint || !breakpoint.messages) {
+            panel.textContent = `Nothing logged at line ${line} yet`;
+            return;
+        }
+        const shown = breakpoint.messages.map(([hit, text]) => `#${hit}: ${text}`);
+        const dropped = breakpoint.logged - breakpoint.messages.length;
+        panel.textContent = `Line ${line}, ${breakpoint.logged} logged` +
+            (dropped > 0 ? ` (oldest ${dropped} dropped)` : '') + '\n' + shown.join('\n');
+    } catch (error) {
+        showError(`Error reading logpoint: ${error.message}`);
+    }
+}
+
+function sessionUrl(path) {
+    // Each page drives its own server-side session
+    return sessionId ? `/sessions/${sessionId}${path}` : path;
+}
+
+function resetLiveState() {
+    liveState = {
+        output: '',
+        outputOffset: 0,
+        stack: [],
+        variables: { locals: {}, globals: {} },
+        version: null,
+        etag: null,
+        visualizationsPending: false,
+        heatmapPending: false
+    };
+}
+
+function applyOutput(offset, end, text) {
+    // A jump in offset means the server-side buffer was cleared
+    if (offset !== liveState.outputOffset) {
+        liveState.output = '';
+    }
+    liveState.output += text;
+    liveState.outputOffset = end;
+    output.textContent = liveState.output;
+}
+
+function applyStack(delta) {
+    // Frames are keyed by index from the outermost frame
+    const stack = liveState.stack;
+    stack.length = Math.min(stack.length, delta.depth);
+    Object.entries(delta.frames).forEach(([index, frame]) => {
+        stack[parseInt(index)] = frame;
+    });
+    updateStackTrace(stack.slice().reverse());
+}
+
+function applyVariables(delta) {
+    ['locals', 'globals'].forEach(scope => {
+        const values = liveState.variables[scope];
+        delta[scope].removed.forEach(name => delete values[name]);
+        Object.assign(values, delta[scope].changed);
+    });
+    updateVariables(liveState.variables, document.getElementById('variables'));
+}
+
+function applyState(data) {
+    liveState.version = data.version;
+    if (data.current_line) {
+        highlightLine(data.current_line);
+    }
+    if (data.exception) {
+        showError(data.exception);
+    }
+    currentState = data.current_state;
+    maxStates = data.states;
+    updateStateCounter();
+    showTriggeredWatchpoints(data.triggered_watchpoints || []);
+    if (document.getElementById('profilePanel').classList.contains('visible')) {
+        updateProfileData();
+    }
+    refreshLineHeatmap();
+}
+
+function openStream() {
+    closeStream();
+    eventSource = new EventSource(sessionUrl('/stream'));
+
+    eventSource.addEventListener('output', (e) => {
+        const data = JSON.parse(e.data);
+        applyOutput(data.offset, data.end, data.text);
+    });
+
+    eventSource.addEventListener('steps', () => {
+        refreshVisualizations();
+    });
+
+    eventSource.addEventListener('stack', (e) => {
+        applyStack(JSON.parse(e.data));
+    });
+
+    eventSource.addEventListener('variables', (e) => {
+        applyVariables(JSON.parse(e.data));
+    });
+
+    eventSource.addEventListener('state', (e) => {
+        applyState(JSON.parse(e.data));
+    });
+
+    eventSource.addEventListener('watches', (e) => {
+        showWatchResults(JSON.parse(e.data));
+    });
+
+    eventSource.addEventListener('end', () => {
+        refreshVisualizations();
+        refreshLineHeatmap();
+        stopDebugger();
+    });
+
+    eventSource.onerror = () => {
+        // EventSource reconnects on its own unless the stream is closed
+        if (!isDebugging) closeStream();
+    };
+}
+
+function closeStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+async function refreshVisualizations() {
+    // Coalesce bursts of step events into one request at a time
+    if (!liveState || liveState.visualizationsPending) return;
+    liveState.visualizationsPending = true;
+    try {
+        const response = await fetch(sessionUrl('/visualizations'));
+        if (response.ok) {
+            updateVisualizations(await response.json());
+        }
+    } catch (error) {
+        console.error('Error fetching visualizations:', error);
+    } finally {
+        liveState.visualizationsPending = false;
+    }
+}
+
 function startPolling() {
     if (pollInterval) clearInterval(pollInterval);
     pollInterval = setInterval(pollStatus, 300);
@@ -788,20 +1116,36 @@ async function pollStatus() {
     if (!isDebugging) return;
 
     try {
-        const [statusResponse, visualResponse] = await Promise.all([
-            fetch('/status'),
-            fetch('/visualizations')
-        ]);
-
-        if (!statusResponse.ok || !visualResponse.ok) 
+        // Ask only for what changed since the last response we applied
+        const params = new URLSearchParams({ output_offset: liveState.outputOffset });
+        if (liveState.version !== null) params.set('since', liveState.version);
+        const headers = liveState.etag ? { 'If-None-Match': liveState.etag } : {};
+
+        const statusResponse = await fetch(sessionUrl(`/status?${params}`), { headers });
+        if (statusResponse.status === 304) return;
+        if (!statusResponse.ok)
             throw new Error('Failed to get data');
-        
+
+        liveState.etag = statusResponse.headers.get('ETag');
         const statusData = await statusResponse.json();
-        const visualData = await visualResponse.json();
-        
-        updateDebuggerState(statusData);
-        updateVisualizations(visualData);
-        
+        const versionChanged = statusData.version !== liveState.version;
+
+        applyOutput(statusData.output_offset, statusData.output_end, statusData.output);
+        if (statusData.delta) {
+            applyStack(statusData.stack);
+            applyVariables(statusData.variables);
+        } else {
+            liveState.stack = statusData.stack_frames.slice().reverse();
+            liveState.variables = statusData.variables;
+            updateStackTrace(statusData.stack_frames);
+            updateVariables(statusData.variables, document.getElementById('variables'));
+        }
+        applyState(statusData);
+        if (versionChanged) {
+            refreshVisualizations();
+            refreshWatchList();
+        }
+
         if (!statusData.is_running || statusData.exception) {
             stopDebugger();
         }
@@ -865,7 +1209,11 @@ function switchTab(tab) {
     document.querySelectorAll('.visualization-tab').forEach(el => {
         el.classList.toggle('active', el.textContent.toLowerCase().includes(tab));
     });
-    pollStatus();
+    if (eventSource) {
+        refreshVisualizations();
+    } else {
+        pollStatus();
+    }
 }
 
 function zoomDiagram(delta) {
@@ -921,31 +1269,10 @@ function setupPanning() {
 }
 
 
-function updateDebuggerState(data) {
-    const variablesDiv = document.getElementById('variables');
-    updateVariables(data.variables, variablesDiv);
-    updateStackTrace(data.stack_frames);
-    
-    if (data.current_line) {
-        highlightLine(data.current_line);
-    }
-    
-    if (data.output) {
-        output.textContent = data.output;
-    }
-    
-    if (data.exception) {
-        showError(data.exception);
-    }
-
-    currentState = data.current_state;
-    maxStates = data.states;
-    updateStateCounter();
-}
-
 function stopDebugger() {
     isDebugging = false;
     updateButtons(false);
+    closeStream();
     if (pollInterval) {
         clearInterval(pollInterval);
         pollInterval = null;
@@ -977,122 +1304,17 @@ document.querySelector('.control-group').insertAdjacentHTML('beforeend', `
     <button onclick="toggleVisualizationPanel(true)">Show Visualizations</button>
 `);
 
-function toggleResourceDetail(show) {
-    document.querySelector('.resource-detail').classList.toggle('show', show);
-    document.querySelector('.resource-overlay').classList.toggle('show', show);
-}
-
-let cpuChart, ioChart, networkChart;
-const chartOptions = {
-    responsive: true,
-    animation: false,
-    scales: {
-        y: {
-            beginAtZero: true
-        }
-    }
-};
-
-function initCharts() {
-    cpuChart = new Chart(document.getElementById('cpuChart'), {
-        type: 'line',
-        data: {
-            labels: [],
-            datasets: [{
-                label: 'CPU Usage (%)',
-                data: [],
-                borderColor: 'rgb(75, 192, 192)',
-                tension: 0.1
-            }]
-        },
-        options: chartOptions
-    });
-
-    ioChart = new Chart(document.getElementById('ioChart'), {
-        type: 'line',
-        data: {
-            labels: [],
-            datasets: [{
-                label: 'I/O Operations/s',
-                data: [],
-                borderColor: 'rgb(153, 102, 255)',
-                tension: 0.1
-            }]
-        },
-        options: chartOptions
-    });
-
-    networkChart = new Chart(document.getElementById('networkChart'), {
-        type: 'line',
-        data: {
-            labels: [],
-            datasets: [{
-                label: 'Network Usage (B/s)',
-                data: [],
-                borderColor: 'rgb(255, 99, 132)',
-                tension: 0.1
-            }]
-        },
-        options: chartOptions
-    });
-}
-function updateResourceData() {
-    fetch('/resource_usage')
-        .then(response => response.json())
-        .then(data => {
-            document.getElementById('cpuValue').textContent = `${data.cpu.toFixed(1)}%`;
-            document.getElementById('ioValue').textContent = `${data.io} ops/s`;
-            document.getElementById('networkValue').textContent = `${formatBytes(data.network)}/s`;
-
-            updateChart(cpuChart, data.cpu);
-            updateChart(ioChart, data.io);
-            updateChart(networkChart, data.network);
-        });
-}
-
-function updateChart(chart, value) {
-    const now = new Date().toLocaleTimeString();
-    chart.data.labels.push(now);
-    chart.data.datasets[0].data.push(value);
-
-    if (chart.data.labels.length > 20) {
-        chart.data.labels.shift();
-        chart.data.datasets[0].data.shift();
-    }
-
-    chart.update();
-}
-
-function formatBytes(bytes) {
-    if (bytes < 1024) return bytes + ' B';
-    else if (bytes < 1048576) return (bytes / 1024).toFixed(1) + ' KB';
-    else return (bytes / 1048576).toFixed(1) + ' MB';
-}
-
-document.addEventListener('DOMContentLoaded', () => {
-    initCharts();
-    setInterval(updateResourceData, 1000);
-});
-
-
-
 const chartConfig = {
     cpu: {
         type: 'line',
         data: {
             labels: [],
             datasets: [{
-                label: 'User CPU',
+                label: 'Program CPU',
                 borderColor: '#4a90e2',
                 backgroundColor: 'rgba(74, 144, 226, 0.1)',
                 data: [],
                 fill: true
-            }, {
-                label: 'System CPU',
-                borderColor: '#ff6b6b',
-                backgroundColor: 'rgba(255, 107, 107, 0.1)',
-                data: [],
-                fill: true
             }]
         },
         options: {
@@ -1133,7 +1355,7 @@ const chartConfig = {
                 },
                 y: {
                     beginAtZero: true,
-                    max: 100,
+                    suggestedMax: 100,
                     grid: {
                         color: 'rgba(255, 255, 255, 0.05)'
                     },
@@ -1150,17 +1372,11 @@ const chartConfig = {
         data: {
             labels: [],
             datasets: [{
-                label: 'Used Memory',
+                label: 'Resident Memory',
                 borderColor: '#4caf50',
                 backgroundColor: 'rgba(76, 175, 80, 0.1)',
                 data: [],
                 fill: true
-            }, {
-                label: 'Cache',
-                borderColor: '#ff9800',
-                backgroundColor: 'rgba(255, 152, 0, 0.1)',
-                data: [],
-                fill: true
             }]
         },
         options: {
@@ -1217,13 +1433,13 @@ const chartConfig = {
         data: {
             labels: [],
             datasets: [{
-                label: 'Read Operations',
+                label: 'Read',
                 backgroundColor: 'rgba(74, 144, 226, 0.5)',
                 borderColor: '#4a90e2',
                 data: [],
                 borderWidth: 1
             }, {
-                label: 'Write Operations',
+                label: 'Write',
                 backgroundColor: 'rgba(255, 107, 107, 0.5)',
                 borderColor: '#ff6b6b',
                 data: [],
@@ -1275,24 +1491,24 @@ const chartConfig = {
                     },
                     ticks: {
                         color: '#888',
-                        callback: value => `${value} ops/s`
+                        callback: value => formatBytes(value) + '/s'
                     }
                 }
             }
         }
     },
-    network: {
+    ioTotal: {
         type: 'line',
         data: {
             labels: [],
             datasets: [{
-                label: 'Inbound Traffic',
+                label: 'Read',
                 borderColor: '#4caf50',
                 backgroundColor: 'rgba(76, 175, 80, 0.1)',
                 data: [],
                 fill: true
             }, {
-                label: 'Outbound Traffic',
+                label: 'Written',
                 borderColor: '#ff9800',
                 backgroundColor: 'rgba(255, 152, 0, 0.1)',
                 data: [],
@@ -1342,7 +1558,7 @@ const chartConfig = {
                     },
                     ticks: {
                         color: '#888',
-                        callback: value => formatBytes(value) + '/s'
+                        callback: value => formatBytes(value)
                     }
                 }
             }
@@ -1367,7 +1583,7 @@ const chartContexts = {
     cpu: document.getElementById('cpuChart'),
     memory: document.getElementById('memoryChart'),
     io: document.getElementById('ioChart'),
-    network: document.getElementById('networkChart')
+    ioTotal: document.getElementById('ioTotalChart')
 };
 
 Object.keys(chartContexts).forEach(type => {
@@ -1376,90 +1592,99 @@ Object.keys(chartContexts).forEach(type => {
     }
 });
 
-function updateResourceMonitor(data) {
-    document.getElementById('cpuValue').textContent = `${data.cpu.total}%`;
-    document.getElementById('memoryValue').textContent = formatBytes(data.memory.used);
-    document.getElementById('ioValue').textContent = `${formatNumber(data.io.total)} ops/s`;
-    document.getElementById('networkValue').textContent = `${formatBytes(data.network.total)}/s`;
-
-    document.getElementById('cpuLoadAvg').textContent = `${data.cpu.loadAvg}%`;
-    document.getElementById('memoryUsage').textContent = formatBytes(data.memory.total);
-    document.getElementById('diskIoRate').textContent = `${formatNumber(data.io.rate)} MB/s`;
-    document.getElementById('networkRate').textContent = `${formatBytes(data.network.throughput)}/s`;
-
-    updateTrendIndicator('cpuTrend', data.cpu.trend);
-    updateTrendIndicator('memoryTrend', data.memory.trend);
-    updateTrendIndicator('ioTrend', data.io.trend);
-    updateTrendIndicator('networkTrend', data.network.trend);
-
-    updateChart(data);
+// Resource samples are kept by the server; only those not charted yet are fetched
+const RESOURCE_CHART_POINTS = 60;
+let resourceSessionId = null;
+let resourceSince = 0;
+let resourceStartTime = null;
+
+async function updateResourceData() {
+    if (!sessionId) return;
+    if (resourceSessionId !== sessionId) {
+        resourceSessionId = sessionId;
+        resourceSince = 0;
+        resourceStartTime = null;
+        clearResourceCharts();
+    }
+    try {
+        const response = await fetch(sessionUrl(`/resources/history?since=${resourceSince}`));
+        if (!response.ok) return;
+        const history = await response.json();
+        resourceSince = history.next;
+        if (history.time.length) updateResourceMonitor(history);
+    } catch (error) {
+        console.error('Error fetching resource usage:', error);
+    }
 }
 
-function updateTrendIndicator(elementId, trend) {
-    const element = document.getElementById(elementId);
-    const value = parseFloat(trend);
-    element.textContent = `${value >= 0 ? '+' : ''}${value}% from baseline`;
-    element.className = `stat-change ${value >= 0 ? 'positive' : 'negative'}`;
+function clearResourceCharts() {
+    Object.values(charts).forEach(chart => {
+        chart.data.labels = [];
+        chart.data.datasets.forEach(dataset => dataset.data = []);
+        chart.update('none');
+    });
 }
 
-function updateChart(data) {
-    const timestamp = new Date().toLocaleTimeString();
-
-    // Update CPU chart and metrics
-    charts.cpu.data.labels.push(timestamp);
-    charts.cpu.data.datasets[0].data.push(data.cpu.user);
-    charts.cpu.data.datasets[1].data.push(data.cpu.system);
-    if (charts.cpu.data.labels.length > 20) {
-        charts.cpu.data.labels.shift();
-        charts.cpu.data.datasets.forEach(dataset => dataset.data.shift());
-    }
-    charts.cpu.update('none');
-    
-    // Update CPU metrics
-    document.getElementById('cpuUserValue').textContent = `${data.cpu.user}%`;
-    document.getElementById('cpuSystemValue').textContent = `${data.cpu.system}%`;
-
-    // Update Memory chart and metrics
-    charts.memory.data.labels.push(timestamp);
-    charts.memory.data.datasets[0].data.push(data.memory.used);
-    charts.memory.data.datasets[1].data.push(data.memory.cached);
-    if (charts.memory.data.labels.length > 20) {
-        charts.memory.data.labels.shift();
-        charts.memory.data.datasets.forEach(dataset => dataset.data.shift());
-    }
-    charts.memory.update('none');
-    
-    // Update Memory metrics
-    document.getElementById('memUsedValue').textContent = formatBytes(data.memory.used);
-    document.getElementById('memAvailValue').textContent = formatBytes(data.memory.total - data.memory.used);
-
-    // Update IO chart and metrics
-    charts.io.data.labels.push(timestamp);
-    charts.io.data.datasets[0].data.push(data.io.read);
-    charts.io.data.datasets[1].data.push(data.io.write);
-    if (charts.io.data.labels.length > 20) {
-        charts.io.data.labels.shift();
-        charts.io.data.datasets.forEach(dataset => dataset.data.shift());
-    }
-    charts.io.update('none');
-    
-    // Update IO metrics
-    document.getElementById('ioReadValue').textContent = `${formatNumber(data.io.read)} ops/s`;
-    document.getElementById('ioWriteValue').textContent = `${formatNumber(data.io.write)} ops/s`;
-
-    // Update Network chart and metrics
-    charts.network.data.labels.push(timestamp);
-    charts.network.data.datasets[0].data.push(data.network.in);
-    charts.network.data.datasets[1].data.push(data.network.out);
-    if (charts.network.data.labels.length > 20) {
-        charts.network.data.labels.shift();
-        charts.network.data.datasets.forEach(dataset => dataset.data.shift());
+// Memory and I/O are not measured for programs run on a server thread
+function formatMeasuredBytes(bytes, suffix = '') {
+    return bytes === null ? 'n/a' : formatBytes(Math.round(bytes)) + suffix;
+}
+
+function updateResourceMonitor(history) {
+    const last = history.time.length - 1;
+    if (resourceStartTime === null) resourceStartTime = history.time[0];
+    const cpu = history.cpu_percent[last];
+    const cpuTime = history.cpu_time[last];
+    const rss = history.rss[last];
+    const readRate = history.read_rate[last];
+    const ioRate = readRate === null ? null : readRate + history.write_rate[last];
+
+    const labels = history.time.map(time => new Date(time * 1000).toLocaleTimeString());
+    appendChartPoints(charts.cpu, labels, [history.cpu_percent]);
+    appendChartPoints(charts.memory, labels, [history.rss]);
+    appendChartPoints(charts.io, labels, [history.read_rate, history.write_rate]);
+    appendChartPoints(charts.ioTotal, labels, [history.read_bytes, history.write_bytes]);
+
+    const cpuPoints = charts.cpu.data.datasets[0].data;
+    const cpuPeak = Math.max(...cpuPoints);
+    const cpuAverage = cpuPoints.reduce((sum, value) => sum + value, 0) / cpuPoints.length;
+    const rssPeak = rss === null ? null : Math.max(...charts.memory.data.datasets[0].data);
+
+    document.getElementById('cpuValue').textContent = `${cpu.toFixed(1)}%`;
+    document.getElementById('memoryValue').textContent = formatMeasuredBytes(rss);
+    document.getElementById('ioValue').textContent = formatMeasuredBytes(ioRate, '/s');
+    document.getElementById('cpuTimeValue').textContent = `${cpuTime.toFixed(2)} s`;
+
+    document.getElementById('cpuLoadAvg').textContent = `${cpuAverage.toFixed(1)}%`;
+    document.getElementById('cpuTrend').textContent = `peak ${cpuPeak.toFixed(1)}%`;
+    document.getElementById('memoryUsage').textContent = formatMeasuredBytes(rss);
+    document.getElementById('memoryTrend').textContent = `peak ${formatMeasuredBytes(rssPeak)}`;
+    document.getElementById('diskIoRate').textContent = formatMeasuredBytes(ioRate, '/s');
+    document.getElementById('ioTrend').textContent =
+        `${formatMeasuredBytes(history.read_bytes[last])} read, ${formatMeasuredBytes(history.write_bytes[last])} written`;
+    document.getElementById('cpuTimeTotal').textContent = `${cpuTime.toFixed(2)} s`;
+    document.getElementById('cpuTimeTrend').textContent =
+        `over ${Math.round(history.time[last] - resourceStartTime)} s`;
+
+    document.getElementById('cpuNowValue').textContent = `${cpu.toFixed(1)}%`;
+    document.getElementById('cpuPeakValue').textContent = `${cpuPeak.toFixed(1)}%`;
+    document.getElementById('memUsedValue').textContent = formatMeasuredBytes(rss);
+    document.getElementById('memPeakValue').textContent = formatMeasuredBytes(rssPeak);
+    document.getElementById('ioReadValue').textContent = formatMeasuredBytes(readRate, '/s');
+    document.getElementById('ioWriteValue').textContent = formatMeasuredBytes(history.write_rate[last], '/s');
+    document.getElementById('ioReadTotal').textContent = formatMeasuredBytes(history.read_bytes[last]);
+    document.getElementById('ioWriteTotal').textContent = formatMeasuredBytes(history.write_bytes[last]);
+}
+
+function appendChartPoints(chart, labels, series) {
+    chart.data.labels.push(...labels);
+    series.forEach((values, index) => chart.data.datasets[index].data.push(...values));
+    const excess = chart.data.labels.length - RESOURCE_CHART_POINTS;
+    if (excess > 0) {
+        chart.data.labels.splice(0, excess);
+        chart.data.datasets.forEach(dataset => dataset.data.splice(0, excess));
     }
-    charts.network.update('none');
-    
-    // Update Network metrics
-    document.getElementById('netInValue').textContent = `${formatBytes(data.network.in)}/s`;
-    document.getElementById('netOutValue').textContent = `${formatBytes(data.network.out)}/s`;
+    chart.update('none');
 }
 
 function toggleResourceDetail(show) {
@@ -1478,40 +1703,5 @@ function toggleResourceDetail(show) {
 }
 
 document.addEventListener('DOMContentLoaded', () => {
-    setInterval(() => {
-        const mockData = generateMockData();
-        updateResourceMonitor(mockData);
-    }, 1000);
+    setInterval(updateResourceData, 1000);
 });
-
-function generateMockData() {
-    return {
-        cpu: {
-            total: Math.floor(Math.random() * 100),
-            user: Math.floor(Math.random() * 60),
-            system: Math.floor(Math.random() * 40),
-            loadAvg: Math.floor(Math.random() * 100),
-            trend: (Math.random() * 10 - 5).toFixed(1)
-        },
-        memory: {
-            total: Math.floor(Math.random() * 16 * 1024*1024),
-            used: Math.random() * 8 * 1024 * 1024 * 1024,
-            cached: Math.random() * 4 * 1024 * 1024 * 1024,
-            trend: (Math.random() * 10 - 5).toFixed(1)
-        },
-        io: {
-            total: Math.floor(Math.random() * 1000),
-            read: Math.floor(Math.random() * 500),
-            write: Math.floor(Math.random() * 500),
-            rate: Math.floor(Math.random() * 100),
-            trend: (Math.random() * 10 - 5).toFixed(1)
-        },
-        network: {
-            total: Math.random() * 100 * 1024 * 1024,
-            in: Math.random() * 50 * 1024 * 1024,
-            out: Math.random() * 50 * 1024 * 1024,
-            throughput: Math.random() * 100 * 1024 * 1024,
-            trend: (Math.random() * 10 - 5).toFixed(1)
-        }
-    };
-}
\ No newline at end of file
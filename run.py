@@ -1,7 +1,5 @@
-from src.app import app, resource_monitor
-from src.monitor import update_resource_monitor
-import threading
+from src.app import app, sessions
 
 if __name__ == "__main__":
-    threading.Thread(target=update_resource_monitor, daemon=True).start()
+    sessions.prestart()
     app.run(debug=True, threaded=True, port=5000)
\ No newline at end of file
@@ -1,197 +1,434 @@
-from flask import Flask, request, jsonify, send_from_directory, current_app
-from .debugger import WebDebugger
-from .monitor import ResourceMonitor
+from flask import Flask, Response, request, jsonify, send_from_directory, current_app
+from .debugger import PROFILE_MODES
+from .history import COMPARISONS
+from .breakpoints import compile_condition, compile_log_message, parse_watch_path
+from .profiler import MIN_SAMPLE_INTERVAL
+from .ipc import WorkerError
+from .sessions import SessionManager, SessionLimitError
+from .variables import DEFAULT_PAGE_SIZE
 from pygments import highlight
 from pygments.lexers import PythonLexer
 from pygments.formatters import HtmlFormatter
+import functools
 import threading
 import time
 
+SESSION_EVICT_INTERVAL = 60
+
 app = Flask(__name__, static_folder='../frontend')
-debugger_instance = None
-resource_monitor = None
+sessions = SessionManager()
+# Session driven by the unprefixed routes (/start, /status, ...), kept for
+# single-user clients; /sessions/<id>/... addresses any session directly.
+legacy_session_id = None
+
 
-def update_resource_monitor():
-    global resource_monitor
+def evict_idle_sessions():
     while True:
-        if resource_monitor:
-            resource_monitor.update()
-        time.sleep(1)
+        time.sleep(SESSION_EVICT_INTERVAL)
+        sessions.evict_idle()
+
+
+def with_session(view):
+    """Resolve the session for a route and pass it to the view.
+
+    /sessions/<session_id>/... routes name the session; their unprefixed
+    aliases act on the session last started through /start.
+    """
+    @functools.wraps(view)
+    def wrapper(session_id=None, **kwargs):
+        session = sessions.get(session_id if session_id is not None else legacy_session_id)
+        if session is None:
+            if session_id is None:
+                return jsonify({"error": "Debugger not running"}), 400
+            return jsonify({"error": f"Unknown session: {session_id}"}), 404
+        return view(session, **kwargs)
+    return wrapper
 
 
-def run_code(code, debugger, start_line=None, end_line=None):
+def start_session():
+    """Create a session from the request body and start running its code."""
+    code = request.json.get("code")
+    start_line = request.json.get("start_line")
+    end_line = request.json.get("end_line")
+    backend = request.json.get("backend", "settrace")
+
+    if not code:
+        return None, (jsonify({"error": "No code provided"}), 400)
+
     try:
-        debugger.setup_io()
-        debugger.is_running = True
-        
-        if start_line is not None and end_line is not None:
-            debugger.selected_range = (start_line, end_line)
-            code_lines = code.split('\n')
-            selected_code = '\n'.join(code_lines[start_line-1:end_line])
-            debugger.selected_code = selected_code
-            compiled_code = compile(selected_code, '<string>', 'exec')
-        else:
-            debugger.selected_range = None
-            debugger.selected_code = None
-            compiled_code = compile(code, '<string>', 'exec')
-            
-        debugger.run(compiled_code)
-    except Exception as e:
-        debugger.exception = str(e)
-        print(f"Exception occurred: {str(e)}")
-    finally:
-        debugger.restore_io()
-        debugger.is_running = False
+        session = sessions.create(backend)
+    except SessionLimitError as e:
+        return None, (jsonify({"error": str(e)}), 503)
+    except (ValueError, RuntimeError) as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
+    try:
+        session.start(code, start_line, end_line)
+    except (ValueError, RuntimeError) as e:
+        sessions.close(session.id)
+        return None, (jsonify({"error": str(e)}), 400)
+    return session, jsonify({
+        "message": "Debugger started",
+        "session_id": session.id,
+        "highlighted_code": highlight(code, PythonLexer(), HtmlFormatter())
+    })
+
+@app.errorhandler(WorkerError)
+def worker_failed(error):
+    return jsonify({"error": str(error)}), 502
 
 @app.route("/")
 def index():
     return send_from_directory(current_app.static_folder, 'index.html')
 
+@app.route("/sessions/<session_id>/visualizations", methods=["GET"])
 @app.route("/visualizations", methods=["GET"])
-def get_visualizations():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-        
+@with_session
+def get_visualizations(session):
     try:
-        data = debugger_instance.get_visualization_data()
+        flowchart = request.args.get('flowchart', 'cfg')
+        if flowchart not in ('cfg', 'path'):
+            return jsonify({"error": f"Unknown flowchart mode: {flowchart}"}), 400
+        data = session.debugger.get_visualization_data(flowchart)
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+@app.route("/sessions/<session_id>/profile", methods=["GET"])
 @app.route("/profile", methods=["GET"])
-def get_profile_data():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-        
+@with_session
+def get_profile_data(session):
     try:
-        data = debugger_instance.get_profile_data()
+        data = session.debugger.get_profile_data()
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
+@app.route("/sessions/<session_id>/profile/mode", methods=["POST"])
+@app.route("/profile/mode", methods=["POST"])
+@with_session
+def set_profile_mode(session):
+    """Switch profiling between 'deterministic' and 'sampling' (optional 'interval' in seconds)."""
+    data = request.get_json() or {}
+    mode = data.get('mode', 'deterministic')
+    interval = data.get('interval')
+    if mode not in PROFILE_MODES:
+        return jsonify({"error": f"Unknown profile mode: {mode}"}), 400
+    if interval is not None:
+        if not isinstance(interval, (int, float)) or interval < MIN_SAMPLE_INTERVAL:
+            return jsonify({"error": f"interval must be a number of seconds >= {MIN_SAMPLE_INTERVAL}"}), 400
+    return jsonify(session.debugger.set_profile_mode(mode, interval))
+
+@app.route("/sessions/<session_id>/profile/lines", methods=["GET", "POST"])
+@app.route("/profile/lines", methods=["GET", "POST"])
+@with_session
+def line_profile(session):
+    """Per-line hit counts and time; POST {"enabled": bool} turns collection on or off."""
+    if request.method == "POST":
+        enabled = (request.get_json() or {}).get('enabled', True)
+        return jsonify(session.debugger.set_line_profiling(bool(enabled)))
+    return jsonify(session.debugger.get_line_profile())
+
+@app.route("/sessions/<session_id>/profile/memory", methods=["GET", "POST"])
+@app.route("/profile/memory", methods=["GET", "POST"])
+@with_session
+def memory_profile(session):
+    """Live memory per program line; POST {"enabled": bool} turns tracemalloc on or off."""
+    if request.method == "POST":
+        enabled = (request.get_json() or {}).get('enabled', True)
+        return jsonify(session.debugger.set_memory_profiling(bool(enabled)))
+    return jsonify(session.debugger.get_memory_profile())
+
+@app.route("/sessions/<session_id>/profile/memory/diff", methods=["GET"])
+@app.route("/profile/memory/diff", methods=["GET"])
+@with_session
+def memory_diff(session):
+    """Per-line memory change between program states ?from=<index>&to=<index>."""
+    try:
+        old_index = int(request.args['from'])
+        new_index = int(request.args['to'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "from and to state indexes are required"}), 400
+    diff = session.debugger.diff_memory_states(old_index, new_index)
+    if diff is None:
+        return jsonify({"error": "No memory snapshot for one of those states"}), 404
+    return jsonify(diff)
+
+@app.route("/sessions/<session_id>/history/variable", methods=["GET"])
+@app.route("/history/variable", methods=["GET"])
+@with_session
+def variable_history(session):
+    """When a variable changed: ?name=<name>&scope=locals|globals&query=...
+
+    query=values lists every write (up to ?state=), query=last_write gives
+    the write in effect at ?state= (default: the current state), and
+    query=first_match the first state from ?state= on where the value
+    compares to ?value= (a Python literal) with ?op= (default ==). Locals
+    are those of the innermost frame at ?state= (default: the current state).
+    """
+    name = request.args.get("name")
+    scope = request.args.get("scope", "locals")
+    query = request.args.get("query", "values")
+    op = request.args.get("op", "==")
+    value = request.args.get("value")
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+    if scope not in ('locals', 'globals'):
+        return jsonify({"error": f"Unknown scope: {scope}"}), 400
+    if query not in ('values', 'last_write', 'first_match'):
+        return jsonify({"error": f"Unknown history query: {query}"}), 400
+    if query == 'first_match' and (op not in COMPARISONS or value is None):
+        return jsonify({"error": "first_match needs a value and one of " + " ".join(COMPARISONS)}), 400
+    state = request.args.get("state", type=int)
+    if state is not None and state < 0:
+        return jsonify({"error": "state must be a program state index"}), 400
+    result = session.debugger.get_variable_history(name, scope, query, state, op, value)
+    if result is None:
+        return jsonify({"error": f"No recorded writes to {scope} variable '{name}'"}), 404
+    return jsonify(result)
+
+@app.route("/sessions/<session_id>/profile/export", methods=["GET"])
+@app.route("/profile/export", methods=["GET"])
+@with_session
+def export_profile(session):
+    """Download the call tree for flame graph viewers.
+
+    ?format=speedscope (default) returns a speedscope JSON document;
+    ?format=collapsed returns collapsed-stack text.
+    """
+    format = request.args.get('format', 'speedscope')
+    if format not in ('speedscope', 'collapsed'):
+        return jsonify({"error": f"Unknown profile format: {format}"}), 400
+    try:
+        data = session.debugger.get_profile_export(format)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if format == 'collapsed':
+        return Response(data, mimetype='text/plain')
+    return jsonify(data)
+
+@app.route("/sessions/<session_id>/resource_usage", methods=["GET"])
 @app.route("/resource_usage", methods=["GET"])
-def get_resource_usage():
-    global resource_monitor
-    if not resource_monitor:
-        return jsonify({"error": "Resource monitor not running"}), 400
-    return jsonify(resource_monitor.get_usage())
+@with_session
+def get_resource_usage(session):
+    """Latest CPU, memory and I/O sample of the session's program."""
+    if session.resources is None:
+        return jsonify({"error": "Resource usage not available"}), 404
+    return jsonify(session.resources.get_usage())
+
+@app.route("/sessions/<session_id>/resources/history", methods=["GET"])
+@app.route("/resource_history", methods=["GET"])
+@with_session
+def get_resource_history(session):
+    """Samples of the session's resource usage from ?since=<index> on, one list
+    per field; pass the returned 'next' as since to get only new samples."""
+    if session.resources is None:
+        return jsonify({"error": "Resource usage not available"}), 404
+    since = request.args.get("since", 0, type=int)
+    return jsonify(session.resources.get_history(since))
 
+@app.route("/sessions/<session_id>/evaluate", methods=["POST"])
 @app.route("/evaluate", methods=["POST"])
-def evaluate_code():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-        
+@with_session
+def evaluate_code(session):
     code = request.json.get("code")
     line_number = request.json.get("line_number")
     
     if not code:
         return jsonify({"error": "No code provided"}), 400
         
-    result = debugger_instance.evaluate_code(code, line_number)
+    result = session.debugger.evaluate_code(code, line_number)
     return jsonify(result)
 
-@app.route("/start", methods=["POST"])
-def start_debugger():
-    global debugger_instance, resource_monitor
-    code = request.json.get("code")
-    start_line = request.json.get("start_line")
-    end_line = request.json.get("end_line")
-    
-    if not code:
-        return jsonify({"error": "No code provided"}), 400
+@app.route("/sessions/<session_id>/watch", methods=["GET", "POST"])
+@app.route("/watch", methods=["GET", "POST"])
+@with_session
+def watch(session):
+    """Watch list: POST {"expressions": ["len(items)", "total / n"]} replaces it.
+    Both return it evaluated at the current stop, one result per expression
+    with its time in ms; /stream pushes a 'watches' event at every stop."""
+    if request.method == "GET":
+        return jsonify(session.debugger.evaluate_watches())
+    expressions = (request.get_json() or {}).get("expressions", [])
+    if not isinstance(expressions, list) or not all(
+        isinstance(e, str) and e.strip() for e in expressions
+    ):
+        return jsonify({"error": "expressions must be a list of non-empty strings"}), 400
+    return jsonify(session.debugger.set_watch_expressions(expressions))
 
-    highlighted_code = highlight(code, PythonLexer(), HtmlFormatter())
-    
-    if debugger_instance and debugger_instance.is_running:
-        debugger_instance.set_quit()
-        time.sleep(0.5)
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    session, response = start_session()
+    return response
 
-    debugger_instance = WebDebugger()
-    resource_monitor = ResourceMonitor()
-    
-    threading.Thread(
-        target=run_code, 
-        args=(code, debugger_instance, start_line, end_line), 
-        daemon=True
-    ).start()
-    
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
     return jsonify({
-        "message": "Debugger started",
-        "highlighted_code": highlighted_code
+        "sessions": sessions.get_usage(),
+        "max_sessions": sessions.max_sessions
     })
 
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def close_session(session_id):
+    if not sessions.close(session_id):
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    return jsonify({"message": "Session closed"})
+
+@app.route("/sessions/<session_id>/resources", methods=["GET"])
+@with_session
+def get_session_resources(session):
+    return jsonify(session.get_usage())
+
+@app.route("/start", methods=["POST"])
+def start_debugger():
+    global legacy_session_id
+    session, response = start_session()
+    if session is not None:
+        # Replaces the previous single-user session without waiting for it
+        if legacy_session_id is not None:
+            sessions.close(legacy_session_id)
+        legacy_session_id = session.id
+    return response
+
+@app.route("/sessions/<session_id>/status", methods=["GET"])
 @app.route("/status", methods=["GET"])
-def get_status():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-    
-    status = {
-        "is_running": debugger_instance.is_running,
-        "stack_frames": debugger_instance.stack_frames,
-        "variables": debugger_instance.variables,
-        "breakpoints": debugger_instance.breakpoints.get('<string>', {}),
-        "exception": debugger_instance.exception,
-        "output": debugger_instance.output_buffer.getvalue(),
-        "current_line": debugger_instance.current_line,
-        "states": len(debugger_instance.program_states),
-        "current_state": debugger_instance.current_state_index
-    }
-    return jsonify(status)
+@with_session
+def get_status(session):
+    debugger = session.debugger
+    # Taken before building the body: if the state moves on meanwhile, the
+    # client just gets a fresh body on its next poll.
+    etag = debugger.status_etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        since = request.args.get("since", type=int)
+        output_offset = request.args.get("output_offset", 0, type=int)
+        response = jsonify(debugger.get_status(since, output_offset))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
+@app.route("/sessions/<session_id>/stream", methods=["GET"])
+@app.route("/stream", methods=["GET"])
+@with_session
+def stream_status(session):
+    """Server-Sent Events feed of state changes for the session's run."""
+    stream = session.open_stream()
+    return Response(
+        # An open stream counts as activity and ends if the session is closed
+        stream.events(session.touch),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/sessions/<session_id>/variables/<int:frame_index>/<name>", methods=["GET"])
+@app.route("/variables/<int:frame_index>/<name>", methods=["GET"])
+@with_session
+def get_variable(session, frame_index, name):
+    page = request.args.get("page", 0, type=int)
+    page_size = request.args.get("page_size", DEFAULT_PAGE_SIZE, type=int)
+    result = session.debugger.get_variable(frame_index, name, page, page_size)
+    if result is None:
+        return jsonify({"error": f"Variable '{name}' not available"}), 404
+    return jsonify(result)
+
+@app.route("/sessions/<session_id>/breakpoints", methods=["POST"])
 @app.route("/breakpoints", methods=["POST"])
-def set_breakpoints():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-    
+@with_session
+def set_breakpoints(session):
+    """Replace the breakpoints: a list of line numbers or of
+    {"line", "condition", "ignore_count", "log"} objects. With "log" (an
+    f-string body such as "i={i}") the breakpoint is a logpoint: it records
+    the message, read back through GET /breakpoints, instead of stopping."""
+    debugger = session.debugger
     breakpoints = request.json.get("breakpoints", [])
-    debugger_instance.clear_all_breaks()
-    
+    specs = []
     for bp in breakpoints:
         line = bp.get('line') if isinstance(bp, dict) else bp
         condition = bp.get('condition') if isinstance(bp, dict) else None
-        
+        ignore_count = bp.get('ignore_count', 0) if isinstance(bp, dict) else 0
+        log = bp.get('log') if isinstance(bp, dict) else None
+        if not isinstance(ignore_count, int) or ignore_count < 0:
+            return jsonify({"error": f"ignore_count must be a non-negative integer (line {line})"}), 400
         if condition:
-            debugger_instance.set_conditional_break('<string>', line, condition)
+            try:
+                compile_condition(condition)
+            except SyntaxError as e:
+                return jsonify({"error": f"Invalid condition on line {line}: {e.msg}"}), 400
+        if log:
+            try:
+                compile_log_message(log)
+            except SyntaxError as e:
+                return jsonify({"error": f"Invalid log message on line {line}: {e.msg}"}), 400
+        specs.append((line, condition, ignore_count, log))
+
+    debugger.clear_all_breaks()
+    for line, condition, ignore_count, log in specs:
+        if condition or ignore_count or log:
+            debugger.set_conditional_break(debugger.filename, line, condition, ignore_count, log)
         else:
-            debugger_instance.set_break('<string>', line)
+            debugger.set_break(debugger.filename, line)
     
     return jsonify({"message": "Breakpoints set"})
 
 # Add a new route to get breakpoint information
+@app.route("/sessions/<session_id>/breakpoints", methods=["GET"])
 @app.route("/breakpoints", methods=["GET"])
-def get_breakpoints():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-    
-    return jsonify(debugger_instance.get_all_breakpoints())
+@with_session
+def get_breakpoints(session):
+    return jsonify(session.debugger.get_all_breakpoints())
+
+@app.route("/sessions/<session_id>/watchpoints", methods=["GET", "POST"])
+@app.route("/watchpoints", methods=["GET", "POST"])
+@with_session
+def watchpoints(session):
+    """Data watchpoints: POST {"watchpoints": ["total", "self.items"]} stops the
+    program whenever one of those names or attribute paths changes value."""
+    if request.method == "GET":
+        return jsonify(session.debugger.get_watchpoints())
+    expressions = (request.get_json() or {}).get("watchpoints", [])
+    if not isinstance(expressions, list) or not all(isinstance(e, str) for e in expressions):
+        return jsonify({"error": "watchpoints must be a list of names"}), 400
+    try:
+        for expression in expressions:
+            parse_watch_path(expression)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(session.debugger.set_watchpoints(expressions))
 
 
+@app.route("/sessions/<session_id>/control", methods=["POST"])
 @app.route("/control", methods=["POST"])
-def control_execution():
-    global debugger_instance
-    if not debugger_instance:
-        return jsonify({"error": "Debugger not running"}), 400
-    
+@with_session
+def control_execution(session):
+    """Send the paused program a command. step_back, reverse_continue (back
+    to the last stop at a breakpoint) and goto (to program state "state")
+    rewind the program itself when it runs in a worker process; they are
+    refused with 400 when there is no such state to go back to."""
     action = request.json.get("action")
-    valid_actions = ['step', 'step_over', 'continue', 'step_back', 'quit']
+    valid_actions = ['step', 'step_over', 'continue', 'step_back', 'reverse_continue', 'goto', 'quit']
     
     if action not in valid_actions:
         return jsonify({"error": "Invalid action"}), 400
+
+    state = None
+    if action == 'goto':
+        state = request.json.get("state")
+        if not isinstance(state, int) or state < 0:
+            return jsonify({"error": "goto needs a program state index"}), 400
+    if action in ('step_back', 'reverse_continue', 'goto'):
+        if session.debugger.history_target(action, state) is None:
+            return jsonify({"error": f"No program state for '{action}' to go to"}), 400
     
-    debugger_instance.next_command = action
+    session.debugger.post_command(action, state)
     return jsonify({"message": f"Action '{action}' performed"})
 
 
 
 
 
-threading.Thread(target=update_resource_monitor, daemon=True).start()
+threading.Thread(target=evict_idle_sessions, daemon=True).start()
 
 if __name__ == "__main__":
+    sessions.prestart()
     app.run(debug=True, threaded=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,251 @@
+import bdb
+import sys
+import threading
+from .fastpath import ContinueMonitor, MONITORING_AVAILABLE
+
+
+class BackendBusy(RuntimeError):
+    """The backend's process-wide resource is held by another session."""
+
+
+def iter_code_objects(code):
+    """Yield a code object and every code object nested in its constants."""
+    yield code
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            yield from iter_code_objects(const)
+
+
+class SettraceBackend:
+    """Classic bdb backend: sys.settrace drives WebDebugger.dispatch_*.
+
+    Continue uses ContinueMonitor where sys.monitoring is available and
+    otherwise mutes line events in frames without breakpoints.
+    """
+    name = 'settrace'
+
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self.continue_monitor = ContinueMonitor(debugger)
+        self.fast_continue = False
+        self.muted_frames = set()
+
+    def run(self, cmd, globals=None, locals=None):
+        try:
+            bdb.Bdb.run(self.debugger, cmd, globals, locals)
+        finally:
+            self.fast_continue = False
+            self.continue_monitor.stop()
+
+    def set_continue(self, frame):
+        if self.continue_monitor.start(frame):
+            return
+        self.fast_continue = True
+        while frame is not None and frame is not self.debugger.botframe:
+            self.mute_frame(frame)
+            frame = frame.f_back
+
+    def mute_frame(self, frame):
+        if not (self.debugger.traces_lines() or self.debugger.code_has_breaks(frame.f_code)):
+            frame.f_trace_lines = False
+            self.muted_frames.add(frame)
+
+    def unmute_frames(self):
+        for frame in list(self.muted_frames):
+            frame.f_trace_lines = True
+        self.muted_frames.clear()
+
+    def on_pause(self, frame):
+        if self.fast_continue:
+            self.fast_continue = False
+            self.unmute_frames()
+            # Frames entered while not tracing calls ran without a local trace
+            self.debugger.resume_tracing(frame)
+
+    def stop_info_changed(self):
+        pass
+
+    def breakpoints_changed(self):
+        self.unmute_frames()
+        self.continue_monitor.breakpoints_changed()
+
+    def trace_events_changed(self):
+        self.unmute_frames()
+        self.continue_monitor.trace_events_changed()
+
+
+class MonitoringBackend:
+    """sys.monitoring (PEP 669) backend for CPython 3.12+.
+
+    Replaces sys.settrace entirely. PY_START/PY_RETURN feed user_call and
+    user_return for the profiler; LINE is enabled globally only while
+    single-stepping, and otherwise only on the code objects that need it
+    (those with breakpoints, plus the frame being stepped over). The bdb
+    stop state (stopframe/returnframe/stoplineno) is reused as-is, so the
+    debugger's set_step/set_next/set_continue/set_quit work unchanged.
+    """
+    name = 'monitoring'
+    TOOL_NAME = 'relive-debugger'
+    fast_continue = False
+
+    def __init__(self, debugger):
+        if not MONITORING_AVAILABLE:
+            raise RuntimeError("The monitoring backend requires Python 3.12+")
+        self.debugger = debugger
+        self.active = False
+        self._thread_id = None
+        self._codes = []
+        self._line_codes = set()
+
+    def run(self, cmd, globals=None, locals=None):
+        debugger = self.debugger
+        if globals is None:
+            import __main__
+            globals = __main__.__dict__
+        if locals is None:
+            locals = globals
+        debugger.reset()
+        if isinstance(cmd, str):
+            cmd = compile(cmd, "<string>", "exec")
+        self._codes = list(iter_code_objects(cmd))
+
+        monitoring = sys.monitoring
+        tool = monitoring.DEBUGGER_ID
+        try:
+            monitoring.use_tool_id(tool, self.TOOL_NAME)
+        except ValueError:
+            raise BackendBusy("sys.monitoring is in use by another session")
+        events = monitoring.events
+        monitoring.register_callback(tool, events.LINE, self._on_line)
+        monitoring.register_callback(tool, events.PY_START, self._on_start)
+        monitoring.register_callback(tool, events.PY_RESUME, self._on_start)
+        monitoring.register_callback(tool, events.PY_RETURN, self._on_return)
+        monitoring.register_callback(tool, events.PY_YIELD, self._on_return)
+        monitoring.register_callback(tool, events.PY_UNWIND, self._on_unwind)
+        monitoring.register_callback(tool, events.RAISE, self._on_raise)
+
+        self._thread_id = threading.get_ident()
+        # exec() is a C call, so the program's module frame hangs off this one
+        debugger.botframe = sys._getframe()
+        self.active = True
+        self.update_events()
+        try:
+            exec(cmd, globals, locals)
+        except bdb.BdbQuit:
+            pass
+        finally:
+            debugger.quitting = True
+            self.active = False
+            monitoring.set_events(tool, 0)
+            for code in self._line_codes:
+                monitoring.set_local_events(tool, code, 0)
+            self._line_codes = set()
+            monitoring.free_tool_id(tool)
+
+    def set_continue(self, frame):
+        pass
+
+    def on_pause(self, frame):
+        pass
+
+    def stop_info_changed(self):
+        self.update_events()
+
+    def breakpoints_changed(self):
+        self.update_events()
+
+    def trace_events_changed(self):
+        self.update_events()
+
+    def update_events(self):
+        """Enable exactly the events the current stepping mode needs."""
+        if not self.active:
+            return
+        debugger = self.debugger
+        monitoring = sys.monitoring
+        tool = monitoring.DEBUGGER_ID
+        events = monitoring.events
+
+        stepping = debugger.stopframe is None
+        global_events = events.RAISE
+        # Returns matter for stepping over/out; calls only to the profiler
+        if debugger.stopframe is not debugger.botframe or debugger.traces_calls():
+            global_events |= (events.PY_START | events.PY_RESUME | events.PY_RETURN |
+                              events.PY_YIELD | events.PY_UNWIND)
+        if stepping or debugger.traces_lines():
+            global_events |= events.LINE
+        monitoring.set_events(tool, global_events)
+
+        wanted = set()
+        if not stepping:
+            wanted = {code for code in self._codes if debugger.code_has_breaks(code)}
+            if debugger.stopframe is not debugger.botframe:
+                wanted.add(debugger.stopframe.f_code)
+        for code in self._line_codes - wanted:
+            monitoring.set_local_events(tool, code, 0)
+        for code in wanted - self._line_codes:
+            monitoring.set_local_events(tool, code, events.LINE)
+        self._line_codes = wanted
+
+    def _on_line(self, code, line_number):
+        if threading.get_ident() != self._thread_id:
+            return
+        debugger = self.debugger
+        if debugger.line_profiler.enabled:
+            debugger.line_profiler.hit(code.co_filename, line_number)
+            if debugger.stopframe is not None and code not in self._line_codes:
+                # Only here for the profiler: nothing can stop on this line
+                return
+        frame = sys._getframe(1)
+        if debugger.stop_here(frame) or debugger.break_here(frame):
+            debugger.user_line(frame)
+            if debugger.quitting:
+                raise bdb.BdbQuit
+
+    def _on_start(self, code, instruction_offset):
+        if threading.get_ident() != self._thread_id:
+            return
+        self.debugger.user_call(sys._getframe(1), None)
+
+    def _on_return(self, code, instruction_offset, retval):
+        if threading.get_ident() == self._thread_id:
+            self._dispatch_return(sys._getframe(1), retval)
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        if threading.get_ident() == self._thread_id:
+            self._dispatch_return(sys._getframe(1), None)
+
+    def _dispatch_return(self, frame, retval):
+        debugger = self.debugger
+        debugger.user_return(frame, retval)
+        if debugger.quitting:
+            raise bdb.BdbQuit
+        # Mirrors bdb.dispatch_return: after stepping over the last line of
+        # a frame, stop at the next line in its caller.
+        if debugger.stopframe is frame and debugger.stoplineno != -1:
+            debugger._set_stopinfo(None, None)
+
+    def _on_raise(self, code, instruction_offset, exception):
+        if threading.get_ident() != self._thread_id:
+            return
+        debugger = self.debugger
+        frame = sys._getframe(1)
+        if debugger.stop_here(frame):
+            debugger.user_exception(
+                frame, (type(exception), exception, exception.__traceback__)
+            )
+
+
+BACKENDS = {
+    SettraceBackend.name: SettraceBackend,
+    MonitoringBackend.name: MonitoringBackend
+}
+
+
+def create_backend(name, debugger):
+    """Instantiate a tracer backend by name ('settrace', 'monitoring' or 'auto')."""
+    if name == 'auto':
+        name = MonitoringBackend.name if MONITORING_AVAILABLE else SettraceBackend.name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown tracer backend: {name}")
+    return BACKENDS[name](debugger)
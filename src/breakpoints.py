@@ -0,0 +1,263 @@
+from collections import deque
+from .fastpath import code_lines
+from .variables import format_handle, make_handle
+
+# Messages kept per logpoint; older ones are dropped
+LOG_MESSAGES = 1000
+
+
+def compile_condition(condition):
+    """Compile a breakpoint condition; raises SyntaxError if it is not an expression."""
+    return compile(condition, '<breakpoint condition>', 'eval')
+
+
+def compile_log_message(message):
+    """Compile a logpoint message, an f-string body such as "i={i}"; raises SyntaxError."""
+    return compile('f' + repr(message), '<logpoint>', 'eval')
+
+
+def parse_watch_path(expression):
+    """Split a watched name or attribute path ("total", "self.items") into
+    its parts; raises ValueError for anything else."""
+    parts = expression.strip().split('.')
+    if not all(part.isidentifier() for part in parts):
+        raise ValueError(f"Not a name or attribute path: {expression!r}")
+    return tuple(parts)
+
+
+_MISSING = object()
+_UNSEEN = object()
+# Compared by value (cheap for these; NaN by repr, as it never equals itself),
+# or by hash (cached on str and bytes)
+_VALUE_TYPES = {int, bool, type(None), float, complex}
+_HASHED_TYPES = {str, bytes}
+# Mutable in place: small ones are compared item by item, larger ones by
+# identity plus size, which catches appends and removals but not item
+# assignment
+_SIZED_TYPES = {list, dict, set, bytearray, tuple, frozenset}
+CONTENT_ITEMS = 64
+
+
+def _shallow_fingerprint(value):
+    value_type = type(value)
+    if value_type in _VALUE_TYPES:
+        return value_type, value if value == value else repr(value)
+    if value_type in _HASHED_TYPES:
+        return value_type, hash(value)
+    if value_type in _SIZED_TYPES:
+        return id(value), len(value)
+    return id(value),
+
+
+def fingerprint(value):
+    """A cheap stand-in for a value that changes when the value does (mostly):
+    no repr of user objects, and no user code run."""
+    if type(value) in _SIZED_TYPES and len(value) <= CONTENT_ITEMS:
+        if type(value) is bytearray:
+            return id(value), bytes(value)
+        items = value.items() if type(value) is dict else value
+        try:
+            return id(value), tuple(
+                (_shallow_fingerprint(item[0]), _shallow_fingerprint(item[1]))
+                if type(value) is dict else _shallow_fingerprint(item)
+                for item in items
+            )
+        except RuntimeError:
+            # Changed size while being read by another thread
+            return id(value), len(value)
+    return _shallow_fingerprint(value)
+
+
+class LineBreakpoint:
+    """A breakpoint on one line, with an optional condition and ignore count.
+
+    The condition is compiled once, when the breakpoint is set. hits counts
+    every time the line is reached; the program stops there when the
+    condition holds and no ignores are left, each time it holds before
+    that using one up (bdb's semantics). A condition that raises stops the
+    program, and the error is kept.
+
+    With a log message the breakpoint is a logpoint: where it would stop,
+    the message is formatted in the frame and kept (the last LOG_MESSAGES
+    of them, with the hit count) and the program carries on.
+    """
+    __slots__ = ('line', 'condition', 'ignore_count', 'ignores_left', 'hits', 'error',
+                 'log', 'logged', 'messages', '_code', '_log_code')
+
+    def __init__(self, line, condition=None, ignore_count=0, log=None):
+        self.line = line
+        self.condition = condition or None
+        self.ignore_count = ignore_count
+        self.ignores_left = ignore_count
+        self.hits = 0
+        self.error = None
+        self._code = compile_condition(condition) if condition else None
+        self.log = log or None
+        self.logged = 0
+        self.messages = deque(maxlen=LOG_MESSAGES)
+        self._log_code = compile_log_message(log) if log else None
+
+    def hit(self, frame):
+        """Count a visit of frame to this line; whether the program stops."""
+        self.hits += 1
+        if self._code is not None:
+            try:
+                if not eval(self._code, frame.f_globals, frame.f_locals):
+                    return False
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"Error evaluating breakpoint condition: {e}")
+                return True
+        if self.ignores_left > 0:
+            self.ignores_left -= 1
+            return False
+        if self._log_code is None:
+            return True
+        try:
+            text = eval(self._log_code, frame.f_globals, frame.f_locals)
+        except Exception as e:
+            text = f"<{type(e).__name__}: {e}>"
+        self.messages.append((self.hits, text))
+        self.logged += 1
+        return False
+
+    def get_data(self, messages=False):
+        """The breakpoint's settings and counters; with messages, the logged ones too."""
+        data = {
+            'line': self.line,
+            'condition': self.condition,
+            'ignore_count': self.ignore_count,
+            'ignores_left': self.ignores_left,
+            'hits': self.hits,
+            'error': self.error,
+            'log': self.log,
+            'logged': self.logged
+        }
+        if messages and self.log is not None:
+            # list() copies the deque in one step, even while the program appends
+            data['messages'] = [list(entry) for entry in list(self.messages)]
+        return data
+
+
+class Watchpoint:
+    """Stops the program when a name or attribute path changes value.
+
+    Checked on line events, by fingerprint(): an item assigned in a
+    container of more than CONTENT_ITEMS items (lst[0] = 5) is not seen
+    until its size changes or it is rebound. A name resolves in the
+    frame's locals, then its globals; attributes are then read with
+    getattr. The value is compared with the one last seen in any frame,
+    so a local watched in two functions changes as the program moves
+    between them.
+    """
+    __slots__ = ('expression', 'path', 'names', 'hits', 'old_value', 'value', 'line', '_fingerprint')
+
+    def __init__(self, expression):
+        self.path = parse_watch_path(expression)
+        self.expression = '.'.join(self.path)
+        self.names = frozenset(self.path)
+        self.hits = 0
+        self.old_value = None
+        self.value = None
+        self.line = None
+        self._fingerprint = _UNSEEN
+
+    def _resolve(self, frame):
+        name = self.path[0]
+        scope = frame.f_locals
+        if name not in scope:
+            scope = frame.f_globals
+            if name not in scope:
+                return _MISSING
+        value = scope[name]
+        for attribute in self.path[1:]:
+            try:
+                value = getattr(value, attribute)
+            except Exception:
+                return _MISSING
+        return value
+
+    def check(self, frame):
+        """Whether the value changed since it was last seen (the first look
+        only takes its fingerprint)."""
+        value = self._resolve(frame)
+        current = fingerprint(value) if value is not _MISSING else _MISSING
+        previous, self._fingerprint = self._fingerprint, current
+        if current == previous:
+            return False
+        text = format_handle(make_handle(value)) if value is not _MISSING else None
+        if previous is _UNSEEN:
+            self.value = text
+            return False
+        self.hits += 1
+        self.line = frame.f_lineno
+        self.old_value, self.value = self.value, text
+        return True
+
+    def get_data(self):
+        return {
+            'expression': self.expression,
+            'hits': self.hits,
+            'line': self.line,
+            'old_value': self.old_value,
+            'value': self.value
+        }
+
+
+class BreakpointIndex(dict):
+    """(code object, line) -> LineBreakpoint, or None where there is none.
+
+    Filled in a code object at a time on first lookup from breakpoints
+    ({filename: {line: LineBreakpoint}}), so checking a line is a single
+    dict lookup. Each code object's watchpoints (those whose names it
+    uses, by its co_names/co_varnames) are found the same way, so frames
+    of unrelated code are never checked. reset() after the breakpoints or
+    watchpoints change.
+    """
+
+    def __init__(self, breakpoints, canonic, watchpoints=()):
+        super().__init__()
+        self.breakpoints = breakpoints
+        self.canonic = canonic
+        self.watchpoints = watchpoints
+        self._codes = {}
+        self._watches = {}
+        # Names each code object uses; these never change
+        self._names = {}
+
+    def __missing__(self, key):
+        self.has_breaks(key[0])
+        # A line with no instructions of its own (no event should name it)
+        return self.setdefault(key, None)
+
+    def has_breaks(self, code):
+        """Whether any breakpoint falls on a line of code, or it may change a watched value."""
+        found = self._codes.get(code)
+        if found is None:
+            lines = self.breakpoints.get(self.canonic(code.co_filename), {})
+            found = bool(self.watches(code))
+            for line in code_lines(code):
+                breakpoint = lines.get(line)
+                self[code, line] = breakpoint
+                found = found or breakpoint is not None
+            self._codes[code] = found
+        return found
+
+    def watches(self, code):
+        """The watchpoints whose names code uses."""
+        watches = self._watches.get(code)
+        if watches is None:
+            names = self._names.get(code)
+            if names is None:
+                names = self._names[code] = frozenset(
+                    code.co_names + code.co_varnames + code.co_cellvars + code.co_freevars
+                )
+            watches = self._watches[code] = tuple(
+                watch for watch in self.watchpoints if not names.isdisjoint(watch.names)
+            )
+        return watches
+
+    def reset(self):
+        self.clear()
+        self._codes.clear()
+        self._watches.clear()
@@ -0,0 +1,409 @@
+import marshal
+import os
+import random
+import signal
+import struct
+import sys
+import threading
+import time
+import warnings
+from array import array
+from .utils import DEBUGGER_FILES
+
+# fork() of a worker process is the checkpoint; Linux only (macOS cannot
+# safely fork a process that has run threads)
+CHECKPOINTS_AVAILABLE = hasattr(os, 'fork') and sys.platform.startswith('linux')
+# Stops between checkpoints; doubled each time the checkpoints are thinned
+CHECKPOINT_INTERVAL = 25
+# Snapshot processes kept alive at once
+MAX_CHECKPOINTS = 16
+
+# Functions whose results differ between runs of the same program; what the
+# program gets from them is logged and handed back on replay
+NONDETERMINISTIC = (
+    (time, 'time'), (time, 'time_ns'), (time, 'monotonic'), (time, 'monotonic_ns'),
+    (time, 'perf_counter'), (time, 'perf_counter_ns'), (time, 'process_time'),
+    (os, 'urandom'), (os, 'getpid')
+)
+
+_LENGTH = struct.Struct('!Q')
+
+
+def _write_message(fd, data):
+    payload = marshal.dumps(data)
+    view = memoryview(_LENGTH.pack(len(payload)) + payload)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _read_exactly(fd, size):
+    chunks = []
+    while size:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_message(fd):
+    """The next message on fd, or None once the other end is closed."""
+    header = _read_exactly(fd, _LENGTH.size)
+    if header is None:
+        return None
+    payload = _read_exactly(fd, _LENGTH.unpack(header)[0])
+    return None if payload is None else marshal.loads(payload)
+
+
+class InputLog:
+    """Results of the program's nondeterministic calls, in call order.
+
+    The functions in NONDETERMINISTIC are wrapped while installed. A call
+    made on the program's thread on behalf of the program (the innermost
+    non-library frame is the program's, not the debugger's) is appended to
+    values; while replaying, such calls return the logged values instead
+    until replay_end is reached.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.values = []
+        self.position = 0
+        self.replay_end = 0
+        self.thread_id = None
+        self._originals = {}
+
+    def install(self, thread_id):
+        self.thread_id = thread_id
+        for module, name in NONDETERMINISTIC:
+            if (module, name) not in self._originals and hasattr(module, name):
+                function = getattr(module, name)
+                self._originals[module, name] = function
+                setattr(module, name, self._wrap(function))
+
+    def uninstall(self):
+        for (module, name), function in self._originals.items():
+            setattr(module, name, function)
+        self._originals = {}
+
+    def _called_by_program(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename == self.filename:
+                return True
+            if filename.startswith(DEBUGGER_FILES):
+                return False
+            frame = frame.f_back
+        return False
+
+    def _wrap(self, function):
+        def logged(*args):
+            if threading.get_ident() != self.thread_id or not self._called_by_program():
+                return function(*args)
+            if self.position < self.replay_end:
+                value = self.values[self.position]
+            else:
+                value = function(*args)
+                self.values.append(value)
+            self.position += 1
+            return value
+        logged.__wrapped__ = function
+        return logged
+
+    def replay(self, values):
+        """Hand values back, in order, to the calls that follow."""
+        self.position = len(self.values)
+        self.values.extend(values)
+        self.replay_end = len(self.values)
+
+    def stop_replay(self):
+        """Record from the current call on, dropping values not handed back."""
+        del self.values[self.position:]
+        self.replay_end = 0
+
+
+class Checkpoint:
+    """A forked copy of the program paused at a stop, waiting to be resumed."""
+    __slots__ = ('stop', 'pid', 'fd')
+
+    def __init__(self, stop, pid, fd):
+        self.stop = stop
+        self.pid = pid
+        self.fd = fd
+
+    def resume(self, data):
+        """Let the copy take over as the live program; it replays from data."""
+        _write_message(self.fd, data)
+        os.close(self.fd)
+
+    def discard(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        try:
+            os.waitpid(self.pid, 0)
+        except ChildProcessError:
+            # Forked by an earlier live process; init reaps it
+            pass
+        os.close(self.fd)
+
+
+class CheckpointManager:
+    """Reverse execution by checkpoint and replay, for a program run in its own process.
+
+    Every stop of the program (a pause waiting for a command) is numbered.
+    Every interval stops the process forks: the child is a frozen copy of
+    the program at that stop. The commands given at each stop, the
+    breakpoints in effect for them, and the program's nondeterministic
+    inputs (InputLog) are logged. To go back to stop N, the live process
+    hands its connection over to the latest copy at or before N and exits;
+    the copy replays the logged commands and inputs up to N and pauses
+    there. Going back therefore costs at most one checkpoint interval of
+    replay, not a re-run from the start.
+
+    The hosting worker supplies handover(resume), which stops serving
+    requests, calls resume() and exits the live process, and takeover(),
+    which starts serving in a resumed copy. locks are held across fork()
+    so the copy never inherits them mid-update.
+    """
+
+    def __init__(self, debugger, handover, takeover, locks=(),
+                 interval=CHECKPOINT_INTERVAL, max_checkpoints=MAX_CHECKPOINTS):
+        self.debugger = debugger
+        self.handover = handover
+        self.takeover = takeover
+        self.locks = [debugger._lock, debugger._command_ready, *locks]
+        self.interval = interval
+        self.max_checkpoints = max_checkpoints
+        self.inputs = InputLog(debugger.filename)
+        # Index of the current stop
+        self.stop = -1
+        # (command, breakpoints) given at each stop
+        self.commands = []
+        self.stop_lines = array('I')
+        # Inputs consumed by the program before each stop
+        self.input_marks = array('Q')
+        # Stop of each saved program state, by absolute state index
+        self.state_stops = array('Q')
+        self.checkpoints = []
+        # While replaying: the stop to pause at, and the lines the stops
+        # from the checkpoint on had
+        self.replay_until = None
+        self._expected_lines = ()
+        self._replay_start = 0
+        self._user_breakpoints = ((), ())
+        # Stop at which the last replay took a different path, if any
+        self.diverged = None
+
+    def start(self, thread_id):
+        self.inputs.install(thread_id)
+
+    def finish(self):
+        """The program ended: drop the snapshots and stop logging."""
+        self.inputs.uninstall()
+        for checkpoint in self.checkpoints:
+            checkpoint.discard()
+        self.checkpoints = []
+
+    @property
+    def replaying(self):
+        return self.replay_until is not None
+
+    def on_stop(self, line, state_index):
+        """Number a new stop; state_index is the absolute index of the state
+        saved for it, if one was. Takes a checkpoint when one is due."""
+        self.stop += 1
+        self.stop_lines.append(line)
+        self.input_marks.append(self.inputs.position)
+        if state_index is not None:
+            del self.state_stops[state_index:]
+            self.state_stops.append(self.stop)
+
+        if self.replaying:
+            offset = self.stop - self._replay_start
+            if offset < len(self._expected_lines) and self._expected_lines[offset] != line:
+                # The program took another path (an input that was not
+                # logged); pause here instead
+                self.diverged = self.stop
+                self._end_replay()
+
+        last = self.checkpoints[-1].stop if self.checkpoints else None
+        if last is None or self.stop - last >= self.interval:
+            if not self._threads_run_program():
+                self._take_checkpoint()
+
+    def _threads_run_program(self):
+        """Whether threads besides this one run the program's code; fork()
+        would not copy them, so no checkpoint is taken meanwhile."""
+        current = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            while thread_id != current and frame is not None:
+                if frame.f_code.co_filename == self.debugger.filename:
+                    return True
+                frame = frame.f_back
+        return False
+
+    def _take_checkpoint(self):
+        data = self._fork()
+        while data is not None:
+            # This copy is now the live program
+            self._resume(data)
+            # The snapshot it was is spent: take a fresh one of this stop
+            data = self._fork()
+            if data is None:
+                self.takeover()
+
+    def _fork(self):
+        """Fork a snapshot. Returns None in the live process and, in the
+        snapshot, the data it is resumed with (it exits if never resumed)."""
+        read_fd, write_fd = os.pipe()
+        # random reseeds itself in forked children
+        random_state = random.getstate()
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            with warnings.catch_warnings():
+                # Forking with threads running: only this one is needed
+                warnings.simplefilter('ignore', DeprecationWarning)
+                pid = os.fork()
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+        if pid:
+            os.close(read_fd)
+            self.checkpoints.append(Checkpoint(self.stop, pid, write_fd))
+            self._thin()
+            return None
+
+        os.close(write_fd)
+        random.setstate(random_state)
+        data = _read_message(read_fd)
+        if data is None:
+            os._exit(0)
+        os.close(read_fd)
+        return data
+
+    def _thin(self):
+        """Keep at most max_checkpoints snapshots, evenly spread: drop every
+        other one (never the first) and double the interval."""
+        if len(self.checkpoints) <= self.max_checkpoints:
+            return
+        kept = self.checkpoints[:1]
+        for index, checkpoint in enumerate(self.checkpoints[1:], 1):
+            if index % 2:
+                checkpoint.discard()
+            else:
+                kept.append(checkpoint)
+        self.checkpoints = kept
+        self.interval *= 2
+
+    def restore(self, stop):
+        """Rewind the program to an earlier stop. Does not return in this
+        process if it can; False if no checkpoint precedes that stop."""
+        candidates = [c for c in self.checkpoints if c.stop <= stop]
+        if not candidates or stop >= self.stop:
+            return False
+        checkpoint = candidates[-1]
+        start = checkpoint.stop
+        debugger = self.debugger
+        data = {
+            'stop': stop,
+            'commands': self.commands[start:stop],
+            'lines': self.stop_lines[start:stop + 1].tolist(),
+            'inputs': self.inputs.values[self.input_marks[start]:self.input_marks[stop]],
+            'breakpoints': self._breakpoints(),
+            'watches': list(debugger.watch_expressions),
+            'checkpoints': [c.stop for c in candidates],
+            'interval': self.interval,
+            'version': debugger.state_version,
+            'output_end': debugger.output_buffer.size
+        }
+        # Later snapshots belong to the timeline being abandoned
+        for later in self.checkpoints[len(candidates):]:
+            later.discard()
+        self.checkpoints = candidates[:-1]
+        self.handover(lambda: checkpoint.resume(data))
+        return True
+
+    def _resume(self, data):
+        # This process has the checkpoint list of when it was forked; keep
+        # the snapshots the live process still had
+        live = set(data['checkpoints'])
+        kept = []
+        for checkpoint in self.checkpoints:
+            if checkpoint.stop in live:
+                kept.append(checkpoint)
+            else:
+                os.close(checkpoint.fd)
+        self.checkpoints = kept
+        self.interval = data['interval']
+        del self.commands[self.stop:]
+        self.commands.extend(data['commands'])
+        self.inputs.replay(data['inputs'])
+        self._replay_start = self.stop
+        self._expected_lines = data['lines']
+        self._user_breakpoints = data['breakpoints']
+        self.debugger.watch_expressions = data['watches']
+        self.diverged = None
+        self.replay_until = data['stop']
+        self.debugger.rewound(data['version'], data['output_end'])
+
+    def next_command(self):
+        """The logged command to replay at this stop, or None if not replaying."""
+        if not self.replaying:
+            return None
+        if self.stop < self.replay_until:
+            command, breakpoints = self.commands[self.stop]
+            self._apply_breakpoints(breakpoints)
+            return command
+        self._end_replay()
+        return None
+
+    def _end_replay(self):
+        self.replay_until = None
+        self._expected_lines = ()
+        del self.commands[self.stop:]
+        self.inputs.stop_replay()
+        self._apply_breakpoints(self._user_breakpoints)
+        self.debugger._bump_version()
+
+    def record_command(self, command):
+        """Log the command the user gave at the current stop."""
+        del self.commands[self.stop:]
+        self.commands.append((command, self._breakpoints()))
+
+    def _breakpoints(self):
+        # As set: a replay re-counts hits and ignores from the checkpoint on
+        debugger = self.debugger
+        breakpoints = debugger.breakpoints.get(debugger.filename, {})
+        return (
+            tuple(
+                (line, breakpoint.condition, breakpoint.ignore_count, breakpoint.log)
+                for line, breakpoint in sorted(breakpoints.items())
+            ),
+            tuple(watch.expression for watch in debugger.watchpoints)
+        )
+
+    def _apply_breakpoints(self, spec):
+        current = self._breakpoints()
+        debugger = self.debugger
+        breakpoints, watchpoints = spec
+        if breakpoints != current[0]:
+            debugger.clear_all_breaks()
+            for line, condition, ignore_count, log in breakpoints:
+                debugger.set_conditional_break(debugger.filename, line, condition, ignore_count, log)
+        if watchpoints != current[1]:
+            debugger.set_watchpoints(watchpoints)
+
+    def get_info(self):
+        return {
+            'checkpoints': len(self.checkpoints),
+            'checkpoint_interval': self.interval,
+            'stop': self.stop,
+            'replaying': self.replaying,
+            'diverged_at': self.diverged
+        }
@@ -1,20 +1,44 @@
 import bdb  # Changed from 'from bdb import Bdb' to 'import bdb'
-import inspect
+import builtins
 import sys
-import time
 import threading
-import copy
-from pygments import highlight
-from pygments.lexers import PythonLexer
-from pygments.formatters import HtmlFormatter
-from .utils import OutputBuffer, ProgramState
-from .profiler import PerformanceProfiler
+from collections import deque, OrderedDict
+from .utils import (
+    OutputBuffer, ProgramState, diff_scope, diff_stack, redirect_process_output,
+    redirect_thread_output
+)
+from .profiler import PerformanceProfiler, SamplingProfiler, LineProfiler, MIN_SAMPLE_INTERVAL
 from .tracker import ExecutionTracker
 from .evaluator import CodeEvaluator
+from .history import SnapshotStore, frame_key
+from .breakpoints import LineBreakpoint, BreakpointIndex, Watchpoint
+from .memory import MemoryProfiler
+from .source import SourceCache
+from .backends import create_backend, BackendBusy, SettraceBackend
+from .variables import capture_scope, format_handle, short_repr, render_value, DEFAULT_PAGE_SIZE
+
+# Rendered stack/variables kept per served version, so /status?since= can diff
+STATUS_CACHE_SIZE = 16
+PROFILE_MODES = ('deterministic', 'sampling')
+# Commands that move back through the history, and those replayed from it
+REVERSE_COMMANDS = ('step_back', 'reverse_continue', 'goto')
+FORWARD_COMMANDS = ('step', 'step_over', 'continue')
+# Frames from bdb and this package are the debugger's own, not the program's
+_INTERNAL_PACKAGE = __name__.rpartition('.')[0]
 
 class WebDebugger(bdb.Bdb):  # Changed from Bdb to bdb.Bdb
-    def __init__(self):
-        super().__init__()
+    def __init__(self, backend='settrace', filename='<string>', history_bytes=None):
+        # Never stop inside the debugger's own modules (output buffer, etc.)
+        super().__init__(skip=[__package__ + '.*'])
+        # Bdb.__init__ copies in every breakpoint in the process, those of
+        # other sessions' programs too; this debugger only tracks its own
+        self.breaks = {}
+        self.backend = create_backend(backend, self)
+        # Name the debugged program is compiled and registered under; sessions
+        # sharing a process each need their own (bdb and linecache are global)
+        self.filename = filename
+        # {filename: {line: LineBreakpoint}}; bdb's own self.breaks is kept in
+        # step but only the index below decides where the program stops
         self.breakpoints = {}
         self.stack_frames = []
         self.variables = {}
@@ -24,97 +48,286 @@ class WebDebugger(bdb.Bdb):  # Changed from Bdb to bdb.Bdb
         self.step_over_depth = None
         self.is_running = False
         self._lock = threading.Lock()
-        self.stored_stdout = None   
-        self.stored_stderr = None
-        self.next_command = None
+        self._commands = deque()
+        self._command_ready = threading.Condition()
+        self.is_paused = False
+        # Bumped (under _command_ready) whenever the visible state changes
+        self.state_version = 0
         self.current_line = None
-        self.program_states = []
+        if history_bytes is None:
+            self.program_states = SnapshotStore()
+        else:
+            self.program_states = SnapshotStore(max_bytes=history_bytes)
         self.current_state_index = -1
-        self.max_states = 100
         self.selected_code = None
         self.selected_range = None
         self.execution_tracker = ExecutionTracker()
-        self.profiler = PerformanceProfiler()
-        self.conditional_breakpoints = {}
+        self.profilers = {
+            'deterministic': PerformanceProfiler(),
+            'sampling': SamplingProfiler()
+        }
+        self.profiler = self.profilers['deterministic']
+        self.line_profiler = LineProfiler(filename)
+        self.memory_profiler = MemoryProfiler(filename)
+        self._thread_id = None
         self.evaluator = CodeEvaluator(self)
+        self.sources = SourceCache()
+        self.watchpoints = []
+        # Watchpoints that changed at the current stop
+        self.triggered_watchpoints = []
+        # Bumped when breakpoints or watchpoints are set or cleared
+        self.breakpoints_revision = 0
+        # Expressions evaluated together at every stop (see evaluate_watches)
+        self.watch_expressions = []
+        self._watch_results = None
+        # One evaluation of the watch list per stop, however many clients ask
+        self._watch_lock = threading.Lock()
+        self._break_index = BreakpointIndex(self.breakpoints, self.canonic, self.watchpoints)
+        self._status_cache = OrderedDict()
+        # CheckpointManager when the program runs in a process of its own;
+        # otherwise going back only shows the recorded state
+        self.checkpoints = None
+        # Whether the program has this process to itself (a session worker)
+        self.owns_process = False
         
     def break_here(self, frame):
-        filename = frame.f_code.co_filename
-        lineno = frame.f_lineno
+        """Whether a breakpoint stops the program at frame's current line.
 
-        # First check if there's a breakpoint at this line
-        if not super().break_here(frame):
-            return False
+        One lookup in the (code, line) index decides for lines without a
+        breakpoint; bdb's Breakpoint bookkeeping (which re-evaluates
+        condition strings) is bypassed.
+        """
+        breakpoint = self._break_index[frame.f_code, frame.f_lineno]
+        if breakpoint is not None and breakpoint.hit(frame):
+            return True
+        if self.watchpoints:
+            return self._watch_changed(frame)
+        return False
+
+    def _watch_changed(self, frame):
+        # Every watchpoint is checked so all of them see the new values
+        changed = [watch for watch in self._break_index.watches(frame.f_code) if watch.check(frame)]
+        if changed:
+            self.triggered_watchpoints = [watch.get_data() for watch in changed]
+        return bool(changed)
+
+    def set_watchpoints(self, expressions):
+        """Stop whenever one of these names or attribute paths changes value
+        (replacing the watchpoints set before); raises ValueError for an
+        expression that is neither."""
+        watchpoints = [Watchpoint(expression) for expression in expressions]
+        with self._lock:
+            self.watchpoints[:] = watchpoints
+            if self.current_frame is not None:
+                # Changes are counted from the values at this stop
+                for watch in watchpoints:
+                    watch.check(self.current_frame)
+        self._breakpoints_changed()
+        return self.get_watchpoints()
+
+    def get_watchpoints(self):
+        return [watch.get_data() for watch in self.watchpoints]
+
+    def break_anywhere(self, frame):
+        # Only frames whose own code has a breakpoint need tracing
+        return self._break_index.has_breaks(frame.f_code)
 
-        # If there's a condition, evaluate it
-        if filename in self.conditional_breakpoints and lineno in self.conditional_breakpoints[filename]:
-            condition = self.conditional_breakpoints[filename][lineno]
-            try:
-                # Evaluate condition in the current frame's context
-                result = eval(condition, frame.f_globals, frame.f_locals)
-                return bool(result)
-            except Exception as e:
-                print(f"Error evaluating breakpoint condition: {e}")
-                return True  # Break anyway if condition evaluation fails
-        
-        return True
-    
     def get_break_info(self, filename, lineno):
         """Get information about a specific breakpoint."""
-        if self.get_break(filename, lineno):
-            condition = None
-            if (filename in self.conditional_breakpoints and 
-                lineno in self.conditional_breakpoints[filename]):
-                condition = self.conditional_breakpoints[filename][lineno]
-            return {
-                'line': lineno,
-                'condition': condition
-            }
+        breakpoint = self.breakpoints.get(self.canonic(filename), {}).get(lineno)
+        return breakpoint.get_data(messages=True) if breakpoint is not None else None
+
+    def set_conditional_break(self, filename, lineno, condition=None, ignore_count=0, log=None):
+        """Set a breakpoint with an optional condition (compiled here; raises
+        SyntaxError) that stops only after ignore_count times its condition held.
+        With log it is a logpoint, recording that message instead of stopping."""
+        breakpoint = LineBreakpoint(lineno, condition, ignore_count, log)
+        filename = self.canonic(filename)
+        if lineno not in self.breaks.get(filename, ()):
+            error = super().set_break(filename, lineno)
+            if error:
+                return error
+        self.breakpoints.setdefault(filename, {})[lineno] = breakpoint
+        self._breakpoints_changed()
         return None
-    
-    def set_conditional_break(self, filename, lineno, condition=None):
-        """Set a breakpoint with an optional condition."""
-        self.set_break(filename, lineno)
-        
-        if condition:
-            if filename not in self.conditional_breakpoints:
-                self.conditional_breakpoints[filename] = {}
-            self.conditional_breakpoints[filename][lineno] = condition
-        elif filename in self.conditional_breakpoints:
-            # Remove condition if setting a regular breakpoint
-            self.conditional_breakpoints[filename].pop(lineno, None)
 
     def clear_conditional_break(self, filename, lineno):
         """Clear a conditional breakpoint."""
-        self.clear_break(filename, lineno)
-        if filename in self.conditional_breakpoints:
-            self.conditional_breakpoints[filename].pop(lineno, None)
-            
+        return self.clear_break(filename, lineno)
+
     def clear_break(self, filename, lineno):
         """Clear both the breakpoint and any associated condition."""
-        super().clear_break(filename, lineno)
-        if filename in self.conditional_breakpoints:
-            self.conditional_breakpoints[filename].pop(lineno, None)
+        error = super().clear_break(filename, lineno)
+        self.breakpoints.get(self.canonic(filename), {}).pop(lineno, None)
+        self._breakpoints_changed()
+        return error
+
+    def set_break(self, filename, lineno, temporary=False, cond=None, funcname=None):
+        return self.set_conditional_break(filename, lineno, cond)
+
+    def clear_all_breaks(self):
+        # bdb.Bdb.clear_all_breaks deletes every Breakpoint in the process,
+        # including other sessions'; only clear this debugger's own, and
+        # skip any already deleted along with a closed session
+        for filename, lines in self.breaks.items():
+            for line in lines:
+                for breakpoint in bdb.Breakpoint.bplist.get((filename, line), [])[:]:
+                    breakpoint.deleteMe()
+        self.breaks.clear()
+        self.breakpoints.clear()
+        self._breakpoints_changed()
+        return None
+
+    def _breakpoints_changed(self):
+        self.breakpoints_revision += 1
+        self._break_index.reset()
+        self.backend.breakpoints_changed()
+
+    def code_has_breaks(self, code):
+        """Whether any breakpoint falls on a line of this code object (cached)."""
+        return self._break_index.has_breaks(code)
+
+    def set_continue(self):
+        """Run to the next breakpoint without per-line tracing where possible.
+
+        The settrace backend hands over to sys.monitoring on Python 3.12+ and
+        otherwise switches line events off (f_trace_lines) in every frame
+        whose code has no breakpoint, leaving only call/return events. The
+        monitoring backend simply narrows its LINE events to breakpoints.
+        """
+        self._set_stopinfo(self.botframe, None, -1)
+        self.backend.set_continue(self.current_frame)
+
+    def _set_stopinfo(self, *args, **kwargs):
+        super()._set_stopinfo(*args, **kwargs)
+        self.backend.stop_info_changed()
+
+    def resume_tracing(self, frame):
+        """Re-install the settrace hooks on a stack that ran without them."""
+        while frame is not None and frame is not self.botframe:
+            frame.f_trace = self.trace_dispatch
+            frame = frame.f_back
+        sys.settrace(self.trace_dispatch)
+
+    def dispatch_call(self, frame, arg):
+        if not self.backend.fast_continue or self.botframe is None:
+            return super().dispatch_call(frame, arg)
+        self.record_call(frame)
+        if self.quitting:
+            raise bdb.BdbQuit
+        if not (self.traces_calls() or self.traces_lines() or self.code_has_breaks(frame.f_code)):
+            # Neither its lines nor its return are needed: leave it untraced
+            return None
+        self.backend.mute_frame(frame)
+        return self.trace_dispatch
+
+    def dispatch_line(self, frame):
+        if self.line_profiler.enabled:
+            self.line_profiler.hit(frame.f_code.co_filename, frame.f_lineno)
+        return super().dispatch_line(frame)
+
+    def dispatch_return(self, frame, arg):
+        if not self.backend.fast_continue:
+            return super().dispatch_return(frame, arg)
+        self.record_return(frame)
+        self.backend.muted_frames.discard(frame)
+        if self.quitting:
+            raise bdb.BdbQuit
+        return self.trace_dispatch
+
+    def run(self, cmd, globals=None, locals=None):
+        with self._lock:
+            self._thread_id = threading.get_ident()
+            self.line_profiler.reset(len(self.sources.get_file(self.filename).lines))
+            if self.profiler.mode == 'sampling':
+                self.profiler.start(self._sample_stack, self._lock)
+            if self.checkpoints is not None:
+                self.checkpoints.start(self._thread_id)
+        try:
+            self.backend.run(cmd, globals, locals)
+        except BackendBusy:
+            # sys.monitoring hosts one debugger per process; later sessions trace
+            self.backend = SettraceBackend(self)
+            self.backend.run(cmd, globals, locals)
+        finally:
+            with self._lock:
+                self._thread_id = None
+                if self.line_profiler.enabled:
+                    self.line_profiler.finish()
+            self.profilers['sampling'].stop()
+            if self.checkpoints is not None:
+                self.checkpoints.finish()
+
+    def run_source(self, code, start_line=None, end_line=None):
+        """Debug a program given as source, optionally only lines start_line..end_line."""
+        try:
+            self.setup_io()
+            self.set_running(True)
+
+            if start_line is not None and end_line is not None:
+                self.selected_range = (start_line, end_line)
+                code_lines = code.split('\n')
+                self.selected_code = '\n'.join(code_lines[start_line-1:end_line])
+                compiled_code = compile(self.selected_code, self.filename, 'exec')
+            else:
+                self.selected_range = None
+                self.selected_code = None
+                compiled_code = compile(code, self.filename, 'exec')
+
+            self.sources.register(self.filename, self.selected_code or code)
+
+            # A fresh namespace per run, rather than the server's own __main__
+            namespace = {'__name__': '__main__', '__builtins__': builtins}
+            self.run(compiled_code, namespace)
+        except Exception as e:
+            self.exception = str(e)
+            print(f"Exception occurred: {str(e)}")
+        finally:
+            self.restore_io()
+            self.set_running(False)
+
+    def get_usage(self):
+        """Session-level counters for resource accounting."""
+        return {
+            'backend': self.backend.name,
+            'is_running': self.is_running,
+            'is_paused': self.is_paused,
+            'states': len(self.program_states),
+            'history_bytes': self.program_states.nbytes,
+            'output_chars': self.output_buffer.size,
+            'reverse': self.checkpoints.get_info() if self.checkpoints is not None else None
+        }
 
     def get_all_breakpoints(self):
-        """Get all breakpoints including their conditions."""
-        result = {}
-        for filename, lines in self.breakpoints.items():
-            result[filename] = {}
-            for lineno in lines:
-                condition = None
-                if (filename in self.conditional_breakpoints and 
-                    lineno in self.conditional_breakpoints[filename]):
-                    condition = self.conditional_breakpoints[filename][lineno]
-                result[filename][lineno] = {'condition': condition}
-        return result
+        """Get all breakpoints with their conditions, ignore counts, hits and logged messages."""
+        return {
+            filename: {line: breakpoint.get_data(messages=True) for line, breakpoint in lines.items()}
+            for filename, lines in self.breakpoints.items()
+        }
 
     def user_line(self, frame):
+        # Time spent here (capturing state and waiting for the user) is not
+        # the program's, so keep it out of the profile
+        profilers = [*self.profilers.values(), self.line_profiler, self.memory_profiler]
+        for profiler in profilers:
+            profiler.pause()
+        try:
+            self._pause_at_line(frame)
+        finally:
+            for profiler in profilers:
+                profiler.resume()
+
+    def _pause_at_line(self, frame):
+        self.backend.on_pause(frame)
         with self._lock:
             self.current_frame = frame
             self.current_line = frame.f_lineno
             self.stack_frames = self._get_stack_frames()
             self.variables = self._get_variables(frame)
+            if self.watchpoints:
+                # Stepping does not go through break_here: catch up with this line
+                for watch in self._break_index.watches(frame.f_code):
+                    watch.check(frame)
             
             code = self._get_line_code(frame)
             self.execution_tracker.add_execution_step(
@@ -123,147 +336,536 @@ class WebDebugger(bdb.Bdb):  # Changed from Bdb to bdb.Bdb
                 'line'
             )
             
+            state_index = None
             if not self.selected_range or (
                 self.current_line >= self.selected_range[0] and 
                 self.current_line <= self.selected_range[1]
             ):
                 self._save_state()
-            
-            while self.is_running and not self.next_command:
-                time.sleep(0.1)
-            
-            if self.next_command:
-                command = self.next_command
-                self.next_command = None
-                
-                if command == 'step':
-                    self.set_step()
-                elif command == 'step_over':
-                    self.set_next(frame)
-                elif command == 'continue':
-                    self.set_continue()
-                elif command == 'step_back':
-                    self._restore_previous_state()
-                elif command == 'quit':
-                    self.set_quit()
+                state_index = self.program_states.evicted + self.current_state_index
+
+        checkpoints = self.checkpoints
+        command = None
+        if checkpoints is not None:
+            # May fork a checkpoint here; a checkpoint that is resumed later
+            # carries on from this point, replaying commands up to its target
+            checkpoints.on_stop(frame.f_lineno, state_index)
+            command = checkpoints.next_command()
+        if command is None:
+            # Wait outside self._lock so status reads and call/return
+            # bookkeeping are never blocked by a paused program.
+            command, arg = self._wait_for_command()
+            while command in REVERSE_COMMANDS:
+                self._go_back(command, arg)
+                command, arg = self._wait_for_command()
+            if checkpoints is not None and command in FORWARD_COMMANDS:
+                checkpoints.record_command(command)
+        if self.triggered_watchpoints:
+            self.triggered_watchpoints = []
+            self.breakpoints_revision += 1
+
+        if command == 'step':
+            self.set_step()
+        elif command == 'step_over':
+            self.set_next(frame)
+        elif command == 'continue':
+            self.set_continue()
+        elif command == 'quit':
+            self.set_quit()
+
+    def post_command(self, command, arg=None):
+        """Queue a control command and wake the paused debuggee."""
+        with self._command_ready:
+            self._commands.append((command, arg))
+            self._command_ready.notify_all()
+
+    def _wait_for_command(self):
+        with self._command_ready:
+            self.is_paused = True
+            self.state_version += 1
+            self._command_ready.notify_all()
+            while self.is_running and not self._commands:
+                self._command_ready.wait()
+            self.is_paused = False
+            return self._commands.popleft() if self._commands else (None, None)
+
+    def wait_for_pause(self, timeout=None):
+        """Block until the debuggee is paused waiting for a command or has finished."""
+        with self._command_ready:
+            return self._command_ready.wait_for(
+                lambda: (self.is_paused and not self._commands) or not self.is_running,
+                timeout
+            )
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until state_version moves past version; False on timeout."""
+        with self._command_ready:
+            return self._command_ready.wait_for(
+                lambda: self.state_version != version,
+                timeout
+            )
+
+    def set_running(self, running):
+        with self._command_ready:
+            self.is_running = running
+            self.state_version += 1
+            self._command_ready.notify_all()
+
+    def _bump_version(self):
+        with self._command_ready:
+            self.state_version += 1
+            self._command_ready.notify_all()
+
+    def status_etag(self):
+        """Validator for everything /status reports: state version, breakpoint
+        revision and counters, and output position."""
+        output = self.output_buffer
+        # Hits (and with them ignores and log counts) move while the program runs
+        breakpoints = list(self.breakpoints.get(self.filename, {}).values())
+        hits = sum(breakpoint.hits for breakpoint in breakpoints)
+        return (
+            f"{id(self):x}-{self.state_version}-{self.breakpoints_revision}-{hits}"
+            f"-{output.start}-{output.size}"
+        )
+
+    def get_status(self, since=None, output_offset=0):
+        """Build the /status payload.
+
+        With since (a version from an earlier response) the stack and
+        variables are sent as diffs against what that response contained:
+        'stack' holds the changed frames keyed by index from the outermost
+        frame, and 'variables' a {'changed', 'removed'} pair per scope. If that
+        version is no longer cached the full lists are sent and 'delta' is
+        False. Output is always the tail written after output_offset.
+        """
+        version = self.state_version
+        with self._lock:
+            stack = self.render_stack_frames()
+            variables = self.render_variables()
+            status = {
+                "version": version,
+                "is_running": self.is_running,
+                "breakpoints": {
+                    line: breakpoint.get_data()
+                    for line, breakpoint in self.breakpoints.get(self.filename, {}).items()
+                },
+                "exception": self.exception,
+                "current_line": self.current_line,
+                "states": len(self.program_states),
+                "current_state": self.current_state_index,
+                "triggered_watchpoints": self.triggered_watchpoints
+            }
+
+            self._status_cache[version] = (stack, variables)
+            self._status_cache.move_to_end(version)
+            while len(self._status_cache) > STATUS_CACHE_SIZE:
+                self._status_cache.popitem(last=False)
+            base = self._status_cache.get(since) if since is not None else None
+
+        if base is None:
+            status.update(delta=False, stack_frames=stack, variables=variables)
+        else:
+            base_stack, base_variables = base
+            status.update(
+                delta=True,
+                stack=diff_stack(base_stack[::-1], stack[::-1]),
+                variables={
+                    scope: diff_scope(base_variables.get(scope, {}), variables.get(scope, {}))
+                    for scope in ('locals', 'globals')
+                }
+            )
+
+        start, text = self.output_buffer.read_from(output_offset)
+        status.update(output=text, output_offset=start, output_end=start + len(text))
+        return status
 
     def evaluate_code(self, code, line_number=None):
         return self.evaluator.evaluate(code, line_number)
 
+    def set_watch_expressions(self, expressions):
+        """Replace the watch list and evaluate it at the current stop."""
+        with self._watch_lock:
+            self.watch_expressions = list(expressions)
+            self._watch_results = None
+        return self.evaluate_watches()
+
+    def evaluate_watches(self):
+        """The watch list evaluated in the current frame, once per state version:
+        {'version', 'results'}, results as from CodeEvaluator.evaluate_many. Only
+        while paused; a running program's frame is not read."""
+        with self._watch_lock:
+            version = self.state_version
+            cached = self._watch_results
+            if cached is not None and cached['version'] == version:
+                return cached
+            if not self.is_paused:
+                return {'version': version, 'results': []}
+            watches = {'version': version, 'results': self.evaluator.evaluate_many(self.watch_expressions)}
+            self._watch_results = watches
+            return watches
+
     def user_return(self, frame, return_value):
-        with self._lock:
-            if frame.f_code.co_name != '<module>':
-                self.profiler.end_function(frame.f_code.co_name)
-                self.execution_tracker.remove_function_call(frame.f_code.co_name)
-            super().user_return(frame, return_value)
+        self.record_return(frame)
+        super().user_return(frame, return_value)
 
     def get_profile_data(self):
         """Get profiling data for visualization"""
-        return self.profiler.get_profile_data()
+        with self._lock:
+            data = self.profiler.get_profile_data()
+            if self.memory_profiler.enabled:
+                peaks = self.memory_profiler.function_peaks
+                for entry in data['function_times'].values():
+                    key = (entry['file'], entry['qualname'], entry['line'])
+                    entry['peak_memory'] = peaks.get(key, 0)
+            return data
+
+    def set_profile_mode(self, mode, interval=None):
+        """Switch between deterministic and sampling profiling, also mid-run.
+
+        Each mode keeps its own results; get_profile_data reports the
+        current one. interval sets the sampling period in seconds.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        sampler = self.profilers['sampling']
+        if interval is not None:
+            if interval < MIN_SAMPLE_INTERVAL:
+                raise ValueError(f"Sample interval must be at least {MIN_SAMPLE_INTERVAL}s")
+            sampler.interval = interval
+        with self._lock:
+            if mode == self.profiler.mode:
+                return {'mode': mode, 'interval': sampler.interval}
+            if mode == 'deterministic':
+                # Calls made while sampling were not recorded
+                self.profilers['deterministic'].clear_stack()
+            self.profiler = self.profilers[mode]
+            if mode == 'sampling' and self._thread_id is not None:
+                sampler.start(self._sample_stack, self._lock)
+        if mode == 'deterministic':
+            sampler.stop()
+        self.backend.trace_events_changed()
+        return {'mode': mode, 'interval': sampler.interval}
+
+    def set_line_profiling(self, enabled):
+        """Turn per-line hit counts and timing on or off, also mid-run.
+
+        While on, continuing keeps line events flowing through every frame,
+        so the program runs slower than a plain continue.
+        """
+        with self._lock:
+            self.line_profiler.set_enabled(bool(enabled))
+        self.backend.trace_events_changed()
+        return self.get_line_profile()
+
+    def get_line_profile(self):
+        with self._lock:
+            return self.line_profiler.get_line_data()
+
+    def set_memory_profiling(self, enabled):
+        """Turn tracemalloc-based allocation profiling on or off, also mid-run.
+
+        Only states saved while it is on can be diffed, and per-function
+        peaks are only recorded in deterministic profile mode.
+        """
+        with self._lock:
+            self.memory_profiler.set_enabled(bool(enabled))
+        return self.get_memory_profile()
+
+    def get_memory_profile(self):
+        with self._lock:
+            return self.memory_profiler.get_memory_data()
+
+    def diff_memory_states(self, old_index, new_index):
+        """Per-line memory change between two program_states indexes."""
+        with self._lock:
+            evicted = self.program_states.evicted
+            return self.memory_profiler.diff_states(evicted + old_index, evicted + new_index)
+
+    def get_variable_history(self, name, scope='locals', query='values', state=None, op='==', value=None):
+        """Answer a query about one variable from the recorded history.
+
+        'values' lists every write up to state (all of them by default),
+        'last_write' the write that gave the variable its value at state,
+        and 'first_match' the first state from state on at which the value
+        compares to value with op. state defaults to the current state for
+        'last_write' and to 0 for 'first_match'. Indexes are program_states
+        indexes; writes made before the oldest kept state are reported at 0.
+        Locals are those of the innermost frame at state (at the current
+        state when it is not given). None if the variable was never recorded.
+        """
+        with self._lock:
+            index = self.program_states.variable_index
+            frame = None
+            if scope == 'locals':
+                shown = self.current_state_index if state is None else state
+                if not 0 <= shown < len(self.program_states):
+                    return None
+                frame = frame_key(self.program_states[shown].stack_frames)
+            key = index.key(scope, name, frame)
+            if key not in index:
+                return None
+            evicted = self.program_states.evicted
+            if state is None:
+                state = self.current_state_index if query == 'last_write' else None
+            at = evicted + state if state is not None else None
+
+            def write(entry):
+                written, text, value_type = entry
+                return {
+                    'state': max(written - evicted, 0),
+                    'value': text,
+                    'type': value_type,
+                    'deleted': text is None
+                }
+
+            result = {'name': name, 'scope': scope, 'query': query}
+            if frame is not None:
+                result['function'] = frame[1]
+            if query == 'values':
+                result['writes'] = [write(entry) for entry in index.changes(key, end=at)]
+            elif query == 'last_write':
+                entry = index.last_write(key, at)
+                result['write'] = write(entry) if entry is not None else None
+            elif query == 'first_match':
+                found = index.first_match(key, op, value, evicted if at is None else at)
+                result['state'] = found - evicted if found is not None else None
+            else:
+                raise ValueError(f"Unknown history query: {query}")
+            return result
+
+    def _sample_stack(self):
+        """Code objects on the program's stack, outermost first (for the sampler)."""
+        frame = sys._current_frames().get(self._thread_id)
+        codes = []
+        while frame is not None and frame is not self.botframe:
+            code = frame.f_code
+            if code.co_name == '<module>' and code.co_filename == self.filename:
+                break
+            module = frame.f_globals.get('__name__', '')
+            internal = module == 'bdb' or module.startswith(_INTERNAL_PACKAGE + '.')
+            if not internal and self._is_counted(frame):
+                codes.append(code)
+            frame = frame.f_back
+        codes.reverse()
+        # Calls are not traced while sampling, so the call graph is fed from here
+        caller = '<module>'
+        for code in codes:
+            self.execution_tracker.add_call_edge(caller, code.co_name)
+            caller = code.co_name
+        return codes
+
+    def get_profile_export(self, format='speedscope'):
+        """The profile as a speedscope document or collapsed-stack text."""
+        with self._lock:
+            if format == 'speedscope':
+                return self.profiler.to_speedscope()
+            if format == 'collapsed':
+                return self.profiler.to_collapsed()
+        raise ValueError(f"Unknown profile format: {format}")
             
     def user_call(self, frame, argument_list):
+        self.record_call(frame)
+        super().user_call(frame, argument_list)
+
+    def traces_calls(self):
+        """Whether call/return events are wanted while continuing (deterministic profiling)."""
+        return self.profiler.mode == 'deterministic'
+
+    def traces_lines(self):
+        """Whether every line event is wanted while continuing (line profiling)."""
+        return self.line_profiler.enabled
+
+    def _is_counted(self, frame):
+        if frame.f_code.co_name == '<module>':
+            return False
+        return not (self.skip and self.is_skipped_module(frame.f_globals.get('__name__')))
+
+    def record_call(self, frame):
+        """Update the profiler and call graph for a call event."""
+        if self.profiler.mode != 'deterministic' or not self._is_counted(frame):
+            return
+        with self._lock:
+            self.profiler.start_function(frame)
+            if self.memory_profiler.enabled:
+                self.memory_profiler.start_function(frame)
+            caller_name = '<module>'
+            if frame.f_back:
+                caller_name = frame.f_back.f_code.co_name
+            self.execution_tracker.add_function_call(
+                caller_name,
+                frame.f_code.co_name
+            )
+
+    def record_return(self, frame):
+        """Update the profiler and call graph for a return event."""
+        if self.profiler.mode != 'deterministic' or not self._is_counted(frame):
+            return
         with self._lock:
-            if frame.f_code.co_name != '<module>':
-                self.profiler.start_function(
-                    frame.f_code.co_name,
-                    frame.f_lineno
-                )
-                caller_name = '<module>'
-                if frame.f_back:
-                    caller_name = frame.f_back.f_code.co_name
-                self.execution_tracker.add_function_call(
-                    caller_name,
-                    frame.f_code.co_name
-                )
-            super().user_call(frame, argument_list)
+            self.profiler.end_function(frame)
+            if self.memory_profiler.enabled:
+                self.memory_profiler.end_function(frame)
+            self.execution_tracker.remove_function_call(frame.f_code.co_name)
             
     def _get_line_code(self, frame):
-        try:
-            lines, start = inspect.getsourcelines(frame.f_code)
-            return lines[frame.f_lineno - start]
-        except:
-            return ""
+        return self.sources.get_line(frame.f_code.co_filename, frame.f_lineno)
             
-    def get_visualization_data(self):
+    def get_visualization_data(self, flowchart='cfg'):
         """Get visualization data for frontend"""
-        return {
-            'execution_flowchart': self.execution_tracker.get_execution_flowchart(),
-            'call_graph': self.execution_tracker.get_call_graph()
-        }
+        with self._lock:
+            return {
+                'execution_flowchart': self.execution_tracker.get_execution_flowchart(flowchart),
+                'call_graph': self.execution_tracker.get_call_graph()
+            }
 
     def user_exception(self, frame, exc_info):
         exc_type, exc_value, exc_traceback = exc_info
         self.exception = f"{exc_type.__name__}: {str(exc_value)}"
+        self._bump_version()
 
     def _get_stack_frames(self):
         stack = []
         frame = self.current_frame
-        while frame:
+        while frame and frame is not self.botframe:
             source_context = self._get_source_context(frame)
             stack.append({
                 'file': frame.f_code.co_filename,
                 'line': frame.f_lineno,
                 'function': frame.f_code.co_name,
-                'locals': {k: repr(v) for k, v in frame.f_locals.items()},
-                'globals': {k: repr(v) for k, v in frame.f_globals.items() 
-                           if not k.startswith('__')},
+                'locals': capture_scope(frame.f_locals),
                 'source': source_context
             })
             frame = frame.f_back
         return stack
 
     def _get_source_context(self, frame, context_lines=3):
-        try:
-            lines, start = inspect.getsourcelines(frame.f_code)
-            current_line = frame.f_lineno - start
-            start_line = max(0, current_line - context_lines)
-            end_line = min(len(lines), current_line + context_lines + 1)
-            source_lines = lines[start_line:end_line]
-            highlighted_source = highlight(''.join(source_lines), PythonLexer(), HtmlFormatter())
-            return {
-                'lines': highlighted_source,
-                'start_line': start + start_line,
-                'current_line': frame.f_lineno
-            }
-        except:
-            return None
+        return self.sources.get_context(frame.f_code, frame.f_lineno, context_lines)
 
     def _save_state(self):
         state = ProgramState()
-        state.variables = copy.deepcopy(self.variables)
-        state.stack_frames = copy.deepcopy(self.stack_frames)
+        state.variables = self.variables
+        state.stack_frames = self.stack_frames
         state.current_line = self.current_line
-        state.output = self.output_buffer.getvalue()
+        state.output_end = self.output_buffer.size
         
         self.program_states.append(state)
         self.current_state_index = len(self.program_states) - 1
-        
-        if len(self.program_states) > self.max_states:
-            self.program_states.pop(0)
-            self.current_state_index -= 1
-
-    def _restore_previous_state(self):
-        if self.current_state_index > 0:
-            self.current_state_index -= 1
-            state = self.program_states[self.current_state_index]
-            self.variables = state.variables
-            self.stack_frames = state.stack_frames
-            self.current_line = state.current_line
+        if self.memory_profiler.enabled:
+            self.memory_profiler.record_state(self.program_states.evicted + self.current_state_index)
+
+    def _go_back(self, command, arg):
+        """Move to an earlier state: the previous one (step_back), the last
+        one at a breakpoint (reverse_continue) or state arg (goto).
+
+        With checkpoints the program itself is rewound to that state and
+        this does not return; otherwise only the recorded state is shown,
+        and the program carries on from where it really is.
+        """
+        with self._lock:
+            index = self._history_target(command, arg)
+            if index is None:
+                return
+            if self.checkpoints is not None:
+                stop = self.checkpoints.state_stops[self.program_states.evicted + index]
+            else:
+                stop = None
+        if stop is not None and self.checkpoints.restore(stop):
+            return
+        with self._lock:
+            self._show_state(index)
+
+    def history_target(self, command, arg=None):
+        """The state index step_back, reverse_continue or goto (to state arg)
+        would move to now, or None if there is none."""
+        with self._lock:
+            return self._history_target(command, arg)
+
+    def _history_target(self, command, arg):
+        current = self.current_state_index
+        if command == 'step_back':
+            return current - 1 if current > 0 else None
+        if command == 'goto':
+            if isinstance(arg, int) and 0 <= arg < len(self.program_states) and arg != current:
+                return arg
+            return None
+        lines = self.breaks.get(self.filename, ())
+        for index in range(current - 1, -1, -1):
+            if self.program_states[index].current_line in lines:
+                return index
+        return 0 if current > 0 else None
+
+    def _show_state(self, index):
+        self.current_state_index = index
+        state = self.program_states[index]
+        self.variables = state.variables
+        self.stack_frames = state.stack_frames
+        self.current_line = state.current_line
+
+    def rewound(self, version, output_end):
+        """This process is a checkpoint taking over from the live program, whose
+        clients have seen up to state version and output offset output_end."""
+        with self._command_ready:
+            self.state_version = version + 1
+        self.output_buffer.renumber(output_end)
+        self.profilers['sampling'].after_fork()
 
     def _get_variables(self, frame):
         return {
-            'locals': {k: repr(v) for k, v in frame.f_locals.items()},
-            'globals': {k: repr(v) for k, v in frame.f_globals.items() 
-                       if not k.startswith('__')}
+            'locals': capture_scope(frame.f_locals),
+            'globals': capture_scope(frame.f_globals, skip_dunder=True)
+        }
+
+    def _is_live_state(self):
+        # A running program's frame is changing under us: only read it
+        # while the program waits for a command
+        return (self.is_paused and self.current_frame is not None and
+                self.current_state_index == len(self.program_states) - 1)
+
+    def render_variables(self):
+        """Render the variables panel, using bounded reprs of live objects when possible."""
+        if self._is_live_state():
+            frame = self.current_frame
+            return {
+                'locals': {k: short_repr(v) for k, v in frame.f_locals.items()},
+                'globals': {k: short_repr(v) for k, v in frame.f_globals.items()
+                           if not k.startswith('__')}
+            }
+        return {
+            scope: {k: format_handle(handle) for k, handle in handles.items()}
+            for scope, handles in self.variables.items()
         }
 
+    def render_stack_frames(self):
+        """Render stack frames with handle previews in place of full reprs."""
+        return [
+            dict(frame, locals={k: format_handle(handle) for k, handle in frame['locals'].items()})
+            for frame in self.stack_frames
+        ]
+
+    def get_variable(self, frame_index, name, page=0, page_size=DEFAULT_PAGE_SIZE):
+        """Render a single variable of a live frame in full, with paging for containers."""
+        if not self._is_live_state():
+            return None
+        frame = self.current_frame
+        for _ in range(frame_index):
+            frame = frame.f_back if frame else None
+        if frame is None:
+            return None
+        if name in frame.f_locals:
+            value = frame.f_locals[name]
+        elif name in frame.f_globals:
+            value = frame.f_globals[name]
+        else:
+            return None
+        return render_value(value, page, page_size)
+
     def setup_io(self):
-        self.stored_stdout = sys.stdout
-        self.stored_stderr = sys.stderr
-        sys.stdout = self.output_buffer
-        sys.stderr = self.output_buffer
+        # Per-thread redirection, so concurrent sessions keep their own output
+        redirect_thread_output(self.output_buffer)
+        if self.owns_process:
+            # Output of threads started some other way (_thread, C code) too
+            redirect_process_output(self.output_buffer)
 
     def restore_io(self):
-        if self.stored_stdout and self.stored_stderr:
-            sys.stdout = self.stored_stdout
-            sys.stderr = self.stored_stderr
\ No newline at end of file
+        redirect_thread_output(None)
+        if self.owns_process:
+            redirect_process_output(None)
\ No newline at end of file
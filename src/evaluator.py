@@ -1,84 +1,205 @@
 import ast
+import threading
+import time
+from collections import ChainMap, OrderedDict
+from .utils import OutputBuffer, redirect_thread_output
+
+# Compiled sources kept, least recently used dropped first
+CODE_CACHE_SIZE = 256
+# Results of pure expressions kept for the current program state
+RESULT_CACHE_SIZE = 128
+
+# Nodes that make an expression impure: it calls code or assigns
+_IMPURE_NODES = (ast.Call, ast.NamedExpr, ast.Await, ast.Yield, ast.YieldFrom)
+
+
+class _GlobalsOverlay(dict):
+    """Globals for evaluated code: reads fall through to the program's
+    globals, writes (including `global` statements) stay here."""
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+
+    def __missing__(self, name):
+        return self.base[name]
+
+
+class _Compiled:
+    """A source compiled once: its code, whether it is an expression, whether
+    that expression is pure (no calls or assignments), and every name its
+    code objects can store to."""
+    __slots__ = ('code', 'is_expression', 'pure', 'names')
+
+    def __init__(self, source):
+        try:
+            tree = ast.parse(source, mode='eval')
+            self.is_expression = True
+        except SyntaxError:
+            tree = ast.parse(source, mode='exec')
+            self.is_expression = False
+        self.code = compile(tree, '<evaluate>', 'eval' if self.is_expression else 'exec')
+        self.pure = self.is_expression and not any(
+            isinstance(node, _IMPURE_NODES) for node in ast.walk(tree)
+        )
+        self.names = frozenset(_code_names(self.code))
+
+
+def _code_names(code):
+    yield from code.co_names
+    for constant in code.co_consts:
+        if hasattr(constant, 'co_names'):
+            yield from _code_names(constant)
+
 
 class CodeEvaluator:
+    """Evaluates expressions and statements in the paused program's frame.
+
+    Sources are compiled once and cached. Evaluated code sees the frame's
+    variables through overlays instead of copies: names it assigns land in
+    the overlay, so the program's own variables are left alone, and only
+    those names (the ones its code can store to) are reported as side
+    effects. Results of pure expressions are cached until the program
+    state changes or a statement or impure expression runs.
+    """
+
     def __init__(self, debugger):
         self.debugger = debugger
-        
+        self._lock = threading.Lock()
+        self._codes = OrderedDict()
+        self._results = OrderedDict()
+        self._results_version = None
+
     def dedent_code(self, code):
         """Remove common leading indentation from code."""
         lines = code.splitlines()
         content_lines = [line for line in lines if line.strip()]
         if not content_lines:
             return code
-            
+
         min_indent = min(len(line) - len(line.lstrip()) for line in content_lines)
-        
+
         dedented_lines = []
         for line in lines:
-            if line.strip():  
+            if line.strip():
                 dedented_lines.append(line[min_indent:])
             else:
                 dedented_lines.append('')
-                
+
         return '\n'.join(dedented_lines)
-        
+
+    def _compile(self, code):
+        with self._lock:
+            compiled = self._codes.get(code)
+            if compiled is not None:
+                self._codes.move_to_end(code)
+                return compiled
+        compiled = _Compiled(self.dedent_code(code))
+        with self._lock:
+            self._codes[code] = compiled
+            while len(self._codes) > CODE_CACHE_SIZE:
+                self._codes.popitem(last=False)
+        return compiled
+
+    def _cached_result(self, code, version):
+        with self._lock:
+            if self._results_version != version:
+                self._results.clear()
+                self._results_version = version
+            return self._results.get(code)
+
+    def _cache_result(self, code, version, result):
+        with self._lock:
+            if self._results_version == version:
+                self._results[code] = result
+                while len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+
+    def _invalidate_results(self):
+        with self._lock:
+            self._results.clear()
+
     def evaluate(self, code, line_number=None):
+        version = self.debugger.state_version
+        cached = self._cached_result(code, version)
+        if cached is not None:
+            return cached
+        # Output is routed per thread, so capture this request thread's prints
+        output = OutputBuffer()
+        redirect_thread_output(output)
+        try:
+            return self._evaluate(code, version, output)
+        finally:
+            redirect_thread_output(None)
+
+    def evaluate_many(self, codes):
+        """Evaluate each source in turn against the same frame; one result per
+        source, with its 'expression' and the milliseconds it took ('elapsed')."""
+        results = []
+        for code in codes:
+            start = time.perf_counter()
+            result = self.evaluate(code)
+            results.append(dict(
+                result,
+                expression=code,
+                elapsed=round((time.perf_counter() - start) * 1000, 3)
+            ))
+        return results
+
+    def _evaluate(self, code, version, output):
         try:
-            dedented_code = self.dedent_code(code)
-            if self.debugger.current_frame:
-                local_vars = dict(self.debugger.current_frame.f_locals)
-                global_vars = dict(self.debugger.current_frame.f_globals)
+            compiled = self._compile(code)
+            frame = self.debugger.current_frame
+            if frame is not None:
+                frame_locals = frame.f_locals
+                frame_globals = frame.f_globals
             else:
-                local_vars = {}
-                global_vars = {}
-            
-            self.debugger.output_buffer.clear()
-            
-            try:
-                tree = ast.parse(dedented_code, mode='eval')
-                result = eval(dedented_code, global_vars, local_vars)
-                return {
-                    'result': repr(result),
-                    'output': self.debugger.output_buffer.getvalue(),
-                    'type': 'expression',
-                    'side_effects': self.detect_side_effects(local_vars, global_vars)
-                }
-            except SyntaxError:
-                tree = ast.parse(dedented_code, mode='exec')
-                exec(dedented_code, global_vars, local_vars)
-                return {
-                    'result': None,
-                    'output': self.debugger.output_buffer.getvalue(),
-                    'type': 'statement',
-                    'side_effects': self.detect_side_effects(local_vars, global_vars)
+                frame_locals = {}
+                frame_globals = {}
+            global_vars = _GlobalsOverlay(frame_globals)
+            # Names resolve as in the frame: its locals, then its globals
+            local_vars = ChainMap({}, frame_locals, frame_globals)
+
+            if not compiled.pure:
+                # The program's objects may be changed from here on
+                self._invalidate_results()
+            if compiled.is_expression:
+                result = {
+                    'result': repr(eval(compiled.code, global_vars, local_vars)),
+                    'type': 'expression'
                 }
-                
+            else:
+                exec(compiled.code, global_vars, local_vars)
+                result = {'result': None, 'type': 'statement'}
+            result.update(
+                output=output.getvalue(),
+                side_effects=self.detect_side_effects(
+                    compiled.names, local_vars.maps[0], global_vars, frame_locals, frame_globals
+                )
+            )
         except Exception as e:
             return {
                 'error': str(e),
-                'output': self.debugger.output_buffer.getvalue(),
+                'output': output.getvalue(),
                 'type': 'error'
             }
+        if compiled.pure and not output.size:
+            self._cache_result(code, version, result)
+        return result
 
-    def detect_side_effects(self, new_locals, new_globals):
+    def detect_side_effects(self, names, new_locals, new_globals, old_locals, old_globals):
+        """Names the evaluated code bound, out of those its code can store to;
+        compared by identity, so no user __eq__ runs."""
         side_effects = []
-        
-        if self.debugger.current_frame:
-            old_locals = self.debugger.current_frame.f_locals
-            old_globals = self.debugger.current_frame.f_globals
-            
-            for key in new_locals:
-                if key in old_locals:
-                    if new_locals[key] != old_locals[key]:
-                        side_effects.append(f"Modified local variable: {key}")
-                else:
-                    side_effects.append(f"New local variable: {key}")
-            
-            for key in new_globals:
-                if key in old_globals:
-                    if new_globals[key] != old_globals[key]:
-                        side_effects.append(f"Modified global variable: {key}")
-                else:
-                    side_effects.append(f"New global variable: {key}")
-                    
-        return side_effects
\ No newline at end of file
+        for name in sorted(names):
+            if name in new_locals:
+                if name not in old_locals:
+                    side_effects.append(f"New local variable: {name}")
+                elif new_locals[name] is not old_locals[name]:
+                    side_effects.append(f"Modified local variable: {name}")
+            if name in new_globals and name != '__builtins__':
+                if name not in old_globals:
+                    side_effects.append(f"New global variable: {name}")
+                elif dict.__getitem__(new_globals, name) is not old_globals[name]:
+                    side_effects.append(f"Modified global variable: {name}")
+        return side_effects
@@ -0,0 +1,119 @@
+import bdb
+import dis
+import sys
+import threading
+
+MONITORING_AVAILABLE = hasattr(sys, 'monitoring')
+
+
+def code_lines(code):
+    """Return the set of line numbers that have instructions in a code object."""
+    # Module code starts with a RESUME on line 0 in 3.11+; skip it too
+    return {line for _, line in dis.findlinestarts(code) if line}
+
+
+class ContinueMonitor:
+    """Run-to-breakpoint mode built on sys.monitoring (PEP 669, Python 3.12+).
+
+    While continuing, sys.settrace is switched off entirely. LINE events are
+    delivered only until a location reports it has no breakpoint (the
+    callback returns DISABLE) unless lines are being profiled, and PY_START/PY_RETURN keep the debugger's
+    call counters up to date (unless the debugger does not trace calls). When a breakpoint is hit the debugger's
+    settrace machinery is re-installed on the stack and stepping resumes.
+    """
+    TOOL_NAME = 'relive-debugger'
+
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self.active = False
+        self._thread_id = None
+
+    def start(self, frame):
+        """Switch to monitoring for the thread owning frame; False if unavailable."""
+        if not MONITORING_AVAILABLE:
+            return False
+        monitoring = sys.monitoring
+        tool = monitoring.DEBUGGER_ID
+        try:
+            monitoring.use_tool_id(tool, self.TOOL_NAME)
+        except ValueError:
+            # Another session is already continuing under sys.monitoring
+            return False
+
+        events = monitoring.events
+        monitoring.register_callback(tool, events.LINE, self._on_line)
+        monitoring.register_callback(tool, events.PY_START, self._on_start)
+        monitoring.register_callback(tool, events.PY_RETURN, self._on_return)
+        monitoring.register_callback(tool, events.PY_UNWIND, self._on_unwind)
+
+        self._thread_id = threading.get_ident()
+        self.active = True
+
+        sys.settrace(None)
+        while frame is not None and frame is not self.debugger.botframe:
+            frame.f_trace = None
+            frame = frame.f_back
+
+        self._set_events()
+        monitoring.restart_events()
+        return True
+
+    def _set_events(self):
+        events = sys.monitoring.events
+        wanted = events.LINE
+        if self.debugger.traces_calls():
+            wanted |= events.PY_START | events.PY_RETURN | events.PY_UNWIND
+        sys.monitoring.set_events(sys.monitoring.DEBUGGER_ID, wanted)
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        monitoring = sys.monitoring
+        monitoring.set_events(monitoring.DEBUGGER_ID, 0)
+        monitoring.free_tool_id(monitoring.DEBUGGER_ID)
+
+    def breakpoints_changed(self):
+        """Re-enable line locations disabled before the breakpoints changed."""
+        if self.active:
+            sys.monitoring.restart_events()
+
+    def trace_events_changed(self):
+        if self.active:
+            self._set_events()
+            # Lines disabled while nobody needed them may be wanted now
+            sys.monitoring.restart_events()
+
+    def _on_line(self, code, line_number):
+        debugger = self.debugger
+        has_breaks = debugger.code_has_breaks(code)
+        if not (has_breaks or debugger.line_profiler.enabled):
+            return sys.monitoring.DISABLE
+        if threading.get_ident() != self._thread_id:
+            return None
+        if debugger.line_profiler.enabled:
+            debugger.line_profiler.hit(code.co_filename, line_number)
+        if not has_breaks:
+            return None
+
+        frame = sys._getframe(1)
+        if debugger.break_here(frame):
+            self.stop()
+            debugger.resume_tracing(frame)
+            debugger.set_step()
+            debugger.user_line(frame)
+            if debugger.quitting:
+                raise bdb.BdbQuit
+        return None
+
+    def _on_start(self, code, instruction_offset):
+        if threading.get_ident() == self._thread_id:
+            self.debugger.record_call(sys._getframe(1))
+
+    def _on_return(self, code, instruction_offset, retval):
+        if threading.get_ident() == self._thread_id:
+            self.debugger.record_return(sys._getframe(1))
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        if threading.get_ident() == self._thread_id:
+            self.debugger.record_return(sys._getframe(1))
@@ -0,0 +1,359 @@
+import ast
+import operator
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from .utils import ProgramState
+from .variables import format_handle
+
+# Rough per-entry bookkeeping cost (path tuple + dict slot) used for budgeting
+_ENTRY_OVERHEAD = 96
+
+_MISSING = object()
+_EMPTY_DICT = ('<empty dict>',)
+_EMPTY_LIST = ('<empty list>',)
+
+# Comparisons VariableIndex.first_match accepts
+COMPARISONS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge
+}
+
+
+def _flatten(value, path, out):
+    """Flatten nested dicts/lists into a {path: leaf} mapping.
+
+    List positions are recorded relative to the end of the list so that the
+    bottom of a call stack keeps the same path when new frames are pushed.
+    """
+    if isinstance(value, dict):
+        if not value:
+            out[path] = _EMPTY_DICT
+        for key, item in value.items():
+            _flatten(item, path + (str(key),), out)
+    elif isinstance(value, list):
+        if not value:
+            out[path] = _EMPTY_LIST
+        size = len(value)
+        for i, item in enumerate(value):
+            _flatten(item, path + (i - size,), out)
+    else:
+        out[path] = value
+    return out
+
+
+def _unflatten(flat):
+    """Rebuild the nested structure produced by _flatten."""
+    root = {}
+    for path, leaf in flat.items():
+        node = root
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        if leaf is _EMPTY_DICT:
+            leaf = {}
+        elif leaf is _EMPTY_LIST:
+            leaf = []
+        node[path[-1]] = leaf
+    return _listify(root)
+
+
+def _listify(node):
+    if not isinstance(node, dict):
+        return node
+    if node and all(isinstance(key, int) for key in node):
+        return [_listify(node[key]) for key in sorted(node)]
+    return {key: _listify(item) for key, item in node.items()}
+
+
+def _leaf_size(leaf):
+    return sys.getsizeof(leaf) + _ENTRY_OVERHEAD
+
+
+def _literal(text):
+    """The value a display text stands for, or the text itself if it is not a literal."""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return text
+
+
+class _Changes:
+    """Writes to one variable: parallel lists of state indexes (ascending)
+    and display texts (None where the variable went out of scope), plus the
+    state indexes at which each text was written."""
+    __slots__ = ('states', 'values', 'types', 'by_value')
+
+    def __init__(self):
+        self.states = array('Q')
+        self.values = []
+        self.types = []
+        self.by_value = {}
+
+    def add(self, index, handle):
+        text = format_handle(handle) if handle is not None else None
+        self.states.append(index)
+        self.values.append(text)
+        self.types.append(handle['type'] if handle is not None else None)
+        if text is not None:
+            self.by_value.setdefault(text, array('Q')).append(index)
+
+    def position(self, index):
+        """Position of the last write at or before state index, or -1."""
+        return bisect_right(self.states, index) - 1
+
+
+def frame_key(stack_frames):
+    """Identifies the innermost frame of a recorded stack (innermost first)
+    across states: its file, function and depth."""
+    if not stack_frames:
+        return None
+    frame = stack_frames[0]
+    return frame.get('file'), frame.get('function'), len(stack_frames)
+
+
+class VariableIndex:
+    """Per-variable change log of the recorded states, for history queries.
+
+    Each state's variables are compared with those last seen in the same
+    scope, and every name whose handle changed (rebound, mutated in size,
+    or gone) is logged with the state index. Globals are logged under
+    ('globals', name). Locals are logged per frame, under ('locals', frame,
+    name) with frame a frame_key(), and compared with that frame's own
+    last values: a call does not delete the caller's locals and a return
+    does not write them again. Lookups bisect these logs, so "what was x
+    at state N" or "when did x first equal 60" costs O(log changes)
+    instead of a walk through the snapshots.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._changes = {}
+
+    @staticmethod
+    def key(scope, name, frame=None):
+        return (scope, frame, name) if scope == 'locals' else (scope, name)
+
+    def record(self, index, variables, frame=None):
+        for scope, names in variables.items():
+            last_key = (scope, frame) if scope == 'locals' else scope
+            last = self._last.get(last_key, {})
+            for name, handle in names.items():
+                if last.get(name) != handle:
+                    self._log(self.key(scope, name, frame), index, handle)
+            for name in last:
+                if name not in names:
+                    self._log(self.key(scope, name, frame), index, None)
+            self._last[last_key] = names
+
+    def _log(self, key, index, handle):
+        changes = self._changes.get(key)
+        if changes is None:
+            changes = self._changes[key] = _Changes()
+        changes.add(index, handle)
+
+    def trim(self, first):
+        """Forget writes made before state first, except the one still in
+        effect there."""
+        for key, changes in list(self._changes.items()):
+            position = changes.position(first)
+            if position <= 0:
+                continue
+            if changes.values[position] is None and position == len(changes.states) - 1:
+                del self._changes[key]
+                continue
+            del changes.states[:position]
+            del changes.values[:position]
+            del changes.types[:position]
+            start = changes.states[0]
+            for text, states in list(changes.by_value.items()):
+                del states[:bisect_left(states, start)]
+                if not states:
+                    del changes.by_value[text]
+
+    def clear(self):
+        self._last = {}
+        self._changes = {}
+
+    def __contains__(self, key):
+        return key in self._changes
+
+    def changes(self, key, start=0, end=None):
+        """(state, text, type) of each write to the variable key() names,
+        from the one in effect at start up to end."""
+        changes = self._changes.get(key)
+        if changes is None:
+            return []
+        first = max(changes.position(start), 0)
+        last = len(changes.states) if end is None else changes.position(end) + 1
+        return [
+            (changes.states[i], changes.values[i], changes.types[i])
+            for i in range(first, last)
+        ]
+
+    def last_write(self, key, index):
+        """(state, text, type) of the write that gave the variable its value at
+        state index, or None if it had not been written yet."""
+        changes = self._changes.get(key)
+        position = changes.position(index) if changes is not None else -1
+        if position < 0:
+            return None
+        return changes.states[position], changes.values[position], changes.types[position]
+
+    def first_match(self, key, op, value, start=0):
+        """First state from start on at which the variable's value compares to
+        value (a literal, or display text) with op; None if there is none.
+
+        '==' is a lookup in the per-text index. The ordering operators
+        compare literal values and look at each write from start on.
+        """
+        changes = self._changes.get(key)
+        if changes is None:
+            return None
+        compare = COMPARISONS[op]
+        wanted = _literal(value) if isinstance(value, str) else value
+        position = max(changes.position(start), 0)
+
+        if op == '==':
+            text = value if isinstance(value, str) and wanted is value else repr(wanted)
+            current = changes.values[position]
+            if current == text and changes.states[position] <= start:
+                return start
+            states = changes.by_value.get(text)
+            if not states:
+                return None
+            found = bisect_left(states, start)
+            return states[found] if found < len(states) else None
+
+        for i in range(position, len(changes.states)):
+            text = changes.values[i]
+            if text is None:
+                continue
+            try:
+                matched = compare(_literal(text), wanted)
+            except TypeError:
+                continue
+            if matched:
+                return max(changes.states[i], start)
+        return None
+
+
+class _Segment:
+    """A keyframe followed by up to keyframe_interval - 1 deltas."""
+    __slots__ = ('keyframe', 'deltas', 'nbytes')
+
+    def __init__(self, keyframe):
+        self.keyframe = keyframe
+        self.deltas = []
+        self.nbytes = sum(_leaf_size(leaf) for leaf in keyframe.values())
+
+    def __len__(self):
+        return 1 + len(self.deltas)
+
+
+class SnapshotStore:
+    """Delta-encoded, memory-bounded history of ProgramState snapshots.
+
+    Every keyframe_interval-th state is stored in full; the states in
+    between only record the entries that changed since the previous state.
+    Output is not copied: each state keeps the output buffer's offset at
+    that point (output_end), to read back with OutputBuffer.read_from. When the estimated size exceeds
+    max_bytes, the oldest keyframe and its deltas are dropped together.
+    variable_index logs the writes to each variable, by absolute state
+    index (evicted + position).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, keyframe_interval=50):
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self._segments = deque()
+        self._last = None
+        self._length = 0
+        self.nbytes = 0
+        self.evicted = 0
+        self.variable_index = VariableIndex()
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self[i]
+
+    def append(self, state):
+        """Record a ProgramState, evicting the oldest segment if over budget."""
+        flat = _flatten({
+            'variables': state.variables,
+            'stack_frames': state.stack_frames,
+            'current_line': state.current_line,
+            'timestamp': state.timestamp,
+            'output_end': state.output_end
+        }, (), {})
+        self.variable_index.record(
+            self.evicted + self._length, state.variables, frame_key(state.stack_frames)
+        )
+
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or len(segment) >= self.keyframe_interval:
+            segment = _Segment(flat)
+            self._segments.append(segment)
+            added = segment.nbytes
+        else:
+            last = self._last
+            changed = {}
+            for path, leaf in flat.items():
+                previous = last.get(path, _MISSING)
+                if previous is not leaf and previous != leaf:
+                    changed[path] = leaf
+            removed = tuple(path for path in last if path not in flat)
+            segment.deltas.append((changed, removed))
+            added = sum(_leaf_size(leaf) for leaf in changed.values())
+            added += _ENTRY_OVERHEAD * (len(removed) + 1)
+            segment.nbytes += added
+
+        self._last = flat
+        self._length += 1
+        self.nbytes += added
+
+        evicted_before = self.evicted
+        while self.nbytes > self.max_bytes and len(self._segments) > 1:
+            evicted = self._segments.popleft()
+            self.nbytes -= evicted.nbytes
+            self._length -= len(evicted)
+            self.evicted += len(evicted)
+        if self.evicted != evicted_before:
+            self.variable_index.trim(self.evicted)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("state index out of range")
+
+        segment = self._segments[index // self.keyframe_interval]
+        position = index % self.keyframe_interval
+
+        flat = dict(segment.keyframe)
+        for changed, removed in segment.deltas[:position]:
+            flat.update(changed)
+            for path in removed:
+                del flat[path]
+
+        data = _unflatten(flat)
+        state = ProgramState()
+        state.variables = data.get('variables', {})
+        state.stack_frames = data.get('stack_frames', [])
+        state.current_line = data.get('current_line')
+        state.timestamp = data.get('timestamp')
+        state.output_end = data.get('output_end', 0)
+        return state
+
+    def clear(self):
+        self._segments.clear()
+        self._last = None
+        self._length = 0
+        self.nbytes = 0
+        self.variable_index.clear()
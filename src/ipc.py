@@ -0,0 +1,27 @@
+import marshal
+import struct
+
+# Every message is one length-delimited frame on a multiprocessing pipe
+# (Connection.send_bytes): a 5-byte header (kind, request id) followed by a
+# marshal payload. marshal handles the plain dict/list/str/number values the
+# debugger exchanges, is fast, and both ends run the same interpreter.
+HEADER = struct.Struct('!BI')
+
+REQUEST = 1    # payload: (method, args)
+RESPONSE = 2   # payload: result
+ERROR = 3      # payload: error message
+
+MAX_REQUEST_ID = 2 ** 32
+
+
+class WorkerError(RuntimeError):
+    """A request to a worker failed, or the worker process went away."""
+
+
+def encode(kind, request_id, payload):
+    return HEADER.pack(kind, request_id) + marshal.dumps(payload)
+
+
+def decode(message):
+    kind, request_id = HEADER.unpack_from(message)
+    return kind, request_id, marshal.loads(memoryview(message)[HEADER.size:])
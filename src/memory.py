@@ -0,0 +1,176 @@
+import threading
+import tracemalloc
+from collections import OrderedDict
+from .profiler import function_key
+from .utils import DEBUGGER_FILES
+
+# Traceback depth recorded per allocation; deep enough to see past library
+# code back to the program line that called it
+MEMORY_FRAMES = 16
+# Per-state line snapshots kept for diffing
+MAX_MEMORY_STATES = 512
+
+# tracemalloc is process-wide; it runs while any session wants it
+_users = 0
+_users_lock = threading.Lock()
+
+
+def _start_tracing():
+    global _users
+    with _users_lock:
+        _users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_FRAMES)
+
+
+def _stop_tracing():
+    global _users
+    with _users_lock:
+        _users -= 1
+        if not _users:
+            tracemalloc.stop()
+
+
+class MemoryProfiler:
+    """Opt-in allocation profiling of the program built on tracemalloc.
+
+    Live allocations are attributed to the innermost line of the program's
+    own file in their traceback, so memory allocated by library code counts
+    against the program line that called it. A per-line snapshot is taken
+    for every saved program state so two states can be diffed, and while
+    calls are traced the peak memory of each function call is recorded.
+    Memory the debugger itself holds on to during pauses is left out.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.enabled = False
+        self.function_peaks = {}
+        self.peak = 0
+        self._states = OrderedDict()
+        # [frame, key, entry_bytes, peak_bytes] for each active call
+        self._stack = []
+        # Memory retained by the debugger during pauses, subtracted from readings
+        self._offset = 0
+        self._pause_current = None
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        self._stack = []
+        self._pause_current = None
+        if enabled:
+            _start_tracing()
+            self._offset = tracemalloc.get_traced_memory()[0]
+            self.peak = 0
+        else:
+            _stop_tracing()
+
+    def _read(self):
+        """Current traced memory and the peak since the last read, adjusted."""
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        peak -= self._offset
+        self.peak = max(self.peak, peak)
+        if self._stack:
+            top = self._stack[-1]
+            top[3] = max(top[3], peak)
+        return current - self._offset
+
+    def pause(self):
+        if self.enabled and self._pause_current is None:
+            self._pause_current = self._read() + self._offset
+
+    def resume(self):
+        if self._pause_current is not None:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self._offset += current - self._pause_current
+            self._pause_current = None
+
+    def start_function(self, frame):
+        current = self._read()
+        self._stack.append([frame, function_key(frame.f_code), current, current])
+
+    def end_function(self, frame):
+        stack = self._stack
+        if not stack or stack[-1][0] is not frame and not any(entry[0] is frame for entry in stack):
+            return
+        self._read()
+        while self._stack:
+            entry_frame, key, entry_bytes, peak = self._stack.pop()
+            growth = peak - entry_bytes
+            if growth > self.function_peaks.get(key, 0):
+                self.function_peaks[key] = growth
+            if self._stack:
+                parent = self._stack[-1]
+                parent[3] = max(parent[3], peak)
+            if entry_frame is frame:
+                return
+
+    def line_usage(self):
+        """{line: [bytes, blocks]} of live allocations per program line."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, self.filename, all_frames=True)]
+        )
+        usage = {}
+        for trace in snapshot.traces:
+            # Innermost frame first: the first program line seen is charged,
+            # unless the debugger's own code comes before it
+            for frame in reversed(trace.traceback):
+                if frame.filename == self.filename:
+                    entry = usage.setdefault(frame.lineno, [0, 0])
+                    entry[0] += trace.size
+                    entry[1] += 1
+                    break
+                # Allocations made by the debugger itself (capturing
+                # variables, history) are not the program's
+                if frame.filename.startswith(DEBUGGER_FILES):
+                    break
+        return usage
+
+    def record_state(self, state_id):
+        self._states[state_id] = self.line_usage()
+        while len(self._states) > MAX_MEMORY_STATES:
+            self._states.popitem(last=False)
+
+    def diff_states(self, old_id, new_id):
+        """Per-line change in live memory from state old_id to new_id, largest
+        first; None if either state has no snapshot."""
+        old = self._states.get(old_id)
+        new = self._states.get(new_id)
+        if old is None or new is None:
+            return None
+        lines = []
+        for line in set(old) | set(new):
+            old_size, old_count = old.get(line, (0, 0))
+            new_size, new_count = new.get(line, (0, 0))
+            if new_size != old_size or new_count != old_count:
+                lines.append({
+                    'line': line,
+                    'size': new_size,
+                    'size_diff': new_size - old_size,
+                    'count_diff': new_count - old_count
+                })
+        lines.sort(key=lambda entry: abs(entry['size_diff']), reverse=True)
+        return {
+            'total_diff': sum(entry['size_diff'] for entry in lines),
+            'lines': lines
+        }
+
+    def get_memory_data(self):
+        data = {'enabled': self.enabled, 'lines': [], 'current': 0, 'peak': 0}
+        if not self.enabled:
+            return data
+        current = self._read()
+        usage = self.line_usage()
+        data.update(
+            current=current,
+            peak=self.peak,
+            lines=[
+                {'line': line, 'size': size, 'count': count}
+                for line, (size, count) in sorted(usage.items())
+            ]
+        )
+        return data
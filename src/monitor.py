@@ -1,60 +1,242 @@
 import psutil
 import time
 import threading
+from array import array
+
+# Samples kept per session: ten minutes at one sample a second
+HISTORY_SAMPLES = 600
+# Seconds between samples while a client is reading a session's usage...
+SAMPLE_INTERVAL = 1.0
+# ...and while nobody has read it for LISTEN_TIMEOUT seconds
+IDLE_SAMPLE_INTERVAL = 10.0
+LISTEN_TIMEOUT = 5.0
+# Stored in place of counters the platform cannot report
+MISSING = -1
+
+
+class ResourceHistory:
+    """Fixed-capacity ring buffer of resource samples stored as parallel arrays.
+
+    Samples are numbered from 0 in the order they were taken; once more than
+    capacity have been added the oldest are overwritten, so only samples
+    first_sample .. len(self) - 1 can be read back.
+    """
+    FIELDS = ('time', 'cpu_percent', 'cpu_time', 'rss',
+              'read_bytes', 'write_bytes', 'read_rate', 'write_rate')
+    TYPECODES = ('d', 'd', 'd', 'q', 'q', 'q', 'd', 'd')
+
+    def __init__(self, capacity=HISTORY_SAMPLES):
+        self.capacity = capacity
+        self.columns = [array(typecode) for typecode in self.TYPECODES]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def first_sample(self):
+        """Index of the oldest sample still held."""
+        return max(0, self.count - self.capacity)
+
+    def append(self, *values):
+        if self.count < self.capacity:
+            for column, value in zip(self.columns, values):
+                column.append(value)
+        else:
+            slot = self.count % self.capacity
+            for column, value in zip(self.columns, values):
+                column[slot] = value
+        self.count += 1
+
+    def latest(self):
+        """The most recent sample as a dict, or None before the first."""
+        if not self.count:
+            return None
+        return self._sample((self.count - 1) % self.capacity)
+
+    def _sample(self, slot):
+        sample = {}
+        for name, column in zip(self.FIELDS, self.columns):
+            value = column[slot]
+            sample[name] = None if value == MISSING else value
+        return sample
+
+    def get_samples(self, since=0):
+        """Samples since .. len(self) - 1 (clamped to those still held), one
+        list per field, plus 'next' to pass as since on the following call."""
+        start = max(since, self.first_sample)
+        slots = [index % self.capacity for index in range(start, self.count)]
+        data = {'start': start, 'next': self.count}
+        for name, column in zip(self.FIELDS, self.columns):
+            data[name] = [None if column[slot] == MISSING else column[slot] for slot in slots]
+        return data
 
 
 class ResourceMonitor:
-    def __init__(self):
-        self.cpu_percent = 0
-        self.io_counters = psutil.disk_io_counters()
-        self.net_counters = psutil.net_io_counters()
-        self.last_io_time = time.time()
-        self.last_net_time = time.time()
-        self.io_ops = 0
-        self.net_bytes = 0
+    """Samples the resources used by one debugged program into a ResourceHistory.
+
+    pid names the process the program runs in; its CPU time, resident memory
+    and disk read/write bytes are recorded. A program running on a thread of
+    the server passes cpu_time instead, a callable returning that thread's
+    CPU seconds: memory and I/O belong to the whole server process then and
+    are not reported. Rates are computed between consecutive samples.
+    If the process exits, locate() (when given) names the one that carries
+    on the program, if any; sampling moves over to it.
+    """
+
+    def __init__(self, pid=None, cpu_time=None, capacity=HISTORY_SAMPLES, locate=None):
+        self.process = psutil.Process(pid) if pid is not None else None
+        self._cpu_time = cpu_time
+        self._locate = locate
+        self.history = ResourceHistory(capacity)
+        # (monotonic time, cpu_time, read_bytes, write_bytes) of the last
+        # reading; rates are always taken over the real time since it
+        self._last = None
+        self.last_read = float('-inf')
         self._lock = threading.Lock()
-        
+
+    def listening(self, now):
+        """Whether a client has read the usage recently."""
+        return now - self.last_read < LISTEN_TIMEOUT
+
+    def prime(self):
+        """Take a baseline reading without recording a sample, so the first
+        sample already has rates."""
+        try:
+            cpu_time, rss, read_bytes, write_bytes = self._read()
+        except psutil.Error:
+            return
+        with self._lock:
+            if self._last is None:
+                self._last = (time.monotonic(), cpu_time, read_bytes, write_bytes)
+
+    def _read(self):
+        if self.process is None:
+            return self._cpu_time(), MISSING, MISSING, MISSING
+        with self.process.oneshot():
+            cpu = self.process.cpu_times()
+            rss = self.process.memory_info().rss
+            try:
+                io = self.process.io_counters()
+                read_bytes, write_bytes = io.read_bytes, io.write_bytes
+            except (AttributeError, psutil.AccessDenied):
+                # Not available on every platform
+                read_bytes = write_bytes = MISSING
+        return cpu.user + cpu.system, rss, read_bytes, write_bytes
+
+    def follow(self):
+        """Move to the process locate() names; False if there is none."""
+        pid = self._locate() if self._locate is not None else None
+        if pid is None or pid == self.process.pid:
+            return False
+        try:
+            self.process = psutil.Process(pid)
+        except psutil.Error:
+            return False
+        # Its counters started from zero
+        with self._lock:
+            self._last = None
+        return True
+
     def update(self):
+        """Take a sample; False if the process has exited."""
+        try:
+            cpu_time, rss, read_bytes, write_bytes = self._read()
+        except psutil.Error:
+            if not self.follow():
+                return False
+            return self.update()
+        now = time.monotonic()
         with self._lock:
-            self.cpu_percent = psutil.cpu_percent()
-            
-            current_io = psutil.disk_io_counters()
-            io_time = time.time()
-            io_interval = io_time - self.last_io_time
-            
-            if io_interval > 0:
-                read_ops = current_io.read_count - self.io_counters.read_count
-                write_ops = current_io.write_count - self.io_counters.write_count
-                self.io_ops = (read_ops + write_ops) / io_interval
-                
-            self.io_counters = current_io
-            self.last_io_time = io_time
-            
-            current_net = psutil.net_io_counters()
-            net_time = time.time()
-            net_interval = net_time - self.last_net_time
-            
-            if net_interval > 0:
-                bytes_sent = current_net.bytes_sent - self.net_counters.bytes_sent
-                bytes_recv = current_net.bytes_recv - self.net_counters.bytes_recv
-                self.net_bytes = (bytes_sent + bytes_recv) / net_interval
-                
-            self.net_counters = current_net
-            self.last_net_time = net_time
-            
+            cpu_percent = read_rate = write_rate = 0.0
+            if self._last is not None:
+                last_time, last_cpu, last_read, last_write = self._last
+                elapsed = now - last_time
+                if elapsed > 0:
+                    cpu_percent = 100 * (cpu_time - last_cpu) / elapsed
+                    if read_bytes != MISSING:
+                        read_rate = (read_bytes - last_read) / elapsed
+                        write_rate = (write_bytes - last_write) / elapsed
+            self._last = (now, cpu_time, read_bytes, write_bytes)
+            if read_bytes == MISSING:
+                read_rate = write_rate = MISSING
+            self.history.append(
+                time.time(), cpu_percent, cpu_time, rss,
+                read_bytes, write_bytes, read_rate, write_rate
+            )
+        return True
+
     def get_usage(self):
+        """The latest sample (all zeros before the first one)."""
+        self.last_read = time.monotonic()
+        with self._lock:
+            sample = self.history.latest()
+        if sample is None:
+            sample = dict.fromkeys(ResourceHistory.FIELDS, 0)
+        return sample
+
+    def get_history(self, since=0):
+        self.last_read = time.monotonic()
+        with self._lock:
+            return self.history.get_samples(since)
+
+
+class ResourceSampler:
+    """The one background thread that samples every subscribed ResourceMonitor.
+
+    A monitor whose usage a client has read in the last LISTEN_TIMEOUT
+    seconds is sampled every interval seconds; others only every
+    idle_interval seconds. The thread starts with the first subscription and
+    sleeps while there are none.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, idle_interval=IDLE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.idle_interval = max(interval, idle_interval)
+        # monitor -> monotonic time of its last sample
+        self._monitors = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def subscribe(self, monitor):
+        monitor.prime()
+        with self._lock:
+            self._monitors[monitor] = float('-inf')
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='resource-sampler', daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def unsubscribe(self, monitor):
         with self._lock:
-            return {
-                'cpu': self.cpu_percent,
-                'io': round(self.io_ops, 1),
-                'network': round(self.net_bytes, 1)
-            }
+            self._monitors.pop(monitor, None)
 
-resource_monitor = None
+    def sample(self):
+        """Sample the monitors that are due; seconds to wait before checking
+        again, or None if there are none."""
+        now = time.monotonic()
+        with self._lock:
+            monitors = list(self._monitors.items())
+        for monitor, last_sample in monitors:
+            period = self.interval if monitor.listening(now) else self.idle_interval
+            if now - last_sample < period:
+                continue
+            alive = monitor.update()
+            with self._lock:
+                if not alive:
+                    # The process is gone; nothing more to sample
+                    self._monitors.pop(monitor, None)
+                elif monitor in self._monitors:
+                    self._monitors[monitor] = now
+        # Checked at the fast rate even when every monitor is idle, so a
+        # client that starts listening is served within one interval
+        return self.interval if monitors else None
 
-def update_resource_monitor():
-    global resource_monitor
-    while True:
-        if resource_monitor:
-            resource_monitor.update()
-        time.sleep(1)
+    def _run(self):
+        while True:
+            wait = self.sample()
+            self._wake.wait(wait)
+            self._wake.clear()
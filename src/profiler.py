@@ -1,47 +1,393 @@
+import threading
 import time
+from array import array
+
+# Default sampling period of SamplingProfiler, in seconds
+SAMPLE_INTERVAL = 0.005
+MIN_SAMPLE_INTERVAL = 0.0005
+
+
+def function_key(code):
+    """Profile key for a code object: (filename, qualname, firstlineno)."""
+    return (code.co_filename, getattr(code, 'co_qualname', code.co_name), code.co_firstlineno)
+
+
+class CallNode:
+    """One call path in the call tree, e.g. main -> calculate_factorial -> calculate_factorial."""
+    __slots__ = ('key', 'parent', 'children', 'calls', 'samples', 'inclusive_ns', 'self_ns')
+
+    def __init__(self, key, parent=None):
+        self.key = key
+        self.parent = parent
+        self.children = {}
+        self.calls = 0
+        self.samples = 0
+        self.inclusive_ns = 0
+        self.self_ns = 0
+
+    def child(self, key):
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = CallNode(key, self)
+        return node
+
+    def path(self):
+        """Keys from the outermost call down to this node."""
+        keys = []
+        node = self
+        while node.parent is not None:
+            keys.append(node.key)
+            node = node.parent
+        return keys[::-1]
+
+
+class FunctionStats:
+    __slots__ = ('calls', 'samples', 'inclusive_ns', 'self_ns', 'last_call_ns', 'active')
 
-class PerformanceProfiler:
     def __init__(self):
-        self.function_times = {}
-        self.current_functions = {}
-        self._start_times = {}
-        
-    def start_function(self, func_name, line_no):
-        """Start timing a function"""
-        timestamp = time.time()
-        self._start_times[func_name] = timestamp
-        
-        if func_name not in self.function_times:
-            self.function_times[func_name] = {
-                'total_time': 0,
-                'calls': 0,
-                'avg_time': 0,
-                'last_call_time': 0,
-                'line': line_no
-            }
-            
-        self.function_times[func_name]['calls'] += 1
-        
-    def end_function(self, func_name):
-        """End timing a function"""
-        if func_name in self._start_times:
-            end_time = time.time()
-            elapsed = end_time - self._start_times[func_name]
-            
-            self.function_times[func_name]['total_time'] += elapsed
-            self.function_times[func_name]['last_call_time'] = elapsed
-            self.function_times[func_name]['avg_time'] = (
-                self.function_times[func_name]['total_time'] / 
-                self.function_times[func_name]['calls']
-            )
-            
-            del self._start_times[func_name]
-            
+        self.calls = 0
+        self.samples = 0
+        self.inclusive_ns = 0
+        self.self_ns = 0
+        self.last_call_ns = 0
+        # Activations currently on the stack; inclusive time is only added
+        # when the outermost one returns so recursion is not counted twice
+        self.active = 0
+
+
+class PausableClock:
+    """perf_counter_ns clock that stands still while the program is paused."""
+
+    def __init__(self):
+        self._paused_ns = 0
+        self._pause_start = None
+
+    def _now(self):
+        return time.perf_counter_ns() - self._paused_ns
+
+    def pause(self):
+        """Stop the clock while the program waits for a debugger command."""
+        if self._pause_start is None:
+            self._pause_start = time.perf_counter_ns()
+
+    def resume(self):
+        if self._pause_start is not None:
+            self._paused_ns += time.perf_counter_ns() - self._pause_start
+            self._pause_start = None
+
+
+class PerformanceProfiler(PausableClock):
+    """Call-stack-aware profiler fed by the debugger's call and return events.
+
+    Calls are matched to returns by frame, so recursive calls each get
+    their own timing. Time is measured with perf_counter_ns and excludes
+    the time the program spends paused in the debugger. Results are kept
+    per function, keyed by function_key(), and as a call tree of every
+    call path seen.
+    """
+    mode = 'deterministic'
+
+    def __init__(self):
+        super().__init__()
+        self.root = CallNode(None)
+        self.functions = {}
+        # (frame, node, stats, start_ns, child_ns) for each active call
+        self._stack = []
+
+    def _stats(self, key):
+        stats = self.functions.get(key)
+        if stats is None:
+            stats = self.functions[key] = FunctionStats()
+        return stats
+
+    def clear_stack(self):
+        """Forget the active calls, e.g. after call events were not reported."""
+        self._stack = []
+
+    def start_function(self, frame):
+        """Start timing a call of frame's function"""
+        key = function_key(frame.f_code)
+        parent = self._stack[-1][1] if self._stack else self.root
+        node = parent.child(key)
+        node.calls += 1
+
+        stats = self._stats(key)
+        stats.calls += 1
+        stats.active += 1
+
+        self._stack.append([frame, node, stats, self._now(), 0])
+
+    def end_function(self, frame):
+        """End timing the call of frame; calls above it that never reported
+        a return are closed as well."""
+        stack = self._stack
+        # frame is nearly always on top; only when calls above it were
+        # unwound without a return does the whole stack get searched
+        if not stack or stack[-1][0] is not frame and not any(entry[0] is frame for entry in stack):
+            return
+        now = self._now()
+        while self._stack:
+            entry_frame, node, stats, start, child_ns = self._stack.pop()
+            elapsed = now - start
+            node.inclusive_ns += elapsed
+            node.self_ns += elapsed - child_ns
+            stats.self_ns += elapsed - child_ns
+            stats.last_call_ns = elapsed
+            stats.active -= 1
+            if not stats.active:
+                stats.inclusive_ns += elapsed
+            if self._stack:
+                self._stack[-1][4] += elapsed
+            if entry_frame is frame:
+                return
+
+    def _labels(self):
+        """Display name per key: the qualname, qualified by location when
+        two functions share it."""
+        counts = {}
+        for filename, qualname, line in self.functions:
+            counts[qualname] = counts.get(qualname, 0) + 1
+        return {
+            key: key[1] if counts[key[1]] == 1 else f"{key[1]} ({key[0]}:{key[2]})"
+            for key in self.functions
+        }
+
+    def _tree_data(self, node, labels):
+        filename, qualname, line = node.key
+        return {
+            'name': labels[node.key],
+            'file': filename,
+            'line': line,
+            'calls': node.calls,
+            'samples': node.samples,
+            'inclusive_time': node.inclusive_ns / 1e9,
+            'self_time': node.self_ns / 1e9,
+            'children': [self._tree_data(child, labels) for child in node.children.values()]
+        }
+
     def get_profile_data(self):
         """Get all profiling data"""
+        labels = self._labels()
+        function_times = {}
+        for key, stats in self.functions.items():
+            filename, qualname, line = key
+            function_times[labels[key]] = {
+                'total_time': stats.inclusive_ns / 1e9,
+                'self_time': stats.self_ns / 1e9,
+                'calls': stats.calls,
+                'samples': stats.samples,
+                'avg_time': stats.inclusive_ns / stats.calls / 1e9 if stats.calls else 0,
+                'last_call_time': stats.last_call_ns / 1e9,
+                'line': line,
+                'file': filename,
+                'qualname': qualname
+            }
         return {
-            'function_times': self.function_times,
+            'mode': self.mode,
+            'function_times': function_times,
             'total_execution_time': sum(
-                data['total_time'] for data in self.function_times.values()
-            )
+                child.inclusive_ns for child in self.root.children.values()
+            ) / 1e9,
+            'call_tree': [self._tree_data(child, labels) for child in self.root.children.values()]
+        }
+
+    def _walk(self, node=None):
+        node = node or self.root
+        for child in node.children.values():
+            yield child
+            yield from self._walk(child)
+
+    def to_collapsed(self):
+        """Collapsed-stack text ("outer;inner self_ns" per line) for flame graph tools."""
+        labels = self._labels()
+        lines = []
+        for node in self._walk():
+            if node.self_ns > 0:
+                stack = ';'.join(labels[key].replace(';', ':') for key in node.path())
+                lines.append(f"{stack} {node.self_ns}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def to_speedscope(self, name='Relive Debugger profile'):
+        """The call tree as a speedscope (https://www.speedscope.app) sampled profile,
+        one weighted sample per call path."""
+        labels = self._labels()
+        frames = []
+        frame_index = {}
+        for key in self.functions:
+            frame_index[key] = len(frames)
+            frames.append({'name': labels[key], 'file': key[0], 'line': key[2]})
+
+        samples = []
+        weights = []
+        for node in self._walk():
+            if node.self_ns > 0:
+                samples.append([frame_index[key] for key in node.path()])
+                weights.append(node.self_ns)
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'nanoseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            }],
+            'name': name,
+            'exporter': 'relive-debugger'
+        }
+
+
+class LineProfiler(PausableClock):
+    """Hit counts and time per line of the program's own file.
+
+    Counts live in arrays indexed by line number, sized when the program
+    is registered. Each line event charges the time since the previous
+    one to the previous line of this file, so a line's time covers
+    library code it calls but not the program's own functions (their
+    lines are charged instead).
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.enabled = False
+        self.reset(0)
+
+    def reset(self, line_count):
+        self.hits = array('Q', bytes(8 * (line_count + 1)))
+        self.times = array('Q', bytes(8 * (line_count + 1)))
+        self._last_line = 0
+        self._last_time = 0
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            # Time since it was last on belongs to no line
+            self._last_line = 0
+        self.enabled = enabled
+
+    def hit(self, filename, lineno):
+        now = self._now()
+        if self._last_line:
+            self.times[self._last_line] += now - self._last_time
+        self._last_time = now
+        if filename == self.filename and 0 < lineno < len(self.hits):
+            self.hits[lineno] += 1
+            self._last_line = lineno
+
+    def finish(self):
+        """Charge the time up to the end of the run to the last line."""
+        self.hit(None, 0)
+        self._last_line = 0
+
+    def get_line_data(self):
+        lines = [
+            {'line': line, 'hits': self.hits[line], 'time': self.times[line] / 1e9}
+            for line in range(1, len(self.hits))
+            if self.hits[line]
+        ]
+        return {
+            'enabled': self.enabled,
+            'filename': self.filename,
+            'lines': lines,
+            'max_hits': max((line['hits'] for line in lines), default=0),
+            'max_time': max((line['time'] for line in lines), default=0),
+            'total_time': sum(self.times) / 1e9
         }
+
+
+class SamplingProfiler(PerformanceProfiler):
+    """Statistical profiler: a background thread samples the program's stack.
+
+    Every interval seconds the sampler asks sample_stack() for the code
+    objects on the program's stack, outermost first, and charges the time
+    since the previous sample to that call path. No work is done per call,
+    so the program runs at close to full speed; call counts are unknown and
+    reported as 0, with sample counts alongside. Results have the same shape
+    as PerformanceProfiler's.
+    """
+    mode = 'sampling'
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.sample_count = 0
+        self._keys = {}
+        self._thread = None
+        self._stop = None
+        self._sources = None
+
+    def start(self, sample_stack, lock):
+        """Start sampling; sample_stack is called, and samples recorded, under lock."""
+        if self._thread is not None:
+            return
+        self._sources = (sample_stack, lock)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(sample_stack, lock, self._stop),
+            name='profile-sampler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def after_fork(self):
+        """In a forked child, where the sampling thread no longer runs: start another."""
+        if self._thread is not None:
+            self._thread = None
+            self.start(*self._sources)
+
+    def _run(self, sample_stack, lock, stop):
+        last = None
+        while not stop.wait(self.interval):
+            with lock:
+                if self._pause_start is not None:
+                    # Paused in the debugger: nothing to charge
+                    last = None
+                    continue
+                now = self._now()
+                weight = now - last if last is not None else int(self.interval * 1e9)
+                last = now
+                codes = sample_stack()
+                if codes:
+                    self.add_sample(codes, weight)
+
+    def add_sample(self, codes, weight_ns):
+        """Charge weight_ns to the call path codes (outermost first)."""
+        self.sample_count += 1
+        node = self.root
+        seen = set()
+        for code in codes:
+            key = self._keys.get(code)
+            if key is None:
+                key = self._keys[code] = function_key(code)
+            node = node.child(key)
+            node.inclusive_ns += weight_ns
+            stats = self._stats(key)
+            if key not in seen:
+                seen.add(key)
+                stats.inclusive_ns += weight_ns
+                stats.samples += 1
+        node.samples += 1
+        node.self_ns += weight_ns
+        stats.self_ns += weight_ns
+
+    def start_function(self, frame):
+        pass
+
+    def end_function(self, frame):
+        pass
+
+    def get_profile_data(self):
+        data = super().get_profile_data()
+        data.update(interval=self.interval, samples=self.sample_count)
+        return data
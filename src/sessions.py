@@ -0,0 +1,294 @@
+import secrets
+import threading
+import time
+import psutil
+from .debugger import WebDebugger
+from .ipc import WorkerError
+from .monitor import ResourceMonitor, ResourceSampler, SAMPLE_INTERVAL
+from .stream import StateStream
+from .worker import WorkerPool, RemoteDebugger, RemoteStream
+
+MAX_SESSIONS = 32
+IDLE_TIMEOUT = 30 * 60
+# Per-session cap on the step-back history (SnapshotStore budget)
+HISTORY_BYTES = 16 * 1024 * 1024
+# Idle worker processes kept ready for new sessions
+POOL_SIZE = 2
+
+
+class SessionLimitError(RuntimeError):
+    """Raised when a new session would exceed the concurrent session cap."""
+
+
+class Session:
+    """One debugging session: its debugger, how it runs, and its accounting.
+
+    Subclasses decide where the program runs; self.debugger offers the
+    WebDebugger methods the web routes use either way.
+    """
+
+    def __init__(self, session_id, backend='settrace', history_bytes=HISTORY_BYTES):
+        self.id = session_id
+        self.backend = backend
+        self.history_bytes = history_bytes
+        self.filename = f"<session-{session_id}>"
+        self.debugger = None
+        self.resources = None
+        self.created = time.time()
+        self.last_active = time.monotonic()
+        self.closed = False
+
+    def touch(self):
+        """Mark the session as in use; False once it has been closed."""
+        self.last_active = time.monotonic()
+        return not self.closed
+
+    def get_usage(self):
+        usage = self.debugger.get_usage()
+        usage.update({
+            'id': self.id,
+            'isolation': self.isolation,
+            'created': self.created,
+            'idle_seconds': round(time.monotonic() - self.last_active, 1)
+        })
+        return usage
+
+
+class ThreadSession(Session):
+    """Runs the program on a thread of the server process."""
+    isolation = 'thread'
+
+    def __init__(self, session_id, backend='settrace', history_bytes=HISTORY_BYTES):
+        super().__init__(session_id, backend, history_bytes)
+        self.debugger = WebDebugger(backend, self.filename, history_bytes)
+        self.thread = None
+        self._cpu_clock = None
+        self._cpu_time = 0.0
+        self.resources = ResourceMonitor(cpu_time=self.cpu_time)
+
+    def start(self, code, start_line=None, end_line=None):
+        # Mark the run as started before returning so a /stream opened right
+        # away does not see a finished debugger
+        self.debugger.set_running(True)
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(code, start_line, end_line),
+            name=f"session-{self.id}",
+            daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, code, start_line, end_line):
+        if hasattr(time, 'pthread_getcpuclockid'):
+            self._cpu_clock = time.pthread_getcpuclockid(threading.get_ident())
+        try:
+            self.debugger.run_source(code, start_line, end_line)
+        finally:
+            self._cpu_time = time.thread_time()
+            self._cpu_clock = None
+
+    def open_stream(self):
+        return StateStream(self.debugger)
+
+    def close(self):
+        """Ask the debuggee to quit and release what the session registered.
+
+        A paused program quits right away. A program running without pausing
+        (for example after continue) is told to quit and stops at its next
+        pause, if any.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        debugger = self.debugger
+        if debugger.is_running:
+            debugger.post_command('quit')
+        debugger.clear_all_breaks()
+        debugger.sources.forget()
+        # tracemalloc is shared by the whole server process
+        debugger.set_memory_profiling(False)
+
+    def cpu_time(self):
+        """CPU seconds consumed by the session's thread so far."""
+        clock = self._cpu_clock
+        if clock is not None:
+            try:
+                return time.clock_gettime(clock)
+            except OSError:
+                # The thread exited between the check and the read
+                pass
+        return self._cpu_time
+
+    def get_usage(self):
+        usage = super().get_usage()
+        usage['cpu_time'] = round(self.cpu_time(), 4)
+        return usage
+
+
+class ProcessSession(Session):
+    """Runs the program in a worker process taken from a WorkerPool.
+
+    A busy or runaway program cannot hold the server's GIL, output never
+    mixes between sessions, and closing the session always stops it.
+    """
+    isolation = 'process'
+
+    def __init__(self, session_id, pool, backend='settrace', history_bytes=HISTORY_BYTES):
+        super().__init__(session_id, backend, history_bytes)
+        self.pool = pool
+        self.client = pool.acquire()
+        self.debugger = RemoteDebugger(self.client, self.filename)
+        try:
+            self.resources = ResourceMonitor(self.client.process.pid, locate=self._worker_pid)
+        except psutil.Error:
+            # The worker died before it was handed out; requests will fail too
+            pass
+
+    def start(self, code, start_line=None, end_line=None):
+        self.client.call(
+            'start', code, start_line, end_line,
+            self.backend, self.filename, self.history_bytes
+        )
+
+    def _worker_pid(self):
+        # A checkpoint that takes over the session runs in another process
+        try:
+            return self.client.call('pid')
+        except WorkerError:
+            return None
+
+    def open_stream(self):
+        return RemoteStream(self.client)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pool.release(self.client)
+
+    def get_usage(self):
+        try:
+            usage = super().get_usage()
+        except WorkerError:
+            usage = {'id': self.id, 'isolation': self.isolation, 'exited': True}
+        if self.resources is None:
+            return usage
+        try:
+            usage.update(self._process_usage())
+        except psutil.Error:
+            # The worker may have handed over to a checkpoint
+            if self.resources.follow():
+                try:
+                    usage.update(self._process_usage())
+                except psutil.Error:
+                    pass
+        return usage
+
+    def _process_usage(self):
+        process = self.resources.process
+        cpu = process.cpu_times()
+        return {
+            'pid': process.pid,
+            'cpu_time': round(cpu.user + cpu.system, 4),
+            'rss': process.memory_info().rss
+        }
+
+
+class SessionManager:
+    """Registry of debugging sessions keyed by a random session ID.
+
+    Sessions idle for longer than idle_timeout are closed by evict_idle(),
+    and at most max_sessions may exist at once; creating another first
+    evicts idle sessions and then raises SessionLimitError if still full.
+    With isolation='process' (the default) each session runs in its own
+    worker process; 'thread' runs them all inside the server process.
+    Every session's resource usage is sampled by one shared ResourceSampler,
+    every sample_interval seconds while a client is reading it.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT,
+                 history_bytes=HISTORY_BYTES, isolation='process', pool_size=POOL_SIZE,
+                 sample_interval=SAMPLE_INTERVAL):
+        if isolation not in ('process', 'thread'):
+            raise ValueError(f"Unknown session isolation: {isolation}")
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.history_bytes = history_bytes
+        self.isolation = isolation
+        self.pool = WorkerPool(pool_size) if isolation == 'process' else None
+        self.sampler = ResourceSampler(sample_interval)
+        self._sessions = {}
+        # Slots taken by sessions still being created
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def prestart(self):
+        """Start the idle worker processes ahead of the first session."""
+        if self.pool is not None:
+            threading.Thread(target=self.pool.prestart, daemon=True).start()
+
+    def create(self, backend='settrace'):
+        """Create a session (not yet started)."""
+        self.evict_idle()
+        with self._lock:
+            if len(self._sessions) + self._reserved >= self.max_sessions:
+                raise SessionLimitError(
+                    f"Too many active sessions (limit {self.max_sessions})"
+                )
+            # Hold the slot while the session starts: getting a worker may
+            # spawn one, which must not block lookups of other sessions
+            self._reserved += 1
+        session = None
+        try:
+            session_id = secrets.token_hex(8)
+            if self.pool is not None:
+                session = ProcessSession(session_id, self.pool, backend, self.history_bytes)
+            else:
+                session = ThreadSession(session_id, backend, self.history_bytes)
+        finally:
+            with self._lock:
+                self._reserved -= 1
+                if session is not None:
+                    self._sessions[session_id] = session
+        if session.resources is not None:
+            self.sampler.subscribe(session.resources)
+        return session
+
+    def get(self, session_id):
+        """Look up a session and mark it active; None if unknown or closed."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None or not session.touch():
+            return None
+        return session
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._release(session)
+        return session is not None
+
+    def _release(self, session):
+        if session.resources is not None:
+            self.sampler.unsubscribe(session.resources)
+        session.close()
+
+    def evict_idle(self):
+        """Close sessions nobody has used for idle_timeout seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [s for s in self._sessions.values() if s.last_active < cutoff]
+            for session in idle:
+                del self._sessions[session.id]
+        for session in idle:
+            self._release(session)
+        return len(idle)
+
+    def get_usage(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.get_usage() for session in sessions]
+
+    def __len__(self):
+        return len(self._sessions)
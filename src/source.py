@@ -0,0 +1,94 @@
+import linecache
+from pygments import highlight
+from pygments.lexers import PythonLexer
+from pygments.formatters import HtmlFormatter
+from .fastpath import code_lines
+
+_HTML_PREFIX = '<div class="highlight"><pre><span></span>'
+_HTML_SUFFIX = '</pre></div>\n'
+
+
+class SourceFile:
+    """Source lines of one file plus their highlighted HTML, one entry per line."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self._html_lines = None
+
+    @property
+    def html_lines(self):
+        if self._html_lines is None:
+            # HtmlFormatter closes and reopens spans at every newline, so the
+            # highlighted text splits cleanly into per-line fragments.
+            html = highlight(
+                ''.join(self.lines), PythonLexer(stripnl=False), HtmlFormatter(nowrap=True)
+            )
+            self._html_lines = html.splitlines(True)
+        return self._html_lines
+
+
+class SourceCache:
+    """Per-run source and highlighting cache keyed by filename and code object.
+
+    The submitted program is registered once per run (which also makes it
+    visible to linecache, so bdb can validate breakpoints on it).
+    Other files are loaded through linecache on first use.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._code_ranges = {}
+        self._registered = set()
+
+    def register(self, filename, source):
+        lines = source.splitlines(True)
+        linecache.cache[filename] = (len(source), None, lines, filename)
+        self._files[filename] = SourceFile(lines)
+        self._registered.add(filename)
+
+    def forget(self):
+        """Drop everything, including the linecache entries register() added."""
+        for filename in self._registered:
+            linecache.cache.pop(filename, None)
+        self._registered.clear()
+        self._files.clear()
+        self._code_ranges.clear()
+
+    def get_file(self, filename):
+        source_file = self._files.get(filename)
+        if source_file is None:
+            source_file = SourceFile(linecache.getlines(filename))
+            self._files[filename] = source_file
+        return source_file
+
+    def get_line(self, filename, lineno):
+        lines = self.get_file(filename).lines
+        if 1 <= lineno <= len(lines):
+            return lines[lineno - 1]
+        return ""
+
+    def _code_range(self, code):
+        code_range = self._code_ranges.get(code)
+        if code_range is None:
+            lines = code_lines(code)
+            first = min(lines, default=code.co_firstlineno)
+            if code.co_name != '<module>':
+                first = min(first, code.co_firstlineno)
+            code_range = (first, max(lines, default=first))
+            self._code_ranges[code] = code_range
+        return code_range
+
+    def get_context(self, code, lineno, context_lines=3):
+        """Highlighted window of lines around lineno, clipped to the code object."""
+        source_file = self.get_file(code.co_filename)
+        if not source_file.lines:
+            return None
+        first, last = self._code_range(code)
+        start_line = max(first, lineno - context_lines)
+        end_line = min(last, lineno + context_lines, len(source_file.lines))
+        html_lines = source_file.html_lines[start_line - 1:end_line]
+        return {
+            'lines': _HTML_PREFIX + ''.join(html_lines) + _HTML_SUFFIX,
+            'start_line': start_line,
+            'current_line': lineno
+        }
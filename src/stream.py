@@ -0,0 +1,137 @@
+import json
+import time
+from .utils import diff_scope, diff_stack
+
+POLL_INTERVAL = 0.25
+KEEPALIVE_INTERVAL = 15
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StateStream:
+    """Follows one debugger on behalf of one client and emits only what changed.
+
+    Each client keeps its own cursor (state version, output offset, execution
+    path index, and the variables and stack it was last sent), so nothing is
+    rendered for clients that are not connected, and steps taken faster than
+    the client reads coalesce into a single update.
+
+    Events, in the order they are emitted for one update:
+        output     {'offset', 'end', 'text'}
+                                       new output; offset jumps if it was cleared
+        steps      {'start', 'steps'}  new execution path entries; start skips
+                                       ahead if older steps were overwritten
+        stack      {'depth', 'frames'} changed frames keyed by index from the
+                                       outermost frame; drop any beyond depth
+        variables  {'locals', 'globals'}, each {'changed', 'removed'}
+        state      running flag, current line, state counters, exception and
+                   the watchpoints that changed at this stop
+        watches    {'version', 'results'}  the watch list evaluated at this stop
+        end        the run finished (or was replaced) and everything was sent
+    """
+
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self.version = None
+        self.output_offset = 0
+        self.path_index = 0
+        self.variables = {'locals': {}, 'globals': {}}
+        self.stack = []
+
+    def collect(self):
+        """Return the (event, data) pairs that are new since the last call."""
+        debugger = self.debugger
+        events = []
+
+        start, text = debugger.output_buffer.read_from(self.output_offset)
+        if text or start != self.output_offset:
+            events.append(('output', {'offset': start, 'end': start + len(text), 'text': text}))
+            self.output_offset = start + len(text)
+
+        version = debugger.state_version
+        with debugger._lock:
+            trace = debugger.execution_tracker.trace
+            if len(trace) > self.path_index:
+                steps = trace.get_steps(self.path_index)
+                events.append(('steps', {'start': steps[0]['index'], 'steps': steps}))
+                self.path_index = len(trace)
+
+            changed = version != self.version
+            if changed:
+                self.version = version
+                events.extend(self._collect_state())
+        if changed and debugger.watch_expressions and debugger.is_paused:
+            # Runs user code, so outside the lock; once per version for all clients
+            events.append(('watches', debugger.evaluate_watches()))
+        return events
+
+    def _collect_state(self):
+        debugger = self.debugger
+        events = []
+
+        stack = debugger.render_stack_frames()[::-1]
+        delta = diff_stack(self.stack, stack)
+        if delta['frames'] or len(stack) != len(self.stack):
+            events.append(('stack', delta))
+            self.stack = stack
+
+        variables = debugger.render_variables()
+        delta = {
+            scope: diff_scope(self.variables.get(scope, {}), variables.get(scope, {}))
+            for scope in ('locals', 'globals')
+        }
+        if any(scope['changed'] or scope['removed'] for scope in delta.values()):
+            events.append(('variables', delta))
+            self.variables = variables
+
+        events.append(('state', {
+            'version': self.version,
+            'is_running': debugger.is_running,
+            'current_line': debugger.current_line,
+            'states': len(debugger.program_states),
+            'current_state': debugger.current_state_index,
+            'exception': debugger.exception,
+            'triggered_watchpoints': debugger.triggered_watchpoints
+        }))
+        return events
+
+    def next_events(self, timeout=POLL_INTERVAL):
+        """Wait up to timeout for a change, then return what is new.
+
+        The list ends with an 'end' event once the run has finished.
+        """
+        debugger = self.debugger
+        if self.version is not None:
+            debugger.wait_for_change(self.version, timeout)
+        finished = not debugger.is_running
+        events = self.collect()
+        if finished:
+            events.append(('end', {'version': self.version}))
+        return events
+
+    def events(self, is_current=lambda: True):
+        """Yield SSE text until the run finishes or is_current() turns false."""
+        return sse_events(self.next_events, is_current)
+
+
+def sse_events(next_events, is_current):
+    """Turn a next_events(timeout) source into Server-Sent Events text."""
+    last_sent = time.monotonic()
+    while True:
+        events = next_events(POLL_INTERVAL)
+        for event, data in events:
+            yield format_event(event, data)
+            last_sent = time.monotonic()
+        if events and events[-1][0] == 'end':
+            return
+        if not is_current():
+            yield format_event('end', {})
+            return
+
+        if time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+            # Comment line: keeps proxies from timing out an idle stream
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
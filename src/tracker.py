@@ -1,27 +1,140 @@
 import time
+from array import array
+
+# Steps kept per trace; older steps are overwritten (about 19 bytes each)
+TRACE_CAPACITY = 200000
+MAX_DEPTH = 0xFFFF
+# Most lines / edges drawn in a flowchart; the most-hit ones are kept
+MAX_FLOWCHART_NODES = 150
+MAX_FLOWCHART_EDGES = 300
+EVENT_TYPES = ('line', 'call', 'return', 'exception')
+
+
+class TraceBuffer:
+    """Fixed-capacity ring buffer of execution steps stored as parallel arrays.
+
+    Steps are numbered from 0 in the order they were recorded. Once more than
+    capacity steps have been added the oldest are overwritten, so only steps
+    first_step .. len(self) - 1 can be read back. Code snippets are interned:
+    each column entry is an index into self.snippets.
+    """
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.capacity = capacity
+        self.lines = array('i')
+        self.events = array('B')
+        self.depths = array('H')
+        self.timestamps = array('q')
+        self.snippet_ids = array('I')
+        self.snippets = []
+        self._snippet_index = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def first_step(self):
+        """Index of the oldest step still held."""
+        return max(0, self.count - self.capacity)
+
+    def intern(self, snippet):
+        snippet_id = self._snippet_index.get(snippet)
+        if snippet_id is None:
+            snippet_id = self._snippet_index[snippet] = len(self.snippets)
+            self.snippets.append(snippet)
+        return snippet_id
+
+    def append(self, line, event, depth, timestamp, snippet_id):
+        if self.count < self.capacity:
+            self.lines.append(line)
+            self.events.append(event)
+            self.depths.append(depth)
+            self.timestamps.append(timestamp)
+            self.snippet_ids.append(snippet_id)
+        else:
+            slot = self.count % self.capacity
+            self.lines[slot] = line
+            self.events[slot] = event
+            self.depths[slot] = depth
+            self.timestamps[slot] = timestamp
+            self.snippet_ids[slot] = snippet_id
+        self.count += 1
+
+    def get_steps(self, start=0, stop=None):
+        """Return steps start .. stop - 1 (clamped to those still held) as dicts."""
+        start = max(start, self.first_step)
+        stop = self.count if stop is None else min(stop, self.count)
+        steps = []
+        for index in range(start, stop):
+            slot = index % self.capacity
+            steps.append({
+                'index': index,
+                'line': self.lines[slot],
+                'code': self.snippets[self.snippet_ids[slot]],
+                'event': EVENT_TYPES[self.events[slot]],
+                'timestamp_ns': self.timestamps[slot],
+                'call_depth': self.depths[slot]
+            })
+        return steps
+
+    def nbytes(self):
+        """Approximate memory held by the step columns."""
+        return sum(column.itemsize * len(column) for column in (
+            self.lines, self.events, self.depths, self.timestamps, self.snippet_ids
+        ))
+
 
 class ExecutionTracker:
-    def __init__(self):
-        self.execution_path = []
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.trace = TraceBuffer(capacity)
         self.call_graph = {}
         self.current_calls = []
-        
+        # raw source line -> interned snippet id
+        self._snippet_ids = {}
+        # Control-flow graph of the steps so far, updated as steps arrive
+        self.line_hits = {}
+        self.line_code = {}
+        self.edge_hits = {}
+        self._last_line = None
+        self._flowcharts = {}
+
     def add_execution_step(self, line_no, code, event_type):
         """Track a single execution step"""
-        clean_code = code.strip().replace('"', '\'').replace('\n', ' ')
-        if len(clean_code) > 30:
-            clean_code = clean_code[:27] + '...'
-            
-        self.execution_path.append({
-            'line': line_no,
-            'code': clean_code,
-            'event': event_type,
-            'timestamp': time.time(),
-            'call_depth': len(self.current_calls)
-        })
+        snippet_id = self._snippet_ids.get(code)
+        if snippet_id is None:
+            clean_code = code.strip().replace('"', '\'').replace('\n', ' ')
+            if len(clean_code) > 30:
+                clean_code = clean_code[:27] + '...'
+            snippet_id = self._snippet_ids[code] = self.trace.intern(clean_code)
+
+        self.line_hits[line_no] = self.line_hits.get(line_no, 0) + 1
+        if line_no not in self.line_code:
+            self.line_code[line_no] = self.trace.snippets[snippet_id]
+        if self._last_line is not None:
+            edge = (self._last_line, line_no)
+            self.edge_hits[edge] = self.edge_hits.get(edge, 0) + 1
+        self._last_line = line_no
+
+        self.trace.append(
+            line_no,
+            EVENT_TYPES.index(event_type),
+            min(len(self.current_calls), MAX_DEPTH),
+            time.monotonic_ns(),
+            snippet_id
+        )
+
+    def get_steps(self, start=0, stop=None):
+        """Execution steps by step index; see TraceBuffer.get_steps."""
+        return self.trace.get_steps(start, stop)
 
     def add_function_call(self, caller_name, callee_name):
         """Track a function call relationship"""
+        self.add_call_edge(caller_name, callee_name)
+        self.current_calls.append(callee_name)
+
+    def add_call_edge(self, caller_name, callee_name):
+        """Record that caller_name calls callee_name in the call graph"""
         if caller_name not in self.call_graph:
             self.call_graph[caller_name] = {
                 'calls': set(),
@@ -36,35 +149,87 @@ class ExecutionTracker:
             
         self.call_graph[caller_name]['calls'].add(callee_name)
         self.call_graph[callee_name]['called_from'].add(caller_name)
-        self.current_calls.append(callee_name)
 
     def remove_function_call(self, callee_name):
         """Remove the most recent call to the function"""
         if self.current_calls and self.current_calls[-1] == callee_name:
             self.current_calls.pop()
     
-    def get_execution_flowchart(self):
-        """Generate Mermaid flowchart from execution path"""
-        if not self.execution_path:
-            return "flowchart TB\nstart[No execution steps yet]"
-            
+    def get_execution_flowchart(self, mode='cfg'):
+        """Generate a Mermaid flowchart of the execution.
+
+        mode='cfg' draws one node per distinct line with edge hit counts;
+        jumps back to an earlier line are drawn dotted and labelled with the
+        number of loop iterations. mode='path' draws the most recent steps
+        one node each. Either way at most MAX_FLOWCHART_NODES nodes are drawn,
+        and the text is only rebuilt when new steps have arrived.
+        """
+        if mode not in ('cfg', 'path'):
+            raise ValueError(f"Unknown flowchart mode: {mode}")
+        cached = self._flowcharts.get(mode)
+        if cached is not None and cached[0] == len(self.trace):
+            return cached[1]
+        if not len(self.trace):
+            chart = "flowchart TB\nstart[No execution steps yet]"
+        elif mode == 'cfg':
+            chart = self._control_flow_chart()
+        else:
+            chart = self._recent_path_chart()
+        self._flowcharts[mode] = (len(self.trace), chart)
+        return chart
+
+    def _control_flow_chart(self):
+        lines = sorted(self.line_hits, key=self.line_hits.get, reverse=True)
+        shown = set(lines[:MAX_FLOWCHART_NODES])
+        edges = [edge for edge in self.edge_hits if edge[0] in shown and edge[1] in shown]
+        edges.sort(key=self.edge_hits.get, reverse=True)
+        hidden_edges = len(edges) - MAX_FLOWCHART_EDGES
+        edges = edges[:MAX_FLOWCHART_EDGES]
+
+        nodes = []
+        for line in sorted(shown):
+            hits = self.line_hits[line]
+            code = self.line_code[line]
+            nodes.append(f"line{line}[\"{line}: {code}<br/>×{hits}\"]")
+            nodes.append(f"click line{line} callback \"Line {line}<br/>Code: {code}<br/>Hits: {hits}\"")
+
+        links = []
+        for source, target in sorted(edges):
+            hits = self.edge_hits[source, target]
+            if target <= source:
+                links.append(f"line{source} -.->|\"loop ×{hits}\"| line{target}")
+            else:
+                links.append(f"line{source} -->|\"×{hits}\"| line{target}")
+
+        hidden_lines = len(lines) - len(shown)
+        if hidden_lines > 0 or hidden_edges > 0:
+            nodes.append(
+                f"truncated[\"{max(hidden_lines, 0)} more lines and "
+                f"{max(hidden_edges, 0)} more edges not shown\"]"
+            )
+        return "flowchart TB\n" + "\n".join(nodes) + "\n" + "\n".join(links)
+
+    def _recent_path_chart(self):
+        steps = self.trace.get_steps(len(self.trace) - MAX_FLOWCHART_NODES)
         nodes = []
         edges = []
-        node_ids = {}
         last_node = None
-        
-        for i, step in enumerate(self.execution_path):
-            node_id = f"node{i}"
+
+        for step in steps:
+            node_id = f"node{step['index']}"
             label = f"{step['line']}: {step['code']}"
             nodes.append(f"{node_id}[\"{label}\"]")
             nodes.append(f"click {node_id} callback \"Line {step['line']}<br/>Code: {step['code']}<br/>Event: {step['event']}\"")
-            
+
             if last_node:
                 edges.append(f"{last_node} --> {node_id}")
             last_node = node_id
-            
+
+        if steps[0]['index'] > 0:
+            nodes.insert(0, f"earlier[\"{steps[0]['index']} earlier steps not shown\"]")
+            edges.insert(0, f"earlier -.-> node{steps[0]['index']}")
         return "flowchart TB\n" + "\n".join(nodes) + "\n" + "\n".join(edges)
-        
+
     def get_call_graph(self):
         """Generate Mermaid diagram for call graph"""
         if not self.call_graph:
@@ -1,24 +1,148 @@
 from io import StringIO
-import queue
+import bdb
+import os
+import sys
+import threading
 import time
 
+# Source files of the debugger itself (bdb and this package), as opposed to
+# the program's and the libraries it uses
+DEBUGGER_FILES = (os.path.dirname(os.path.abspath(__file__)) + os.sep, bdb.__file__)
+
+
+def diff_scope(old, new):
+    """Names whose rendered value changed or appeared, and names that went away."""
+    return {
+        'changed': {name: value for name, value in new.items() if old.get(name) != value},
+        'removed': [name for name in old if name not in new]
+    }
+
+
+def diff_stack(old, new):
+    """Changed frames of an outermost-first stack, keyed by index; drop any beyond depth."""
+    return {
+        'depth': len(new),
+        'frames': {
+            str(index): frame for index, frame in enumerate(new)
+            if index >= len(old) or old[index] != frame
+        }
+    }
+
 
 class OutputBuffer:
     def __init__(self):
-        self.queue = queue.Queue()
         self.buffer = StringIO()
+        # Absolute character offsets: total written so far, and where the
+        # current buffer starts (clear() drops everything before it).
+        self.size = 0
+        self.start = 0
 
     def write(self, text):
+        # Plain attribute updates keep write() free of Python-level calls the
+        # tracer would step into
         self.buffer.write(text)
-        self.queue.put(text)
+        self.size += len(text)
 
     def flush(self):
         pass
 
     def getvalue(self):
         return self.buffer.getvalue()
+
+    def read_from(self, offset):
+        """Return (start, text) for output written after an absolute offset.
+
+        start is greater than offset when the buffer was cleared in between,
+        in which case text is the whole current buffer.
+        """
+        if offset == self.size:
+            return offset, ''
+        value = self.buffer.getvalue()
+        start = self.start
+        if offset < start:
+            return start, value
+        return offset, value[offset - start:]
+
     def clear(self):
+        self.start = self.size
         self.buffer = StringIO()
+
+    def renumber(self, after):
+        """Move the buffer's offsets past after, so readers holding any offset
+        up to it see it as cleared and read it again from the start."""
+        self.start = after + 1
+        self.size = self.start + len(self.buffer.getvalue())
+ 
+ 
+class OutputRouter:
+    """Stand-in for sys.stdout/sys.stderr that routes writes per thread.
+
+    Threads that registered a target (see redirect_thread_output), and the
+    threads they start, write to it; every other thread writes to the
+    process-wide target if one is set (redirect_process_output), else to
+    the stream that was installed before.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def _target(self):
+        return getattr(_output_targets, 'target', None) or _process_output[0]
+
+    def write(self, text):
+        target = self._target()
+        if target is None:
+            return self.fallback.write(text)
+        return target.write(text)
+
+    def flush(self):
+        if self._target() is None:
+            self.fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+
+_router_lock = threading.Lock()
+_output_targets = threading.local()
+_process_output = [None]
+_thread_start = threading.Thread.start
+
+
+def _start_with_output(thread):
+    # A thread started by a redirected thread writes where its starter does
+    target = getattr(_output_targets, 'target', None)
+    if target is not None:
+        run = thread.run
+
+        def run_with_output():
+            _output_targets.target = target
+            run()
+        thread.run = run_with_output
+    return _thread_start(thread)
+
+
+def _install_router():
+    with _router_lock:
+        if not isinstance(sys.stdout, OutputRouter):
+            sys.stdout = OutputRouter(sys.stdout)
+        if not isinstance(sys.stderr, OutputRouter):
+            sys.stderr = OutputRouter(sys.stderr)
+        threading.Thread.start = _start_with_output
+
+
+def redirect_thread_output(target):
+    """Send the calling thread's stdout and stderr, and those of the threads
+    it starts from now on, to target (None restores them)."""
+    _install_router()
+    _output_targets.target = target
+
+
+def redirect_process_output(target):
+    """Send stdout and stderr of every thread without a target of its own to
+    target (None restores them); for a process that hosts one program."""
+    _install_router()
+    _process_output[0] = target
  
  
 class ProgramState:
@@ -26,5 +150,6 @@ class ProgramState:
         self.variables = {}
         self.stack_frames = []
         self.current_line = None
-        self.output = ""
+        # OutputBuffer.size when the state was recorded
+        self.output_end = 0
         self.timestamp = time.time()
@@ -0,0 +1,107 @@
+import reprlib
+import types
+from itertools import islice
+
+MAX_REPR_LENGTH = 2000
+DEFAULT_PAGE_SIZE = 100
+PREVIEW_LENGTH = 80
+
+_SCALAR_TYPES = {int, float, complex, bool, type(None)}
+_TEXT_TYPES = {str, bytes, bytearray}
+_CONTAINER_TYPES = {list, tuple, dict, set, frozenset, range}
+_NAMED_TYPES = {
+    types.FunctionType: 'function',
+    types.BuiltinFunctionType: 'built-in function',
+    types.ModuleType: 'module',
+    type: 'class'
+}
+
+_summary_repr = reprlib.Repr()
+_summary_repr.maxlevel = 3
+_summary_repr.maxlist = _summary_repr.maxtuple = 20
+_summary_repr.maxdict = _summary_repr.maxset = _summary_repr.maxfrozenset = 20
+_summary_repr.maxstring = PREVIEW_LENGTH * 2
+_summary_repr.maxother = PREVIEW_LENGTH * 2
+
+
+def make_handle(value):
+    """Capture a cheap handle for a value: id, type, size and a short preview.
+
+    Only exact builtin types are inspected so that no user-defined __len__ or
+    __repr__ runs while the program is being traced.
+    """
+    value_type = type(value)
+    handle = {'id': id(value), 'type': value_type.__name__}
+
+    if value_type in _SCALAR_TYPES:
+        if value_type is int and value.bit_length() > 1024:
+            handle['preview'] = f"<int of {value.bit_length()} bits>"
+        else:
+            handle['preview'] = repr(value)
+    elif value_type in _TEXT_TYPES:
+        handle['size'] = len(value)
+        if len(value) > PREVIEW_LENGTH:
+            handle['preview'] = repr(value[:PREVIEW_LENGTH]) + '...'
+        else:
+            handle['preview'] = repr(value)
+    elif value_type in _CONTAINER_TYPES:
+        handle['size'] = len(value)
+    elif value_type in _NAMED_TYPES:
+        handle['preview'] = f"<{_NAMED_TYPES[value_type]} {value.__name__}>"
+    return handle
+
+
+def capture_scope(namespace, skip_dunder=False):
+    """Build handles for every name in a namespace."""
+    return {
+        name: make_handle(value)
+        for name, value in namespace.items()
+        if not (skip_dunder and name.startswith('__'))
+    }
+
+
+def format_handle(handle):
+    """Render a handle as display text without touching the object."""
+    if 'preview' in handle:
+        return handle['preview']
+    if 'size' in handle:
+        return f"<{handle['type']} of {handle['size']} items>"
+    return f"<{handle['type']} object at {hex(handle['id'])}>"
+
+
+def short_repr(value):
+    """Bounded repr used for the variables panel."""
+    try:
+        return _summary_repr.repr(value)
+    except Exception as e:
+        return f"<repr failed: {e}>"
+
+
+def render_value(value, page=0, page_size=DEFAULT_PAGE_SIZE, max_length=MAX_REPR_LENGTH):
+    """Render a value in full, paging through large containers."""
+    result = make_handle(value)
+    value_type = type(value)
+
+    if value_type in _CONTAINER_TYPES:
+        start = max(page, 0) * page_size
+        if value_type is dict:
+            entries = islice(value.items(), start, start + page_size)
+            items = [[short_repr(key), short_repr(item)] for key, item in entries]
+        else:
+            items = [short_repr(item) for item in islice(value, start, start + page_size)]
+        result.update({
+            'items': items,
+            'page': page,
+            'page_size': page_size,
+            'total': len(value),
+            'has_more': start + page_size < len(value)
+        })
+        return result
+
+    try:
+        text = repr(value)
+    except Exception as e:
+        text = f"<repr failed: {e}>"
+    result['repr'] = text[:max_length]
+    result['truncated'] = len(text) > max_length
+    return result
@@ -0,0 +1,432 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+# Imported up front so its exit hook (which joins child processes) is
+# registered before WorkerPool.shutdown and therefore runs after it
+import multiprocessing.util
+import threading
+from collections import deque
+from multiprocessing.connection import wait
+from .checkpoint import CheckpointManager, CHECKPOINTS_AVAILABLE
+from .debugger import WebDebugger
+from .ipc import encode, decode, REQUEST, RESPONSE, ERROR, MAX_REQUEST_ID, WorkerError
+from .stream import StateStream, sse_events
+from .variables import DEFAULT_PAGE_SIZE
+
+# WebDebugger methods a worker serves as-is
+DEBUGGER_METHODS = {
+    'get_status', 'status_etag', 'post_command', 'set_break', 'set_conditional_break',
+    'clear_all_breaks', 'get_all_breakpoints', 'get_variable', 'evaluate_code',
+    'get_profile_data', 'get_profile_export', 'set_profile_mode', 'get_line_profile',
+    'set_line_profiling', 'get_memory_profile', 'set_memory_profiling', 'diff_memory_states',
+    'get_variable_history', 'set_watchpoints', 'get_watchpoints', 'get_visualization_data',
+    'get_usage', 'set_watch_expressions', 'evaluate_watches', 'history_target'
+}
+# Requests that may block (waiting for changes, or running user __repr__ or
+# user code) get their own thread so they cannot stall the request loop
+BLOCKING_METHODS = {
+    'stream_next', 'get_variable', 'evaluate_code', 'set_watch_expressions', 'evaluate_watches'
+}
+
+
+class WorkerServer:
+    """Serves one debugging session inside a worker process.
+
+    Requests arrive on conn and are answered in any order, matched by
+    request id. The first request starts the program; the worker exits when
+    the parent closes its end of the pipe.
+
+    Where fork() is available the program is checkpointed (see
+    CheckpointManager). Going back in time then hands the pipe over to a
+    forked copy of this process, which serves the session from there on.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.debugger = None
+        self._streams = {}
+        self._stream_ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        # Requests being handled on threads of their own
+        self._active = set()
+        self._wake_r, self._wake_w = os.pipe()
+        self._handover = None
+        self._handed_over = False
+        self._resumed = False
+
+    def serve(self):
+        while True:
+            try:
+                wait([self.conn, self._wake_r])
+                if self._handover is not None:
+                    self._hand_over()
+                kind, request_id, (method, args) = decode(self.conn.recv_bytes())
+            except (EOFError, OSError, KeyboardInterrupt):
+                return
+            if method in BLOCKING_METHODS:
+                with self._send_lock:
+                    self._active.add(request_id)
+                threading.Thread(
+                    target=self._handle, args=(request_id, method, args), daemon=True
+                ).start()
+            else:
+                self._handle(request_id, method, args)
+
+    def _handle(self, request_id, method, args):
+        try:
+            if method in DEBUGGER_METHODS:
+                result = getattr(self.debugger, method)(*args)
+            else:
+                result = getattr(self, 'do_' + method)(*args)
+            message = encode(RESPONSE, request_id, result)
+        except Exception as e:
+            message = encode(ERROR, request_id, f"{type(e).__name__}: {e}")
+        with self._send_lock:
+            self._active.discard(request_id)
+            if self._handed_over:
+                return
+            try:
+                self.conn.send_bytes(message)
+            except (BrokenPipeError, OSError):
+                pass
+
+    def hand_over(self, resume):
+        """Pass the session on from the program's thread: the serve loop stops
+        reading, fails the requests still running, calls resume() and exits."""
+        self._handover = resume
+        os.write(self._wake_w, b'\0')
+        threading.Event().wait()
+
+    def _hand_over(self):
+        with self._send_lock:
+            self._handed_over = True
+            for request_id in self._active:
+                try:
+                    self.conn.send_bytes(encode(
+                        ERROR, request_id, "The program was rewound to a checkpoint"
+                    ))
+                except OSError:
+                    pass
+        self._handover()
+        os._exit(0)
+
+    def take_over(self):
+        """In a checkpoint that was just resumed: serve the session from here."""
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self._wake_r, self._wake_w = os.pipe()
+        self._active = set()
+        self._resumed = True
+        threading.Thread(target=self._serve_then_exit, name='worker-serve', daemon=True).start()
+
+    def _serve_then_exit(self):
+        self.serve()
+        # The session is over even if the program is still running
+        os._exit(0)
+
+    def do_start(self, code, start_line, end_line, backend, filename, history_bytes):
+        self.debugger = WebDebugger(backend, filename, history_bytes)
+        self.debugger.owns_process = True
+        if CHECKPOINTS_AVAILABLE:
+            self.debugger.checkpoints = CheckpointManager(
+                self.debugger, self.hand_over, self.take_over, locks=[self._send_lock]
+            )
+        # Mark the run as started before answering so a stream opened right
+        # away does not see a finished debugger
+        self.debugger.set_running(True)
+        threading.Thread(
+            target=self._run_program,
+            args=(code, start_line, end_line),
+            daemon=True
+        ).start()
+        return self.debugger.backend.name
+
+    def _run_program(self, code, start_line, end_line):
+        self.debugger.run_source(code, start_line, end_line)
+        if self._resumed:
+            # In a resumed checkpoint this thread is all that was copied of
+            # the original process; _serve_then_exit ends the process
+            threading.Event().wait()
+
+    def do_pid(self):
+        """The worker's process id, which changes when a checkpoint takes over."""
+        return os.getpid()
+
+    def do_stream_open(self):
+        stream_id = next(self._stream_ids)
+        self._streams[stream_id] = StateStream(self.debugger)
+        return stream_id
+
+    def do_stream_next(self, stream_id, timeout):
+        return self._streams[stream_id].next_events(timeout)
+
+    def do_stream_close(self, stream_id):
+        self._streams.pop(stream_id, None)
+
+
+def worker_main(conn):
+    """Entry point of a pooled worker process."""
+    WorkerServer(conn).serve()
+
+
+class WorkerClient:
+    """Parent-side end of a worker's pipe: concurrent request/response calls."""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.alive = True
+        self._pending = {}
+        self._request_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def call(self, method, *args):
+        waiter = [threading.Event(), None, None]
+        with self._lock:
+            if not self.alive:
+                raise WorkerError("Session worker has exited")
+            request_id = next(self._request_ids) % MAX_REQUEST_ID
+            self._pending[request_id] = waiter
+            try:
+                self.conn.send_bytes(encode(REQUEST, request_id, (method, args)))
+            except (BrokenPipeError, OSError):
+                del self._pending[request_id]
+                raise WorkerError("Session worker has exited")
+        waiter[0].wait()
+        if waiter[1] == RESPONSE:
+            return waiter[2]
+        raise WorkerError(waiter[2])
+
+    def _read(self):
+        while True:
+            try:
+                kind, request_id, payload = decode(self.conn.recv_bytes())
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                waiter = self._pending.pop(request_id, None)
+            if waiter is not None:
+                waiter[1], waiter[2] = kind, payload
+                waiter[0].set()
+        with self._lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter[1], waiter[2] = ERROR, "Session worker has exited"
+            waiter[0].set()
+
+    def close(self):
+        """Stop the worker; the program is abandoned wherever it is."""
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class RemoteDebugger:
+    """Stand-in for a WebDebugger running in a worker process.
+
+    Offers the WebDebugger methods the web routes use; each is one
+    request over the worker's pipe.
+    """
+
+    def __init__(self, client, filename):
+        self.client = client
+        self.filename = filename
+
+    def get_status(self, since=None, output_offset=0):
+        return self.client.call('get_status', since, output_offset)
+
+    def status_etag(self):
+        return self.client.call('status_etag')
+
+    def history_target(self, command, arg=None):
+        return self.client.call('history_target', command, arg)
+
+    def post_command(self, command, arg=None):
+        self.client.call('post_command', command, arg)
+
+    def set_break(self, filename, lineno):
+        return self.client.call('set_break', filename, lineno)
+
+    def set_conditional_break(self, filename, lineno, condition=None, ignore_count=0, log=None):
+        return self.client.call('set_conditional_break', filename, lineno, condition, ignore_count, log)
+
+    def clear_all_breaks(self):
+        return self.client.call('clear_all_breaks')
+
+    def get_all_breakpoints(self):
+        return self.client.call('get_all_breakpoints')
+
+    def set_watchpoints(self, expressions):
+        return self.client.call('set_watchpoints', list(expressions))
+
+    def get_watchpoints(self):
+        return self.client.call('get_watchpoints')
+
+    def get_variable(self, frame_index, name, page=0, page_size=DEFAULT_PAGE_SIZE):
+        return self.client.call('get_variable', frame_index, name, page, page_size)
+
+    def evaluate_code(self, code, line_number=None):
+        return self.client.call('evaluate_code', code, line_number)
+
+    def set_watch_expressions(self, expressions):
+        return self.client.call('set_watch_expressions', list(expressions))
+
+    def evaluate_watches(self):
+        return self.client.call('evaluate_watches')
+
+    def get_profile_data(self):
+        return self.client.call('get_profile_data')
+
+    def get_profile_export(self, format='speedscope'):
+        return self.client.call('get_profile_export', format)
+
+    def set_profile_mode(self, mode, interval=None):
+        return self.client.call('set_profile_mode', mode, interval)
+
+    def get_line_profile(self):
+        return self.client.call('get_line_profile')
+
+    def set_line_profiling(self, enabled):
+        return self.client.call('set_line_profiling', enabled)
+
+    def get_memory_profile(self):
+        return self.client.call('get_memory_profile')
+
+    def set_memory_profiling(self, enabled):
+        return self.client.call('set_memory_profiling', enabled)
+
+    def diff_memory_states(self, old_index, new_index):
+        return self.client.call('diff_memory_states', old_index, new_index)
+
+    def get_variable_history(self, name, scope='locals', query='values', state=None, op='==', value=None):
+        return self.client.call('get_variable_history', name, scope, query, state, op, value)
+
+    def get_visualization_data(self, flowchart='cfg'):
+        return self.client.call('get_visualization_data', flowchart)
+
+    def get_usage(self):
+        return self.client.call('get_usage')
+
+
+class RemoteStream:
+    """StateStream counterpart whose cursor lives in the worker."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def events(self, is_current=lambda: True):
+        try:
+            stream_id = self.client.call('stream_open')
+        except WorkerError:
+            return
+        try:
+            yield from sse_events(
+                lambda timeout: self.client.call('stream_next', stream_id, timeout),
+                is_current
+            )
+        except WorkerError:
+            return
+        finally:
+            if self.client.alive:
+                try:
+                    self.client.call('stream_close', stream_id)
+                except WorkerError:
+                    pass
+
+
+def _context():
+    # forkserver forks workers from a small clean process (with this module
+    # preloaded) instead of from the threaded web server
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+class WorkerPool:
+    """Keeps `size` idle worker processes ready so sessions start quickly.
+
+    Each worker serves a single session and exits with it, so no state
+    carries over between sessions; the pool tops itself back up after
+    every acquire.
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self._ctx = None
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        self._workers = set()
+        atexit.register(self.shutdown)
+
+    def _spawn(self):
+        if self._ctx is None:
+            self._ctx = _context()
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=worker_main, args=(child_conn,), name='relive-worker'
+        )
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._workers.add(process)
+        return process, parent_conn
+
+    def prestart(self):
+        """Fill the pool up to size idle workers."""
+        if not self._fill_lock.acquire(blocking=False):
+            return  # another thread is already filling it
+        try:
+            while True:
+                with self._lock:
+                    self._idle = deque(w for w in self._idle if w[0].is_alive())
+                    if len(self._idle) >= self.size:
+                        return
+                worker = self._spawn()
+                with self._lock:
+                    self._idle.append(worker)
+        finally:
+            self._fill_lock.release()
+
+    def acquire(self):
+        """Hand out an idle worker (spawning one if none is ready)."""
+        worker = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate[0].is_alive():
+                    worker = candidate
+                    break
+        if worker is None:
+            worker = self._spawn()
+        threading.Thread(target=self.prestart, daemon=True).start()
+        process, conn = worker
+        return WorkerClient(process, conn)
+
+    def release(self, client):
+        client.close()
+        threading.Thread(target=self._reap, args=(client.process,), daemon=True).start()
+
+    def _reap(self, process):
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        with self._lock:
+            self._workers.discard(process)
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._idle.clear()
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join(1)
@@ -0,0 +1,91 @@
+import sys
+
+from src.breakpoints import BreakpointIndex, LineBreakpoint, Watchpoint, fingerprint
+
+
+def sample(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def unrelated():
+    return 1
+
+
+def first_line(function):
+    return function.__code__.co_firstlineno
+
+
+def make_index(breakpoints, watchpoints=()):
+    return BreakpointIndex({__file__: breakpoints}, lambda filename: filename, watchpoints)
+
+
+def test_index_finds_breakpoints_by_code_and_line():
+    line = first_line(sample) + 3
+    breakpoint = LineBreakpoint(line)
+    index = make_index({line: breakpoint})
+    code = sample.__code__
+
+    assert index[code, line] is breakpoint
+    assert index[code, line - 1] is None
+    # Filled a code object at a time, on first lookup
+    assert (code, first_line(sample) + 1) in index
+    assert index.has_breaks(code)
+    assert not index.has_breaks(unrelated.__code__)
+    assert index[unrelated.__code__, first_line(unrelated) + 1] is None
+
+
+def test_index_reset_picks_up_new_breakpoints():
+    line = first_line(unrelated) + 1
+    breakpoints = {}
+    index = make_index(breakpoints)
+    assert not index.has_breaks(unrelated.__code__)
+
+    breakpoints[line] = LineBreakpoint(line)
+    assert not index.has_breaks(unrelated.__code__)
+    index.reset()
+    assert index.has_breaks(unrelated.__code__)
+    assert index[unrelated.__code__, line] is breakpoints[line]
+
+
+def test_index_matches_watchpoints_by_the_names_code_uses():
+    watch = Watchpoint('total')
+    index = make_index({}, [watch])
+
+    assert index.watches(sample.__code__) == (watch,)
+    assert index.watches(unrelated.__code__) == ()
+    assert index.has_breaks(sample.__code__)
+    assert not index.has_breaks(unrelated.__code__)
+
+
+def test_condition_and_ignore_count():
+    frame = sys._getframe()
+    value = 1
+    breakpoint = LineBreakpoint(1, 'value > 0', ignore_count=2)
+
+    assert [breakpoint.hit(frame) for _ in range(3)] == [False, False, True]
+    value = 0
+    assert not breakpoint.hit(frame)
+    assert breakpoint.hits == 4
+    assert breakpoint.ignores_left == 0
+
+
+def test_logpoint_records_instead_of_stopping():
+    frame = sys._getframe()
+    i = 7
+    breakpoint = LineBreakpoint(1, log='i={i}')
+
+    assert not breakpoint.hit(frame)
+    assert breakpoint.get_data(messages=True)['messages'] == [[1, 'i=7']]
+
+
+def test_fingerprint_tells_values_apart():
+    assert fingerprint(-1.0) != fingerprint(-2.0)
+    nan = float('nan')
+    assert fingerprint(nan) == fingerprint(nan)
+    items = [1, 2]
+    before = fingerprint(items)
+    items[0] = 5
+    assert fingerprint(items) != before
@@ -0,0 +1,53 @@
+from src.checkpoint import CheckpointManager
+from src.debugger import WebDebugger
+
+
+class FakeCheckpoint:
+    """Stands in for a forked snapshot: records being discarded."""
+
+    def __init__(self, stop):
+        self.stop = stop
+        self.discarded = False
+
+    def discard(self):
+        self.discarded = True
+
+
+def make_manager(max_checkpoints):
+    return CheckpointManager(
+        WebDebugger(), handover=None, takeover=None, interval=10, max_checkpoints=max_checkpoints
+    )
+
+
+def test_thin_keeps_the_first_and_every_other_checkpoint():
+    manager = make_manager(max_checkpoints=4)
+    checkpoints = [FakeCheckpoint(stop) for stop in range(0, 50, 10)]
+    manager.checkpoints = list(checkpoints)
+
+    manager._thin()
+
+    assert [c.stop for c in manager.checkpoints] == [0, 20, 40]
+    assert [c.stop for c in checkpoints if c.discarded] == [10, 30]
+    assert manager.interval == 20
+
+
+def test_thin_leaves_checkpoints_within_the_limit():
+    manager = make_manager(max_checkpoints=4)
+    manager.checkpoints = [FakeCheckpoint(stop) for stop in range(0, 40, 10)]
+
+    manager._thin()
+
+    assert len(manager.checkpoints) == 4
+    assert manager.interval == 10
+
+
+def test_stops_map_saved_states_and_truncate_on_rewrite():
+    manager = make_manager(max_checkpoints=4)
+    manager.checkpoints = [FakeCheckpoint(0)]
+    for state_index in (0, None, 1, 2):
+        manager.on_stop(1, state_index)
+    assert list(manager.state_stops) == [0, 2, 3]
+
+    # A stop saving state 1 again (after going back) drops the later ones
+    manager.on_stop(1, 1)
+    assert list(manager.state_stops) == [0, 4]
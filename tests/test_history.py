@@ -0,0 +1,113 @@
+from src.history import SnapshotStore, VariableIndex, frame_key
+from src.utils import ProgramState
+from src.variables import capture_scope
+
+
+def make_state(line, local_values, output_end=0):
+    state = ProgramState()
+    state.variables = {'locals': capture_scope(local_values), 'globals': {}}
+    state.stack_frames = [{'function': 'f', 'line': line}]
+    state.current_line = line
+    state.output_end = output_end
+    return state
+
+
+def test_states_rebuild_from_keyframes_and_deltas():
+    store = SnapshotStore(keyframe_interval=4)
+    for i in range(10):
+        values = {'i': i, 'items': list(range(i % 3))}
+        if i % 2:
+            values['odd'] = i
+        store.append(make_state(i + 1, values, output_end=i * 5))
+
+    assert len(store) == 10
+    for i in range(10):
+        state = store[i]
+        assert state.current_line == i + 1
+        assert state.output_end == i * 5
+        assert state.variables['locals']['i']['preview'] == repr(i)
+        assert ('odd' in state.variables['locals']) == bool(i % 2)
+        assert state.stack_frames == [{'function': 'f', 'line': i + 1}]
+
+
+def test_eviction_drops_whole_segments_and_keeps_the_rest_exact():
+    store = SnapshotStore(max_bytes=40000, keyframe_interval=5)
+    for i in range(200):
+        store.append(make_state(i % 7, {'i': i, 'text': 'x' * (i % 50)}))
+
+    assert store.evicted > 0
+    assert store.evicted % 5 == 0
+    assert store.evicted + len(store) == 200
+    assert store.nbytes <= store.max_bytes
+    for index in (0, 1, 4, 5, len(store) - 1):
+        absolute = store.evicted + index
+        state = store[index]
+        assert state.current_line == absolute % 7
+        assert state.variables['locals']['i']['preview'] == repr(absolute)
+        assert state.variables['locals']['text']['preview'] == repr('x' * (absolute % 50))
+
+
+def test_variable_index_survives_eviction():
+    store = SnapshotStore(max_bytes=30000, keyframe_interval=5)
+    for i in range(150):
+        store.append(make_state(1, {'n': i // 10}))
+    index = store.variable_index
+    first = store.evicted
+    n = index.key('locals', 'n', frame_key(store[0].stack_frames))
+
+    # The write in effect at the first kept state is still known
+    state, text, _ = index.last_write(n, first)
+    assert state <= first
+    assert text == repr(first // 10)
+    assert index.changes(n, 0)[0][0] <= first
+    assert index.last_write(n, 149)[1] == '14'
+
+
+def test_first_match_equality_and_ordering():
+    index = VariableIndex()
+    values = [0, 5, 3, 5, 9, 2]
+    for state, value in enumerate(values):
+        index.record(state, {'locals': capture_scope({'x': value})})
+    x = index.key('locals', 'x')
+
+    # '==' looks up the per-value index
+    assert index.first_match(x, '==', '5') == 1
+    assert index.first_match(x, '==', 5, start=2) == 3
+    assert index.first_match(x, '==', '5', start=3) == 3
+    assert index.first_match(x, '==', '7') is None
+    # Ordering operators scan the writes from start on
+    assert index.first_match(x, '>', 4) == 1
+    assert index.first_match(x, '>', 5) == 4
+    assert index.first_match(x, '<', 3, start=1) == 5
+    assert index.first_match(x, '>=', 9, start=5) is None
+    assert index.first_match(index.key('locals', 'missing'), '==', 1) is None
+
+
+def test_variable_removal_is_logged():
+    index = VariableIndex()
+    index.record(0, {'locals': capture_scope({'x': 1})})
+    index.record(1, {'locals': capture_scope({})})
+    index.record(2, {'locals': capture_scope({'x': 2})})
+    x = index.key('locals', 'x')
+
+    assert [text for _, text, _ in index.changes(x)] == ['1', None, '2']
+    assert index.last_write(x, 1)[1] is None
+
+
+def test_calls_and_returns_do_not_rewrite_the_callers_locals():
+    index = VariableIndex()
+    main = ('<main>', 'main', 2)
+    helper = ('<main>', 'helper', 3)
+    index.record(0, {'locals': capture_scope({'total': 1}), 'globals': {}}, main)
+    index.record(1, {'locals': capture_scope({'total': 5}), 'globals': {}}, helper)
+    index.record(2, {'locals': capture_scope({'total': 1}), 'globals': {}}, main)
+    index.record(3, {'locals': capture_scope({'total': 2}), 'globals': {}}, main)
+
+    # Each function's total has its own history; the call is not a delete
+    assert [(state, text) for state, text, _ in index.changes(index.key('locals', 'total', main))] == [
+        (0, '1'), (3, '2')
+    ]
+    assert [(state, text) for state, text, _ in index.changes(index.key('locals', 'total', helper))] == [
+        (1, '5')
+    ]
+    assert index.last_write(index.key('locals', 'total', main), 2)[0] == 0
@@ -0,0 +1,32 @@
+import pytest
+
+from src.sessions import SessionLimitError, SessionManager
+
+CODE = "x = 1\ny = 2\nprint(x + y)\n"
+
+
+def test_closing_a_session_leaves_other_sessions_breakpoints_working():
+    sessions = SessionManager(isolation='thread')
+    first = sessions.create()
+    first.start(CODE)
+    first.debugger.set_break(first.filename, 2)
+    second = sessions.create()
+    second.start(CODE)
+    # The second debugger does not take over the first one's breakpoints
+    assert first.filename not in second.debugger.breaks
+
+    sessions.close(first.id)
+    for _ in range(2):
+        second.debugger.clear_all_breaks()
+        assert second.debugger.set_break(second.filename, 2) is None
+    assert list(second.debugger.get_all_breakpoints()[second.filename]) == [2]
+    assert sessions.close(second.id)
+
+
+def test_reserved_slots_count_toward_the_session_limit():
+    sessions = SessionManager(isolation='thread', max_sessions=1)
+    session = sessions.create()
+    with pytest.raises(SessionLimitError):
+        sessions.create()
+    sessions.close(session.id)
+    assert sessions._reserved == 0